@@ -1,55 +1,175 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from typing import List, Optional
 from datetime import datetime
-from utils import get_supabase_client
+from supabase_pool import get_supabase_pool, execute
+from admin_pagination import ListSpec, fetch_page, export_ndjson
+from utils import api_key_cache, invalidate_api_key
+from api_config import invalidate_api_config
+from quiz_cache import quiz_response_cache
+from quiz_service import inflight_generations
+from rate_limit import rate_limiter
+from write_behind import quiz_writer, usage_log_writer
+from quiz_storage import quiz_content_store
+from openrouter_keys import openrouter_key_pool
+from model_router import model_router
+from question_bank import question_bank
+from question_index import question_index
+import health
+import dashboard_stats
+import config
 from supabase import Client
 import logging
 from pydantic import BaseModel
 from uuid import UUID
-import time
-import requests
 import os
 
-# Set up logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
-# Dependency to get Supabase client
+# Dependency to get a pooled Supabase client
 async def get_db():
-    return get_supabase_client()
-
-# Get all users
+    async with get_supabase_pool().connection() as db:
+        yield db
+
+# Get Supabase pool metrics
+@router.get("/supabase-pool-stats")
+async def get_supabase_pool_stats():
+    return {"data": get_supabase_pool().stats(), "status": "success"}
+
+USERS = ListSpec(
+    'users', key='id', sort='created_at', user_key_column='api_key', date_column='created_at',
+    default_fields=['id', 'user_id', 'email', 'username', 'tier', 'api_key', 'created_at', 'updated_at', 'is_active'],
+    allowed_fields=['id', 'user_id', 'email', 'username', 'tier', 'api_key', 'created_at', 'updated_at', 'is_active'],
+)
+API_KEYS = ListSpec(
+    'user_api_keys', key='id', desc=False, user_key_column='user_api_key',
+    default_fields=['user_api_key', 'user_type', 'status', 'user_id'],
+    allowed_fields=['id', 'user_api_key', 'user_type', 'status', 'user_id'],
+)
+GENERATED_QUIZZES = ListSpec(
+    'generated_quizzes', key='id', sort='generated_at', user_key_column='user_api_key', date_column='generated_at',
+    default_fields=['id', 'user_api_key', 'generated_at', 'quiz_content'],
+    allowed_fields=['id', 'user_api_key', 'generated_at', 'quiz_content', 'prompt_hash', 'model_name'],
+    content_store=quiz_content_store,
+)
+
+def _ndjson(spec: ListSpec, name: str, fields: Optional[str], **filters) -> StreamingResponse:
+    return StreamingResponse(
+        export_ndjson(spec, fields, **filters),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{name}.ndjson"'},
+    )
+
+# Get users, newest first, a page at a time (pass next_cursor back as cursor)
 @router.get("/users")
-async def get_users(db: Client = Depends(get_db)):
+async def get_users(
+    db: Client = Depends(get_db),
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user_api_key: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
     try:
-        logger.info("Fetching users from database")
-        response = db.table('users').select('id, user_id, email, username, tier, api_key, created_at, updated_at, is_active').execute()
-        logger.info(f"Found {len(response.data)} users")
-        return {
-            "data": response.data,
-            "status": "success"
-        }
+        logger.info(f"Fetching users from database (limit: {limit})")
+        page = await fetch_page(db, USERS, fields, limit, cursor,
+                                user_api_key=user_api_key, date_from=date_from, date_to=date_to)
+        logger.info(f"Found {len(page['data'])} users")
+        return {**page, "status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching users: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch users: {str(e)}")
 
-# Get all API keys
+# Export every matching user as NDJSON
+@router.get("/users/export")
+async def export_users(
+    fields: Optional[str] = None,
+    user_api_key: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    return _ndjson(USERS, "users", fields, user_api_key=user_api_key, date_from=date_from, date_to=date_to)
+
+# Get API keys a page at a time
 @router.get("/api-keys")
-async def get_api_keys(db: Client = Depends(get_db)):
+async def get_api_keys(
+    db: Client = Depends(get_db),
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user_api_key: Optional[str] = None
+):
     try:
-        logger.info("Fetching API keys from database")
-        response = db.table('user_api_keys').select('user_api_key, user_type, status, user_id').execute()
-        logger.info(f"Found {len(response.data)} API keys")
-        return {
-            "data": response.data,
-            "status": "success"
-        }
+        logger.info(f"Fetching API keys from database (limit: {limit})")
+        page = await fetch_page(db, API_KEYS, fields, limit, cursor, user_api_key=user_api_key)
+        logger.info(f"Found {len(page['data'])} API keys")
+        return {**page, "status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching API keys: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch API keys: {str(e)}")
 
+# Export every matching API key as NDJSON
+@router.get("/api-keys/export")
+async def export_api_keys(fields: Optional[str] = None, user_api_key: Optional[str] = None):
+    return _ndjson(API_KEYS, "api_keys", fields, user_api_key=user_api_key)
+
+class ApiKeyUpdate(BaseModel):
+    user_type: Optional[str] = None
+    status: Optional[str] = None
+
+# Update a user API key's tier or status
+@router.put("/api-keys/{user_api_key}")
+async def update_api_key(user_api_key: str, key: ApiKeyUpdate, db: Client = Depends(get_db)):
+    updates = key.model_dump(exclude_none=True)
+    if not updates:
+        raise HTTPException(status_code=400, detail="Nothing to update")
+    try:
+        logger.info("Updating user API key")
+        response = await execute(db.table('user_api_keys').update(updates).eq('user_api_key', user_api_key))
+        await invalidate_api_key(user_api_key)
+        return {"data": response.data, "status": "success"}
+    except Exception as e:
+        logger.error(f"Error updating API key: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to update API key: {str(e)}")
+
+# Drop cached API key lookups in every worker (e.g. after editing keys directly in Supabase)
+@router.delete("/cache/api-keys")
+async def clear_api_key_cache(user_api_key: Optional[str] = None):
+    await invalidate_api_key(user_api_key)
+    return {"status": "success"}
+
+# Get in-process cache statistics for the worker serving this request
+@router.get("/cache-stats")
+async def get_cache_stats():
+    return {
+        "data": {
+            "worker_pid": os.getpid(),
+            "api_keys": api_key_cache.stats(),
+            "quiz_responses": quiz_response_cache.stats(),
+            "inflight_generations": inflight_generations.stats(),
+            "rate_limiter": rate_limiter.stats(),
+            "write_behind": {
+                "generated_quizzes": quiz_writer.stats(),
+                "usage_logs": usage_log_writer.stats()
+            },
+            "quiz_storage": quiz_content_store.stats(),
+            "dashboard_stats": dashboard_stats.stats()
+        },
+        "status": "success"
+    }
+
+# Get per-key load balancing counters and circuit state for this worker
+@router.get("/openrouter-keys/stats")
+async def get_openrouter_key_stats():
+    return {"data": {"worker_pid": os.getpid(), **openrouter_key_pool.stats()}, "status": "success"}
+
 # Get all OpenRouter API keys
 @router.get("/openrouter-keys")
 async def get_openrouter_keys(db: Client = Depends(get_db)):
@@ -65,6 +185,73 @@ async def get_openrouter_keys(db: Client = Depends(get_db)):
         logger.error(f"Error fetching OpenRouter API keys: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch OpenRouter API keys: {str(e)}")
 
+# Get model routing counters and latency percentiles for this worker
+@router.get("/model-router/stats")
+async def get_model_router_stats():
+    return {"data": {"worker_pid": os.getpid(), **model_router.stats()}, "status": "success"}
+
+# Get question bank hit/miss counters and the last warm pass for this worker
+@router.get("/question-bank/stats")
+async def get_question_bank_stats():
+    return {"data": {"worker_pid": os.getpid(), "enabled": config.QUESTION_BANK_ENABLED, **question_bank.stats()},
+            "status": "success"}
+
+# Get the most requested question bank pools with their size and target
+@router.get("/question-bank/pools")
+async def get_question_bank_pools(limit: int = 50, db: Client = Depends(get_db)):
+    if not 1 <= limit <= config.ADMIN_PAGE_MAX_LIMIT:
+        raise HTTPException(status_code=400, detail=f"limit must be between 1 and {config.ADMIN_PAGE_MAX_LIMIT}")
+    try:
+        query = db.table('question_bank_pools')\
+            .select('pool_key, params, requests, size, target_size, last_requested_at, last_warmed_at')\
+            .order('requests', desc=True).limit(limit)
+        return {"data": (await execute(query)).data, "status": "success"}
+    except Exception as e:
+        logger.error(f"Error fetching question bank pools: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch question bank pools: {str(e)}")
+
+# Start a warm pass now, outside the off-peak window
+@router.post("/question-bank/warm")
+async def warm_question_bank():
+    if not config.QUESTION_BANK_ENABLED:
+        raise HTTPException(status_code=400, detail="Question bank is disabled (QUESTION_BANK_ENABLED)")
+    started = question_bank.warm_in_background()
+    return {"data": {"started": started, "worker_pid": os.getpid()}, "status": "success"}
+
+def _require_question_index():
+    if not config.QUESTION_INDEX_ENABLED:
+        raise HTTPException(status_code=400, detail="Question index is disabled (QUESTION_INDEX_ENABLED)")
+    if not question_index.ready:
+        raise HTTPException(status_code=503, detail="Question index is still being built")
+
+def _check_threshold(threshold: Optional[float]):
+    if threshold is not None and not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="threshold must be in (0, 1]")
+
+# Get the size of this worker's near-duplicate question index
+@router.get("/question-index/stats")
+async def get_question_index_stats():
+    return {"data": {"worker_pid": os.getpid(), "enabled": config.QUESTION_INDEX_ENABLED, **question_index.stats()},
+            "status": "success"}
+
+# Find stored questions similar to a stem (default threshold: QUIZ_DEDUP_THRESHOLD)
+@router.get("/question-index/similar")
+async def get_similar_questions(stem: str, threshold: Optional[float] = None, limit: int = 10):
+    _require_question_index()
+    _check_threshold(threshold)
+    if not 1 <= limit <= 100:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 100")
+    return {"data": question_index.similar(stem, threshold, limit), "status": "success"}
+
+# Near-duplicate clusters over every indexed question, largest first
+@router.get("/question-index/report")
+async def get_duplicate_report(threshold: Optional[float] = None, limit: int = 50, refresh: bool = False):
+    _require_question_index()
+    _check_threshold(threshold)
+    if not 1 <= limit <= 1000:
+        raise HTTPException(status_code=400, detail="limit must be between 1 and 1000")
+    return {"data": await question_index.report(threshold, limit, refresh), "status": "success"}
+
 # Get all API models
 @router.get("/api-models")
 async def get_api_models(db: Client = Depends(get_db)):
@@ -80,59 +267,87 @@ async def get_api_models(db: Client = Depends(get_db)):
         logger.error(f"Error fetching API models: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch API models: {str(e)}")
 
-# Get all generated quizzes
+# Get generated quizzes, newest first, a page at a time
+# (fields=id,user_api_key,generated_at leaves out the quiz_content blobs)
 @router.get("/generated-quizzes")
-async def get_generated_quizzes(db: Client = Depends(get_db)):
+async def get_generated_quizzes(
+    db: Client = Depends(get_db),
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    user_api_key: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
     try:
-        logger.info("Fetching generated quizzes from database")
-        response = db.table('generated_quizzes').select('id, user_api_key, generated_at, quiz_content').execute()
-        logger.info(f"Found {len(response.data)} generated quizzes")
-        return {
-            "data": response.data,
-            "status": "success"
-        }
+        logger.info(f"Fetching generated quizzes from database (limit: {limit})")
+        page = await fetch_page(db, GENERATED_QUIZZES, fields, limit, cursor,
+                                user_api_key=user_api_key, date_from=date_from, date_to=date_to)
+        logger.info(f"Found {len(page['data'])} generated quizzes")
+        return {**page, "status": "success"}
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error fetching generated quizzes: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch generated quizzes: {str(e)}")
 
-# Get dashboard statistics
+# Export every matching generated quiz as NDJSON
+@router.get("/generated-quizzes/export")
+async def export_generated_quizzes(
+    fields: Optional[str] = None,
+    user_api_key: Optional[str] = None,
+    date_from: Optional[datetime] = None,
+    date_to: Optional[datetime] = None
+):
+    return _ndjson(GENERATED_QUIZZES, "generated_quizzes", fields,
+                   user_api_key=user_api_key, date_from=date_from, date_to=date_to)
+
+# Get one generated quiz, including its content
+@router.get("/generated-quizzes/{id}")
+async def get_generated_quiz(id: str, db: Client = Depends(get_db)):
+    try:
+        response = await execute(
+            db.table('generated_quizzes').select(GENERATED_QUIZZES.columns(None)).eq('id', id).limit(1)
+        )
+        rows = await GENERATED_QUIZZES.expand(response.data)
+    except Exception as e:
+        logger.error(f"Error fetching generated quiz {id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch generated quiz: {str(e)}")
+    if not rows:
+        raise HTTPException(status_code=404, detail="Generated quiz not found")
+    return {"data": rows[0], "status": "success"}
+
+# Get dashboard statistics (counted concurrently, cached for DASHBOARD_STATS_TTL seconds)
 @router.get("/dashboard-stats")
-async def get_dashboard_stats(db: Client = Depends(get_db)):
+async def get_dashboard_stats(mode: Optional[str] = None, refresh: bool = False):
+    if mode is not None and mode not in dashboard_stats.COUNT_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of: {', '.join(dashboard_stats.COUNT_MODES)}")
     try:
         logger.info("Fetching dashboard statistics")
-        # Get total users count
-        users_response = db.table('users').select('id', count='exact').execute()
-        total_users = users_response.count if users_response.count is not None else 0
-        logger.info(f"Total users: {total_users}")
-
-        # Get active API keys count
-        api_keys_response = db.table('user_api_keys').select('id', count='exact').eq('status', 'active').execute()
-        active_api_keys = api_keys_response.count if api_keys_response.count is not None else 0
-        logger.info(f"Active API keys: {active_api_keys}")
-
-        # Get total quizzes generated
-        quizzes_response = db.table('generated_quizzes').select('id', count='exact').execute()
-        total_quizzes = quizzes_response.count if quizzes_response.count is not None else 0
-        logger.info(f"Total quizzes: {total_quizzes}")
-
-        # Get total OpenRouter keys
-        openrouter_keys_response = db.table('openrouter_api_keys').select('id', count='exact').execute()
-        total_openrouter_keys = openrouter_keys_response.count if openrouter_keys_response.count is not None else 0
-        logger.info(f"Total OpenRouter keys: {total_openrouter_keys}")
-
+        counts = await dashboard_stats.get_counts(mode, refresh)
+        logger.info(f"Dashboard statistics: {counts}")
         return {
-            "data": {
-                "total_users": total_users,
-                "active_api_keys": active_api_keys,
-                "total_quizzes": total_quizzes,
-                "total_openrouter_keys": total_openrouter_keys
-            },
+            "data": counts,
             "status": "success"
         }
     except Exception as e:
         logger.error(f"Error fetching dashboard statistics: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to fetch dashboard statistics: {str(e)}")
 
+# Get quizzes per day, tier and model from the daily rollup (migrations/004_dashboard_rollups.sql)
+@router.get("/dashboard-stats/rollup")
+async def get_dashboard_rollup(days: int = 30, refresh: bool = False):
+    if not 1 <= days <= 366:
+        raise HTTPException(status_code=400, detail="days must be between 1 and 366")
+    try:
+        return {
+            "data": await dashboard_stats.get_rollup(days, refresh),
+            "status": "success"
+        }
+    except Exception as e:
+        logger.error(f"Error fetching dashboard rollup: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Failed to fetch dashboard rollup: {str(e)}")
+
 # Get usage logs
 @router.get("/usage-logs")
 async def get_usage_logs(
@@ -195,6 +410,7 @@ async def create_usage_limit(limit: UsageLimitCreate, db: Client = Depends(get_d
             "max_monthly_limit": limit.max_monthly_limit,
             "price": limit.price
         }).execute()
+        await invalidate_api_config()
         return {"data": response.data, "status": "success"}
     except Exception as e:
         logger.error(f"Error creating usage limit: {str(e)}")
@@ -212,6 +428,7 @@ async def update_usage_limit(id: UUID, limit: UsageLimitUpdate, db: Client = Dep
             "price": limit.price,
             "updated_at": "now()"
         }).eq('id', str(id)).execute()
+        await invalidate_api_config()
         return {"data": response.data, "status": "success"}
     except Exception as e:
         logger.error(f"Error updating usage limit: {str(e)}")
@@ -223,6 +440,7 @@ async def delete_usage_limit(id: UUID, db: Client = Depends(get_db)):
     try:
         logger.info(f"Deleting usage limit {id}")
         response = db.table('usage_limits').delete().eq('id', str(id)).execute()
+        await invalidate_api_config()
         return {"data": response.data, "status": "success"}
     except Exception as e:
         logger.error(f"Error deleting usage limit: {str(e)}")
@@ -258,6 +476,7 @@ async def create_api_model(model: ApiModelCreate, db: Client = Depends(get_db)):
             "description": model.description,
             "is_default": model.is_default
         }).execute()
+        await invalidate_api_config()
         return {"data": response.data, "status": "success"}
     except Exception as e:
         logger.error(f"Error creating API model: {str(e)}")
@@ -272,6 +491,7 @@ async def update_api_model(id: UUID, model: ApiModelUpdate, db: Client = Depends
             "description": model.description,
             "is_default": model.is_default
         }).eq('id', str(id)).execute()
+        await invalidate_api_config()
         return {"data": response.data, "status": "success"}
     except Exception as e:
         logger.error(f"Error updating API model: {str(e)}")
@@ -282,6 +502,7 @@ async def delete_api_model(id: UUID, db: Client = Depends(get_db)):
     try:
         logger.info(f"Deleting API model {id}")
         response = db.table('models').delete().eq('id', str(id)).execute()
+        await invalidate_api_config()
         return {"data": response.data, "status": "success"}
     except Exception as e:
         logger.error(f"Error deleting API model: {str(e)}")
@@ -297,6 +518,7 @@ async def create_openrouter_key(key: OpenRouterKeyCreate, db: Client = Depends(g
             "description": key.description,
             "is_default": key.is_default
         }).execute()
+        await invalidate_api_config()
         return {"data": response.data, "status": "success"}
     except Exception as e:
         logger.error(f"Error creating OpenRouter API key: {str(e)}")
@@ -311,6 +533,7 @@ async def update_openrouter_key(id: UUID, key: OpenRouterKeyUpdate, db: Client =
             "description": key.description,
             "is_default": key.is_default
         }).eq('id', str(id)).execute()
+        await invalidate_api_config()
         return {"data": response.data, "status": "success"}
     except Exception as e:
         logger.error(f"Error updating OpenRouter API key: {str(e)}")
@@ -321,87 +544,28 @@ async def delete_openrouter_key(id: UUID, db: Client = Depends(get_db)):
     try:
         logger.info(f"Deleting OpenRouter API key {id}")
         response = db.table('openrouter_api_keys').delete().eq('id', str(id)).execute()
+        await invalidate_api_config()
         return {"data": response.data, "status": "success"}
     except Exception as e:
         logger.error(f"Error deleting OpenRouter API key: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Failed to delete OpenRouter API key: {str(e)}")
 
 @router.get("/system-health")
-async def system_health(db: Client = Depends(get_db)):
-    health = {}
-    # Database check
-    db_start = time.monotonic()
-    try:
-        db.table('users').select('id').limit(1).execute()
-        db_latency = (time.monotonic() - db_start) * 1000
-        health['database'] = {'status': 'ok', 'latency_ms': round(db_latency, 2)}
-    except Exception as e:
-        db_latency = (time.monotonic() - db_start) * 1000
-        health['database'] = {'status': 'error', 'latency_ms': round(db_latency, 2), 'error': str(e)}
-    # OpenRouter API check
-    or_start = time.monotonic()
-    try:
-        resp = requests.get('https://openrouter.ai/api/v1/models', timeout=5)
-        or_latency = (time.monotonic() - or_start) * 1000
-        if resp.status_code == 200:
-            health['openrouter'] = {'status': 'ok', 'latency_ms': round(or_latency, 2)}
-        else:
-            health['openrouter'] = {'status': 'error', 'latency_ms': round(or_latency, 2), 'error': f'Status {resp.status_code}'}
-    except Exception as e:
-        or_latency = (time.monotonic() - or_start) * 1000
-        health['openrouter'] = {'status': 'error', 'latency_ms': round(or_latency, 2), 'error': str(e)}
-    return {'data': health, 'status': 'success'}
+async def system_health(refresh: bool = False):
+    return {'data': await health.system_health(refresh), 'status': 'success'}
 
 @router.get("/db-tables-health")
-async def db_tables_health(db: Client = Depends(get_db)):
-    health = []
-    # Use a hardcoded list of known table names for safety
-    table_names = [
-        'users', 'user_api_keys', 'openrouter_api_keys', 'models', 'generated_quizzes', 'usage_limits', 'usage_logs'
-    ]
-    for table in table_names:
-        start = time.monotonic()
-        try:
-            db.table(table).select('id').limit(1).execute()
-            latency = (time.monotonic() - start) * 1000
-            health.append({"table": table, "status": "ok", "latency_ms": round(latency, 2)})
-        except Exception as e:
-            latency = (time.monotonic() - start) * 1000
-            health.append({"table": table, "status": "error", "latency_ms": round(latency, 2), "error": str(e)})
-    return {"data": health, "status": "success"}
+async def db_tables_health(refresh: bool = False):
+    return {"data": await health.tables_health(refresh), "status": "success"}
 
 @router.get("/openrouter-prompts-health")
-async def openrouter_prompts_health(db: Client = Depends(get_db)):
-    prompts = {
-        "easy": "What is 2+2?",
-        "medium": "Explain the process of photosynthesis in a paragraph.",
-        "hard": "Write a Python function to compute the nth Fibonacci number recursively and explain its time complexity.",
-        "extreme": "Generate a detailed, step-by-step solution to a complex calculus problem involving integration by parts, and provide a LaTeX-formatted answer."
-    }
-    # Fetch API key from database
+async def openrouter_prompts_health(refresh: bool = False):
     try:
-        key_resp = db.table('openrouter_api_keys').select('api_key, is_default').order('is_default', desc=True).limit(1).execute()
-        if not key_resp.data or not key_resp.data[0].get('api_key'):
-            return {"status": "error", "error": "No OpenRouter API key found in database."}
-        api_key = key_resp.data[0]['api_key']
+        return {"data": await health.prompts_health(refresh), "status": "success"}
     except Exception as e:
-        return {"status": "error", "error": f"Failed to fetch OpenRouter API key: {str(e)}"}
-    results = []
-    for level, prompt in prompts.items():
-        try:
-            start = time.monotonic()
-            resp = requests.post(
-                'https://openrouter.ai/api/v1/chat/completions',
-                json={"model": "openai/gpt-3.5-turbo", "messages": [{"role": "user", "content": prompt}]},
-                headers={"Authorization": f"Bearer {api_key}"},
-                timeout=15
-            )
-            latency = (time.monotonic() - start) * 1000
-            if resp.status_code == 200:
-                results.append({"level": level, "status": "ok", "latency_ms": round(latency, 2), "prompt": prompt})
-            else:
-                results.append({"level": level, "status": "error", "latency_ms": round(latency, 2), "prompt": prompt, "error": f"Status {resp.status_code}: {resp.text}"})
-        except Exception as e:
-            latency = (time.monotonic() - start) * 1000
-            results.append({"level": level, "status": "error", "latency_ms": round(latency, 2), "prompt": prompt, "error": str(e)})
-    return {"data": results, "status": "success"}
+        return {"status": "error", "error": str(e)}
+
+# Latency percentiles and errors per probe, from the background prober and on-demand checks
+@router.get("/health-history")
+async def health_history():
+    return {"data": health.history(), "status": "success"}
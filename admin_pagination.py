@@ -0,0 +1,156 @@
+# Keyset pagination, field projection and NDJSON export for admin list endpoints
+import base64
+from datetime import datetime
+from typing import List, Optional
+import orjson
+from fastapi import HTTPException
+from supabase_pool import execute, get_supabase_pool
+import config
+
+class ListSpec:
+    """How one admin table is listed.
+
+    Rows are ordered by (`sort`, `key`) and paged with a keyset cursor on
+    those two columns, so page N costs the same as page 1. `key` must be
+    unique; `sort` may be None to page on `key` alone. `content_store`
+    (see quiz_storage.QuizContentStore) adds the columns it needs and
+    restores compactly stored content on every page.
+    """
+
+    def __init__(self, table: str, key: str, default_fields: List[str], allowed_fields: List[str],
+                 sort: Optional[str] = None, desc: bool = True,
+                 user_key_column: Optional[str] = None, date_column: Optional[str] = None,
+                 content_store=None):
+        self.table = table
+        self.content_store = content_store
+        self.key = key
+        self.sort = sort
+        self.desc = desc
+        self.default_fields = default_fields
+        self.allowed_fields = frozenset(allowed_fields)
+        self.user_key_column = user_key_column
+        self.date_column = date_column
+
+    def columns(self, fields: Optional[str]) -> str:
+        if fields:
+            requested = [name.strip() for name in fields.split(",") if name.strip()]
+            unknown = [name for name in requested if name not in self.allowed_fields]
+            if unknown:
+                raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+        else:
+            requested = list(self.default_fields)
+        # The cursor columns are always returned
+        for column in (self.sort, self.key):
+            if column and column not in requested:
+                requested.append(column)
+        if self.content_store is not None:
+            requested = self.content_store.columns(requested)
+        return ", ".join(requested)
+
+    async def expand(self, rows: List[dict]) -> List[dict]:
+        if self.content_store is None:
+            return rows
+        return await self.content_store.expand(rows)
+
+    def check_filters(self, user_api_key: Optional[str] = None, date_from: Optional[datetime] = None,
+                      date_to: Optional[datetime] = None):
+        if user_api_key is not None and not self.user_key_column:
+            raise HTTPException(status_code=400, detail=f"{self.table} cannot be filtered by user key")
+        if (date_from is not None or date_to is not None) and not self.date_column:
+            raise HTTPException(status_code=400, detail=f"{self.table} cannot be filtered by date")
+
+    def cursor_values(self, row: dict) -> list:
+        return [row.get(self.sort), row[self.key]] if self.sort else [row[self.key]]
+
+    def cursor_of(self, row: dict) -> str:
+        return base64.urlsafe_b64encode(orjson.dumps(self.cursor_values(row))).decode().rstrip("=")
+
+    def decode_cursor(self, cursor: str) -> list:
+        try:
+            value = orjson.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        except ValueError:
+            value = None
+        if not isinstance(value, list) or len(value) != (2 if self.sort else 1):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        return value
+
+def _quote(value) -> str:
+    # Double-quoted PostgREST value so timestamps, commas and dots survive the filter syntax
+    return '"' + str(value).replace("\\", "\\\\").replace('"', '\\"') + '"'
+
+def _after(query, spec: ListSpec, cursor: list):
+    lt = "lt" if spec.desc else "gt"
+    if not spec.sort:
+        return query.filter(spec.key, lt, cursor[0])
+    sort_value, key_value = cursor
+    if sort_value is None:
+        # NULL sort values come last (nullslast): only the key decides within them
+        return query.is_(spec.sort, "null").filter(spec.key, lt, key_value)
+    # (sort, key) < (sort_value, key_value). postgrest-py 0.13 has no .or_(),
+    # so the logic-tree parameter is added to the query string directly.
+    query.params = query.params.add(
+        "or",
+        f"({spec.sort}.{lt}.{_quote(sort_value)},"
+        f"and({spec.sort}.eq.{_quote(sort_value)},{spec.key}.{lt}.{_quote(key_value)}),"
+        f"{spec.sort}.is.null)",
+    )
+    return query
+
+def build_page_query(db, spec: ListSpec, columns: str, limit: int, cursor: Optional[list] = None,
+                     user_api_key: Optional[str] = None, date_from: Optional[datetime] = None,
+                     date_to: Optional[datetime] = None):
+    """One page of `spec.table`: `limit + 1` rows so the caller knows whether another page exists."""
+    spec.check_filters(user_api_key, date_from, date_to)
+    query = db.table(spec.table).select(columns)
+    if user_api_key is not None:
+        query = query.eq(spec.user_key_column, user_api_key)
+    if date_from is not None:
+        query = query.gte(spec.date_column, date_from.isoformat())
+    if date_to is not None:
+        query = query.lt(spec.date_column, date_to.isoformat())
+    if cursor is not None:
+        query = _after(query, spec, cursor)
+    # One order parameter for both columns; .order() cannot ask for nullslast
+    direction = ".desc" if spec.desc else ""
+    order = f"{spec.key}{direction}"
+    if spec.sort:
+        order = f"{spec.sort}{direction}.nullslast,{order}"
+    query.params = query.params.add("order", order)
+    return query.limit(limit + 1)
+
+async def fetch_page(db, spec: ListSpec, fields: Optional[str], limit: int, cursor: Optional[str],
+                     **filters) -> dict:
+    """Return `{"data", "next_cursor"}` for one page; `next_cursor` is None on the last page."""
+    limit = max(1, min(limit, config.ADMIN_PAGE_MAX_LIMIT))
+    query = build_page_query(
+        db, spec, spec.columns(fields), limit,
+        spec.decode_cursor(cursor) if cursor else None, **filters,
+    )
+    rows = (await execute(query)).data
+    next_cursor = spec.cursor_of(rows[limit - 1]) if len(rows) > limit else None
+    return {"data": await spec.expand(rows[:limit]), "next_cursor": next_cursor}
+
+def export_ndjson(spec: ListSpec, fields: Optional[str], **filters):
+    """Return an async iterator of every matching row as one JSON line, a page at a time.
+
+    Bad fields or filters raise here, before the response has started. Each
+    page checks a client out of the pool only for its own query, so a slow
+    reader does not hold a connection and memory stays at one page.
+    """
+    columns = spec.columns(fields)
+    spec.check_filters(**filters)
+    page_size = config.ADMIN_EXPORT_PAGE_SIZE
+
+    async def lines():
+        cursor = None
+        while True:
+            async with get_supabase_pool().connection() as db:
+                rows = (await execute(build_page_query(db, spec, columns, page_size, cursor, **filters))).data
+            page = rows[:page_size]
+            if page:
+                yield b"".join(orjson.dumps(row) + b"\n" for row in await spec.expand(page))
+            if len(rows) <= page_size:
+                return
+            cursor = spec.cursor_values(page[-1])
+
+    return lines()
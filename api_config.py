@@ -0,0 +1,102 @@
+# Cached model / OpenRouter key / tier limit configuration
+import asyncio
+import logging
+import time
+from typing import Optional
+from supabase_pool import get_supabase_pool, execute
+from openrouter_keys import openrouter_key_pool
+import config
+import invalidation
+
+logger = logging.getLogger(__name__)
+
+API_CONFIG_CHANNEL = "api_config"
+
+class ApiConfigSnapshot:
+    def __init__(self, model: str, openrouter_api_key: Optional[str], usage_limits: Optional[dict] = None,
+                 openrouter_api_keys: Optional[list] = None, models: Optional[list] = None):
+        self.model = model
+        self.openrouter_api_key = openrouter_api_key
+        # Every row of 'openrouter_api_keys'; calls are spread over all of them
+        self.openrouter_api_keys = openrouter_api_keys or []
+        # Every row of 'models', for the model router
+        self.models = models or []
+        # tier_name -> {'max_daily_limit', 'max_monthly_limit'} from 'usage_limits'
+        self.usage_limits = usage_limits or {}
+        self.loaded_at = time.time()
+
+_snapshot: Optional[ApiConfigSnapshot] = None
+_reload_lock = asyncio.Lock()
+_refresh_task: Optional[asyncio.Task] = None
+
+async def _query_api_config() -> ApiConfigSnapshot:
+    async with get_supabase_pool().connection() as supabase:
+        # Query the 'models' table for all models (the default one first)
+        model_response = await execute(supabase.table('models').select('*').order('is_default', desc=True))
+        # Query the 'openrouter_api_keys' table for all keys (the default one first)
+        api_key_response = await execute(supabase.table('openrouter_api_keys').select('*').order('is_default', desc=True))
+        # Query the 'usage_limits' table for per-tier quotas
+        limits_response = await execute(supabase.table('usage_limits').select('tier_name, max_daily_limit, max_monthly_limit'))
+
+    models = [row for row in model_response.data or [] if row.get('model_name')]
+    model = next((row['model_name'] for row in models if row.get('is_default')), 'gpt-3.5-turbo') # Default model if none found
+    api_keys = [row for row in api_key_response.data or [] if row.get('api_key')]
+    openrouter_api_key = next((row['api_key'] for row in api_keys if row.get('is_default')), None)
+
+    if not openrouter_api_key:
+        logger.warning("No default OpenRouter API key found in database.")
+
+    usage_limits = {row['tier_name']: row for row in limits_response.data or []}
+
+    return ApiConfigSnapshot(model, openrouter_api_key, usage_limits, api_keys, models)
+
+async def reload_api_config() -> ApiConfigSnapshot:
+    global _snapshot
+    async with _reload_lock:
+        _snapshot = await _query_api_config()
+        openrouter_key_pool.update(_snapshot.openrouter_api_keys)
+        logger.info(f"Loaded API config snapshot (model: {_snapshot.model})")
+        return _snapshot
+
+async def get_api_config() -> ApiConfigSnapshot:
+    # Served from memory; only the very first call in a worker without a
+    # loaded snapshot (e.g. outside the app lifespan) touches the database.
+    if _snapshot is None:
+        return await reload_api_config()
+    return _snapshot
+
+async def _reload_quietly():
+    try:
+        await reload_api_config()
+    except Exception as e:
+        logger.error(f"Failed to refresh API config: {str(e)}")
+
+def _on_invalidate(_key):
+    asyncio.get_running_loop().create_task(_reload_quietly())
+
+invalidation.subscribe(API_CONFIG_CHANNEL, _on_invalidate)
+
+async def invalidate_api_config():
+    # Reload the snapshot now in this worker and soon in the others
+    await invalidation.publish(API_CONFIG_CHANNEL)
+
+async def _refresh_loop(interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        await _reload_quietly()
+
+async def start_api_config_refresh():
+    global _refresh_task
+    await _reload_quietly()
+    if _refresh_task is None:
+        _refresh_task = asyncio.create_task(_refresh_loop(config.API_CONFIG_REFRESH_INTERVAL))
+
+async def stop_api_config_refresh():
+    global _refresh_task
+    if _refresh_task is not None:
+        _refresh_task.cancel()
+        try:
+            await _refresh_task
+        except asyncio.CancelledError:
+            pass
+        _refresh_task = None
@@ -1,19 +1,67 @@
-from fastapi import FastAPI, Request, HTTPException
+import logging
+from tracing import LOG_FORMAT, RequestTracingMiddleware
+# Configured before the other imports so every module logs with the request's trace ID
+logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+from fastapi import FastAPI, Request, Response, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from dotenv import load_dotenv
 import os
 import json
-from utils import verify_api_key
+from contextlib import asynccontextmanager
 from prompt_selector import select_and_customize_prompt
-from utils import fetch_api_config, call_openrouter_api, save_generated_quiz
+from quiz_params import parse_quiz_params
+from utils import fetch_api_config, save_generated_quiz, save_generated_quizzes, build_quiz_record
+from quiz_service import (
+    verify_user, run_quiz_pipeline, stream_quiz_questions, stream_document_questions, needs_document_split,
+    generate_quiz_batch, log_quiz_usage, route_models, question_type_of, QuizResult, QuizGenerationError
+)
+import time
+import config
 from admin_crud import router as admin_router
+from openrouter_client import init_openrouter_client, close_openrouter_client
+from supabase_pool import init_supabase_pool, close_supabase_pool
+from invalidation import start_invalidation_listener, stop_invalidation_listener
+from api_config import start_api_config_refresh, stop_api_config_refresh
+from jobs import get_job_queue, start_job_workers, stop_job_workers, job_view, check_callback_url
+from rate_limit import rate_limiter
+from write_behind import start_writers, stop_writers
+from health import start_health_prober, stop_health_prober
+from question_bank import start_question_bank, stop_question_bank
+from question_index import start_question_index, stop_question_index
+import metrics
 
 # Load environment variables
 load_dotenv()
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared OpenRouter and Supabase connection pools, reused by every request in this worker
+    await init_openrouter_client()
+    await init_supabase_pool()
+    start_invalidation_listener()
+    await start_api_config_refresh()
+    start_writers()
+    await start_job_workers()
+    start_health_prober()
+    start_question_bank()
+    start_question_index()
+    yield
+    await stop_question_index()
+    await stop_question_bank()
+    await stop_health_prober()
+    await stop_job_workers()
+    await stop_writers()
+    await stop_api_config_refresh()
+    await stop_invalidation_listener()
+    await close_supabase_pool()
+    await close_openrouter_client()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 origins = [
@@ -31,6 +79,8 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Outermost: trace ID and HTTP metrics cover CORS handling too
+app.add_middleware(RequestTracingMiddleware)
 
 # Models
 class QuizRequest(BaseModel):
@@ -59,63 +109,216 @@ class ErrorResponse(BaseModel):
 # Include the admin router
 app.include_router(admin_router)
 
-@app.post("/generate-quiz")
-async def generate_quiz(request: Request):
+@app.exception_handler(QuizGenerationError)
+async def quiz_generation_error_handler(request: Request, exc: QuizGenerationError):
+    metrics.quiz_errors.inc(str(exc.status_code))
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+async def enforce_rate_limit(user_api_key: str, user_type: str, cost: int = 1):
+    # Daily/monthly quotas from 'usage_limits' for the user's tier
+    if not config.RATE_LIMIT_ENABLED:
+        return
+    with metrics.stage("rate_limit"):
+        retry_after = await rate_limiter.check(user_api_key, user_type, cost)
+    if retry_after is not None:
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers={"Retry-After": str(retry_after)})
+
+async def authorize_request(request: Request):
     # Extract user API key from headers or query params (as per frontend implementation)
     # Assuming API key is in 'X-User-API-Key' header for now
     user_api_key = request.headers.get('X-User-API-Key')
-    if not user_api_key:
-        raise HTTPException(status_code=401, detail="User API key missing")
-
-    # Verify API key
-    user_status = await verify_api_key(user_api_key)
-    if user_status is None:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    if user_status == 'inactive':
-        raise HTTPException(status_code=403, detail="API key is inactive")
-
-    user_type = user_status # Now user_type holds 'free', 'silver', or 'gold'
-    # TODO: Implement rate limiting based on user_type (e.g., using a rate limiter library and storage)
-    # Example placeholder:
-    # if not check_rate_limit(user_api_key, user_type):
-    #     raise HTTPException(status_code=429, detail="Rate limit exceeded")
 
+    # Verify API key (served from the in-process cache on the hot path); the quota is
+    # charged by each endpoint once the request has passed validation
+    with metrics.stage("verify_api_key"):
+        user_type = await verify_user(user_api_key) # 'free', 'silver', or 'gold'
+    return user_api_key, user_type
+
+async def read_quiz_params(request: Request) -> dict:
     # Parse request body for quiz parameters
     try:
         params = await request.json()
-        print(f"Received parameters: {params}") # Add this line to inspect parameters
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(params, dict):
+        raise HTTPException(status_code=400, detail="Request body must be a JSON object")
+    return params
+
+def wants_cache_bypass(request: Request, params: dict) -> bool:
+    # Per-request cache bypass: {"bypass_cache": true} or "Cache-Control: no-cache"
+    return bool(params.get("bypass_cache")) or "no-cache" in request.headers.get("Cache-Control", "")
+
+@app.post("/generate-quiz")
+async def generate_quiz(request: Request, response: Response):
+    user_api_key, user_type = await authorize_request(request)
+    params = await read_quiz_params(request)
+    if parse_quiz_params(params) is None:
+        raise HTTPException(status_code=400, detail="Missing or unsupported quiz parameters")
+    await enforce_rate_limit(user_api_key, user_type)
+    bypass_cache = wants_cache_bypass(request, params)
+
+    result = await run_quiz_pipeline(user_api_key, params, bypass_cache=bypass_cache, user_type=user_type)
+
+    if result.banked:
+        response.headers["X-Quiz-Cache"] = "BANK"
+    else:
+        response.headers["X-Quiz-Cache"] = "HIT" if result.cached else ("SHARED" if result.shared else "MISS")
+    # quiz_content stays a JSON string for existing clients; questions is the parsed, validated list
+    return {"quiz_content": result.quiz_content, "questions": result.questions}
+
+@app.post("/generate-quiz/batch")
+async def generate_quiz_batch_endpoint(request: Request):
+    user_api_key, user_type = await authorize_request(request)
+    body = await read_quiz_params(request)
+
+    # Body: {"items": [<quiz params>, ...], "concurrency": optional int}
+    items = body.get("items")
+    if not isinstance(items, list) or not items:
+        raise HTTPException(status_code=400, detail="'items' must be a non-empty list of quiz parameters")
+    if len(items) > config.BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {config.BATCH_MAX_ITEMS} items per batch")
+    try:
+        concurrency = min(int(body.get("concurrency") or config.BATCH_MAX_CONCURRENCY), config.BATCH_MAX_CONCURRENCY)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="'concurrency' must be an integer")
+    bypass_cache = wants_cache_bypass(request, body)
+
+    # Render all prompts up front; invalid items fail without an upstream call
+    prompts = [select_and_customize_prompt(item) if isinstance(item, dict) else "" for item in items]
+    valid = [i for i, prompt in enumerate(prompts) if prompt]
+    # Every valid item counts against the quota
+    if valid:
+        await enforce_rate_limit(user_api_key, user_type, cost=len(valid))
+
+    # Fetch API config from DB and pick the models for each item
+    _, openrouter_api_key = await fetch_api_config()
+    routes = {i: await route_models(user_type, items[i]) for i in valid}
+
+    started = time.monotonic()
+    outcomes = await generate_quiz_batch(
+        [(items[i], prompts[i], routes[i]) for i in valid], openrouter_api_key,
+        concurrency=max(1, concurrency), timeout=config.BATCH_ITEM_TIMEOUT, bypass_cache=bypass_cache
+    )
+
+    results = [{"index": i, "status": "error", "error": "Missing or unsupported quiz parameters"} for i in range(len(items))]
+    records = []
+    for i, outcome in zip(valid, outcomes):
+        if isinstance(outcome, QuizResult):
+            results[i] = {
+                "index": i, "status": "success", "quiz_content": outcome.quiz_content,
+                "questions": outcome.questions, "cached": outcome.cached
+            }
+            records.append(build_quiz_record(user_api_key, outcome.quiz_json, outcome.prompt_hash, outcome.model))
+            await log_quiz_usage(user_api_key, user_type, "batch", started, outcome)
+        else:
+            results[i]["error"] = outcome
+            await log_quiz_usage(user_api_key, user_type, "batch", started, None, model=routes[i][0])
+
+    # Save all generated quizzes with a single bulk insert
+    try:
+        await save_generated_quizzes(records)
+    except Exception as e:
+        logger.error(f"Error saving batch quizzes for user {user_api_key}: {e}")
+
+    succeeded = len(records)
+    return {"results": results, "succeeded": succeeded, "failed": len(items) - succeeded}
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/generate-quiz/stream")
+async def generate_quiz_stream(request: Request):
+    user_api_key, user_type = await authorize_request(request)
+    params = await read_quiz_params(request)
+    bypass_cache = wants_cache_bypass(request, params)
 
     # Select and customize prompt
     final_prompt = select_and_customize_prompt(params)
+    if not final_prompt:
+        raise HTTPException(status_code=400, detail="Missing or unsupported quiz parameters")
+    await enforce_rate_limit(user_api_key, user_type)
 
-    # Fetch API config from DB
-    model, openrouter_api_key = await fetch_api_config()
+    # Fetch API config from DB and pick the models for this request
+    _, openrouter_api_key = await fetch_api_config()
+    models = await route_models(user_type, params)
+    question_type = question_type_of(params)
 
-    # Call OpenRouter API
-    api_response = await call_openrouter_api(final_prompt, model, openrouter_api_key)
-
-    # Process and return the quiz data from the API response
-    if api_response and api_response.get("choices"):
-        # Assuming the generated quiz content is in the first message's content
-        quiz_content = api_response["choices"][0]["message"]["content"]
-        
-        # Attempt to parse quiz_content as JSON, if it's a JSON string
+    async def event_stream():
+        # One "question" event per parsed question, then "done" (or "error")
+        started = time.monotonic()
+        result = None
+        index = 0
         try:
-            quiz_json = json.loads(quiz_content)
-        except json.JSONDecodeError:
-            # If not JSON, store as a simple dictionary or string
-            quiz_json = {"content": quiz_content}
+            if needs_document_split(params):
+                # Long documents stream section by section
+                events = stream_document_questions(params, final_prompt, models, openrouter_api_key, bypass_cache=bypass_cache)
+            else:
+                events = stream_quiz_questions(
+                    final_prompt, models, openrouter_api_key, bypass_cache=bypass_cache, question_type=question_type
+                )
+            async for kind, payload in events:
+                if kind == "question":
+                    yield format_sse("question", {"index": index, "question": payload})
+                    index += 1
+                else:
+                    result = payload
+        except Exception as e:
+            logger.error(f"Error streaming quiz from OpenRouter API: {e}")
+        if result is None or not result.quiz_content:
+            await log_quiz_usage(user_api_key, user_type, "stream", started, None, model=models[0])
+            yield format_sse("error", {"detail": "Failed to generate quiz from API"})
+            return
 
-        # Save the generated quiz to the database
-        await save_generated_quiz(user_api_key, quiz_json)
+        # Save the generated quiz to the database once the stream completes
+        await save_generated_quiz(user_api_key, result.quiz_json, prompt_hash=result.prompt_hash, model=result.model)
+        await log_quiz_usage(user_api_key, user_type, "stream", started, result)
+        yield format_sse("done", {
+            "quiz_content": result.quiz_content, "questions": result.questions,
+            "num_questions": index, "cached": result.cached
+        })
 
-        return {"quiz_content": quiz_content}
-    else:
-        raise HTTPException(status_code=500, detail="Failed to generate quiz from API")
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.post("/jobs/generate-quiz", status_code=202)
+async def submit_quiz_job(request: Request):
+    user_api_key, user_type = await authorize_request(request)
+    params = await read_quiz_params(request)
+
+    # Optional webhook called with the finished job
+    callback_url = params.pop("callback_url", None)
+    if callback_url is not None:
+        reason = await check_callback_url(str(callback_url))
+        if reason is not None:
+            raise HTTPException(status_code=400, detail=reason)
+
+    # Reject bad parameters now rather than in the worker
+    if not select_and_customize_prompt(params):
+        raise HTTPException(status_code=400, detail="Missing or unsupported quiz parameters")
+    await enforce_rate_limit(user_api_key, user_type)
+
+    job = await get_job_queue().submit(user_api_key, params, wants_cache_bypass(request, params), callback_url)
+    return {"job_id": job["id"], "status": job["status"], "status_url": f"/jobs/{job['id']}"}
+
+@app.get("/jobs/{job_id}")
+async def get_quiz_job(job_id: str, request: Request):
+    job = await get_job_queue().get(job_id)
+    # Jobs are only visible to the API key that submitted them
+    if job is None or job["user_api_key"] != request.headers.get('X-User-API-Key'):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job_view(job)
 
 # Mount static files AFTER all API routes
+# Prometheus scrape endpoint; the figures are per uvicorn worker
+@app.get("/metrics")
+async def metrics_endpoint():
+    if not config.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Not Found")
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 app.mount("/admin", StaticFiles(directory="admin"), name="admin")
 app.mount("/", StaticFiles(directory="frontend", html=True), name="frontend")
 
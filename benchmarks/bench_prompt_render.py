@@ -0,0 +1,63 @@
+"""Microbenchmark: per-render cost of quiz prompts for ~10 KB paragraph inputs.
+
+Compares `str.format` on the raw template, the precompiled template alone,
+and the full `select_and_customize_prompt` (parameter validation + render).
+
+Run from the repository root:
+
+    python benchmarks/bench_prompt_render.py [--size 10240] [--number 20000]
+"""
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from prompt_selector import PREDEFINED_PROMPTS, COMPILED_PROMPTS, select_and_customize_prompt  # noqa: E402
+
+SENTENCE = "The industrial revolution reshaped labour, cities and trade across Europe and beyond. "
+
+def paragraph(size: int) -> str:
+    return (SENTENCE * (size // len(SENTENCE) + 1))[:size]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10 * 1024, help="paragraph size in bytes")
+    parser.add_argument("--number", type=int, default=20000, help="renders per measurement")
+    parser.add_argument("--repeat", type=int, default=5, help="measurements (best is reported)")
+    args = parser.parse_args()
+
+    content = paragraph(args.size)
+    key = ("paragraph", "mcq")
+    values = {
+        "content": content,
+        "level": "medium",
+        "num_of_question": "10",
+        "subject_instruction": "Subject: History.",
+        "exam_instruction": "",
+        "custom_instruction": "",
+    }
+    params = {
+        "content_type": "paragraph",
+        "question_type": "multiple_choice_quiz",
+        "level": "medium",
+        "content": content,
+        "num_of_question": 10,
+        "subject": "History",
+    }
+    source, template = PREDEFINED_PROMPTS[key], COMPILED_PROMPTS[key]
+    assert template.render(values) == source.format(**values)
+
+    cases = [
+        ("str.format", lambda: source.format(**values)),
+        ("PromptTemplate.render", lambda: template.render(values)),
+        ("select_and_customize_prompt", lambda: select_and_customize_prompt(params)),
+    ]
+    print(f"paragraph: {len(content)} bytes, prompt: {len(template.render(values))} bytes")
+    for name, fn in cases:
+        best = min(timeit.repeat(fn, number=args.number, repeat=args.repeat))
+        print(f"{name:<30} {best / args.number * 1e6:8.2f} us/render")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""Load test: boots app:app against local OpenRouter / PostgREST stand-ins and measures it.
+
+Drives /generate-quiz (uncached, cached and streamed) and the admin list and
+dashboard endpoints at a fixed concurrency, then reports requests per second,
+p50/p95/p99 latency, status codes and a per-stage breakdown taken from the
+app's /metrics endpoint. Nothing leaves the machine: the mocks live in
+benchmarks/mock_services.py.
+
+Run from the repository root:
+
+    python benchmarks/load_test.py [--concurrency 20] [--requests 200] [--scenarios generate-quiz,admin-users]
+    python benchmarks/load_test.py --compare benchmarks/results/<earlier run>.json
+
+Results are written to benchmarks/results/<timestamp>-<commit>.json (or --output).
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timezone
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from mock_services import user_api_key  # noqa: E402
+
+QUIZ_PARAMS = {"content_type": "topic", "question_type": "multiple_choice_quiz", "level": "medium", "num_of_question": 5}
+
+def _quiz(content: str) -> dict:
+    return {"method": "POST", "path": "/generate-quiz", "json": {**QUIZ_PARAMS, "content": content}}
+
+# Scenario name -> request for the i-th call of a run
+SCENARIOS = {
+    # Unique content per request: every call misses the quiz cache and reaches OpenRouter
+    "generate-quiz": lambda run, i: _quiz(f"Benchmark topic {run} {i}"),
+    # Same content throughout: served from the quiz cache after the warm-up
+    "generate-quiz-cached": lambda run, i: _quiz(f"Benchmark cached topic {run}"),
+    "generate-quiz-stream": lambda run, i: {**_quiz(f"Benchmark stream topic {run} {i}"),
+                                            "path": "/generate-quiz/stream", "stream": True},
+    "admin-users": lambda run, i: {"method": "GET", "path": "/api/admin/users?limit=100"},
+    "admin-quizzes": lambda run, i: {
+        "method": "GET", "path": "/api/admin/generated-quizzes?limit=50&fields=id,user_api_key,generated_at"},
+    "admin-dashboard": lambda run, i: {"method": "GET", "path": "/api/admin/dashboard-stats"},
+}
+
+# Metrics -------------------------------------------------------------------
+
+_SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+def parse_metrics(text: str) -> dict:
+    """{(metric name, frozenset of label pairs): value} for every sample line."""
+    samples = {}
+    for line in text.splitlines():
+        match = _SAMPLE.match(line)
+        if match:
+            name, labels, value = match.groups()
+            samples[(name, frozenset(_LABEL.findall(labels or "")))] = float(value)
+    return samples
+
+def _delta(before: dict, after: dict) -> dict:
+    return {key: value - before.get(key, 0.0) for key, value in after.items() if value - before.get(key, 0.0)}
+
+def stage_breakdown(before: dict, after: dict) -> dict:
+    """Count, mean and bucket-estimated p95 per stage over the scenario's run."""
+    delta = _delta(before, after)
+    stages = {}
+    for (name, labels), value in delta.items():
+        if not name.startswith("quiz_stage_duration_seconds"):
+            continue
+        labels = dict(labels)
+        entry = stages.setdefault(labels["stage"], {"count": 0, "sum": 0.0, "buckets": []})
+        if name.endswith("_count"):
+            entry["count"] = int(value)
+        elif name.endswith("_sum"):
+            entry["sum"] = value
+        elif name.endswith("_bucket"):
+            entry["buckets"].append((float(labels["le"]), value))
+    breakdown = {}
+    for stage, entry in sorted(stages.items()):
+        if not entry["count"]:
+            continue
+        # Cumulative buckets: the first bound holding 95% of the observations
+        target = 0.95 * entry["count"]
+        p95 = next((bound for bound, cumulative in sorted(entry["buckets"]) if cumulative >= target), float("inf"))
+        breakdown[stage] = {
+            "count": entry["count"],
+            "mean_ms": round(entry["sum"] / entry["count"] * 1000, 3),
+            "p95_ms_le": p95 * 1000 if p95 != float("inf") else None,
+        }
+    return breakdown
+
+def labelled_totals(before: dict, after: dict, metric: str) -> dict:
+    totals = {}
+    for (name, labels), value in _delta(before, after).items():
+        if name == metric:
+            key = ",".join(f"{label}={val}" for label, val in sorted(labels))
+            totals[key] = totals.get(key, 0) + value
+    return totals
+
+# Load generation ------------------------------------------------------------
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+async def _send(client: httpx.AsyncClient, spec: dict, key: str):
+    """(status, first byte latency) for one request; the body is read in full."""
+    headers = {"X-User-API-Key": key}
+    started = time.perf_counter()
+    if spec.get("stream"):
+        async with client.stream(spec["method"], spec["path"], json=spec.get("json"), headers=headers) as resp:
+            first = None
+            async for chunk in resp.aiter_bytes():
+                if first is None:
+                    first = time.perf_counter() - started
+                if b"event: error" in chunk:
+                    return "stream_error", first
+            return resp.status_code, first
+    resp = await client.request(spec["method"], spec["path"], json=spec.get("json"), headers=headers)
+    return resp.status_code, None
+
+async def run_scenario(client: httpx.AsyncClient, name: str, args, run_id: str) -> dict:
+    build = SCENARIOS[name]
+    keys = [user_api_key(i) for i in range(args.keys)]
+    # Warm-up: connections, API-key cache, config snapshot (and the quiz cache for the cached scenario)
+    for i in range(args.warmup):
+        await _send(client, build(f"{run_id}-warmup", i) if name != "generate-quiz-cached" else build(run_id, i), keys[0])
+
+    before = parse_metrics((await client.get("/metrics")).text)
+    latencies, first_bytes, statuses = [], [], {}
+    issued = 0
+    deadline = time.perf_counter() + args.duration if args.duration else None
+
+    async def worker():
+        nonlocal issued
+        while True:
+            if deadline is not None:
+                if time.perf_counter() >= deadline:
+                    return
+            elif issued >= args.requests:
+                return
+            i = issued
+            issued += 1
+            started = time.perf_counter()
+            try:
+                status, first = await _send(client, build(run_id, i), keys[i % len(keys)])
+            except httpx.HTTPError as e:
+                status, first = type(e).__name__, None
+            latencies.append(time.perf_counter() - started)
+            if first is not None:
+                first_bytes.append(first)
+            statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+    after = parse_metrics((await client.get("/metrics")).text)
+
+    ms = lambda seconds: round(seconds * 1000, 2)  # noqa: E731
+    result = {
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "errors": sum(count for status, count in statuses.items() if not status.startswith("2")),
+        "status": statuses,
+        "latency_ms": {
+            "mean": ms(sum(latencies) / len(latencies)) if latencies else 0.0,
+            "p50": ms(percentile(latencies, 0.50)),
+            "p95": ms(percentile(latencies, 0.95)),
+            "p99": ms(percentile(latencies, 0.99)),
+            "max": ms(max(latencies, default=0.0)),
+        },
+        "stages": stage_breakdown(before, after),
+        "openrouter_calls": labelled_totals(before, after, "quiz_openrouter_requests_total"),
+        "cache_lookups": labelled_totals(before, after, "quiz_cache_lookups_total"),
+    }
+    if first_bytes:
+        result["first_byte_ms"] = {"p50": ms(percentile(first_bytes, 0.50)), "p95": ms(percentile(first_bytes, 0.95))}
+    return result
+
+# Processes --------------------------------------------------------------------
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def _spawn(command: list, env: dict, log_path: str, cwd: str) -> subprocess.Popen:
+    log = open(log_path, "wb")
+    return subprocess.Popen(command, cwd=cwd, env={**os.environ, **env}, stdout=log, stderr=subprocess.STDOUT)
+
+async def _wait_ready(url: str, process: subprocess.Popen, log_path: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                with open(log_path, errors="replace") as log:
+                    raise RuntimeError(f"{url} exited during startup:\n{log.read()[-2000:]}")
+            try:
+                await client.get(url, timeout=1.0)
+                return
+            except httpx.HTTPError:
+                await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:g}s (see {log_path})")
+
+def start_services(args, workdir: str) -> list:
+    mock_env = {
+        "MOCK_OPENROUTER_LATENCY": str(args.openrouter_latency),
+        "MOCK_OPENROUTER_JITTER": str(args.openrouter_jitter),
+        "MOCK_OPENROUTER_ERROR_RATE": str(args.error_rate),
+        "MOCK_OPENROUTER_429_RATE": str(args.rate_limit_rate),
+        "MOCK_DB_LATENCY": str(args.db_latency),
+        "MOCK_USER_KEYS": str(args.keys),
+    }
+    mock_url = f"http://127.0.0.1:{args.mock_port}"
+    app_env = {
+        "SUPABASE_URL": mock_url,
+        "SUPABASE_KEY": "bench.bench.bench",
+        "OPENROUTER_BASE_URL": f"{mock_url}/api/v1",
+        "OPENROUTER_HTTP2": "false",
+        "STATE_DIR": os.path.join(workdir, "state"),
+        # Measure the service, not the per-user quota
+        "RATE_LIMIT_ENABLED": "false",
+        "HEALTH_PROBE_INTERVAL": "0",
+        "METRICS_ENABLED": "true",
+    }
+    uvicorn = [sys.executable, "-m", "uvicorn", "--host", "127.0.0.1", "--log-level", "warning", "--no-access-log"]
+    mock_log, app_log = os.path.join(workdir, "mock.log"), os.path.join(workdir, "app.log")
+    mock = _spawn(uvicorn + ["--app-dir", BENCH_DIR, "--port", str(args.mock_port), "mock_services:app"],
+                  mock_env, mock_log, ROOT)
+    app = _spawn(uvicorn + ["--port", str(args.app_port), "--workers", str(args.workers), "app:app"],
+                 app_env, app_log, ROOT)
+    processes = [mock, app]
+    try:
+        asyncio.run(_wait_ready(f"{mock_url}/mock/stats", mock, mock_log))
+        asyncio.run(_wait_ready(f"http://127.0.0.1:{args.app_port}/metrics", app, app_log))
+    except Exception:
+        stop_services(processes)
+        raise
+    return processes
+
+def stop_services(processes: list):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+# Reporting ---------------------------------------------------------------------
+
+def print_report(results: dict):
+    print(f"{'scenario':<24}{'reqs':>7}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for name, result in results["scenarios"].items():
+        latency = result["latency_ms"]
+        print(f"{name:<24}{result['requests']:>7}{result['rps']:>10}{latency['p50']:>10}"
+              f"{latency['p95']:>10}{latency['p99']:>10}{result['errors']:>8}")
+        for stage, entry in result["stages"].items():
+            p95 = f"<= {entry['p95_ms_le']:g}" if entry["p95_ms_le"] is not None else "> max bucket"
+            print(f"    {stage:<26}{entry['count']:>7} calls  mean {entry['mean_ms']:>9.3f} ms  p95 {p95} ms")
+
+def print_comparison(baseline: dict, results: dict):
+    print(f"\nCompared with {baseline['meta'].get('commit')} ({baseline['meta'].get('timestamp')}):")
+    for name, result in results["scenarios"].items():
+        before = baseline["scenarios"].get(name)
+        if not before:
+            continue
+        change = lambda new, old: f"{(new - old) / old * 100:+.1f}%" if old else "n/a"  # noqa: E731
+        print(f"  {name:<24} rps {before['rps']} -> {result['rps']} ({change(result['rps'], before['rps'])}), "
+              f"p95 {before['latency_ms']['p95']} -> {result['latency_ms']['p95']} ms "
+              f"({change(result['latency_ms']['p95'], before['latency_ms']['p95'])})")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated, from: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=20, help="requests in flight at once")
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--duration", type=float, default=0, help="seconds per scenario (overrides --requests)")
+    parser.add_argument("--warmup", type=int, default=5, help="unmeasured requests before each scenario")
+    parser.add_argument("--keys", type=int, default=50, help="distinct user API keys to rotate through")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="uvicorn workers; /metrics is per worker, so stage breakdowns only cover one of them")
+    parser.add_argument("--openrouter-latency", type=float, default=0.5, help="mock completion latency in seconds")
+    parser.add_argument("--openrouter-jitter", type=float, default=0.1, help="+/- seconds added to that latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of completions answered with 502")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of completions answered with 429")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="mock PostgREST latency in seconds")
+    parser.add_argument("--app-port", type=int, default=8791)
+    parser.add_argument("--mock-port", type=int, default=8790)
+    parser.add_argument("--base-url", help="benchmark an app that is already running (against the mocks) instead")
+    parser.add_argument("--output", help="results file (default: benchmarks/results/<timestamp>-<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    commit = _git_commit()
+    timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    results = {
+        "meta": {
+            "commit": commit,
+            "timestamp": timestamp,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "scenarios": {},
+    }
+
+    with tempfile.TemporaryDirectory(prefix="quiz-bench-") as workdir:
+        processes = [] if args.base_url else start_services(args, workdir)
+        base_url = args.base_url or f"http://127.0.0.1:{args.app_port}"
+        try:
+            async def run_all():
+                limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+                async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120.0) as client:
+                    run_id = uuid.uuid4().hex[:8]
+                    for name in names:
+                        print(f"Running {name} ...", file=sys.stderr)
+                        results["scenarios"][name] = await run_scenario(client, name, args, run_id)
+            asyncio.run(run_all())
+        finally:
+            stop_services(processes)
+
+    print_report(results)
+    output = args.output or os.path.join(BENCH_DIR, "results", f"{timestamp}-{commit}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), results)
+
+if __name__ == "__main__":
+    main()
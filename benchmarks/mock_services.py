@@ -0,0 +1,388 @@
+"""Local stand-ins for OpenRouter and Supabase's PostgREST, for offline benchmarks.
+
+One Starlette app serves both:
+
+- `POST /api/v1/chat/completions` (plain and `stream: true`) and `GET /api/v1/models`,
+  answering with a quiz of the requested size and question type, after a
+  configurable latency and with configurable 5xx / 429 rates;
+- `/rest/v1/<table>`: an in-memory PostgREST subset (select projection,
+  eq/neq/gt/gte/lt/lte/in/is filters, or/and trees, order, limit/offset,
+  Range, count=exact, insert/upsert, update, delete) seeded with users,
+  user_api_keys, models, openrouter_api_keys, usage_limits and generated_quizzes,
+  plus the question bank's SQL functions under `/rest/v1/rpc/<function>`.
+
+Configuration comes from environment variables (see `MockSettings`), so the
+load driver can start it with:
+
+    python -m uvicorn --app-dir benchmarks mock_services:app --port 8790
+"""
+import asyncio
+import json
+import os
+import random
+import re
+import uuid
+from datetime import datetime, timedelta, timezone
+from functools import cmp_to_key
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+class MockSettings:
+    def __init__(self, env=os.environ):
+        self.latency = float(env.get("MOCK_OPENROUTER_LATENCY", "0.5"))
+        self.jitter = float(env.get("MOCK_OPENROUTER_JITTER", "0.1"))
+        self.error_rate = float(env.get("MOCK_OPENROUTER_ERROR_RATE", "0"))
+        self.rate_limit_rate = float(env.get("MOCK_OPENROUTER_429_RATE", "0"))
+        self.stream_chunk_chars = int(env.get("MOCK_STREAM_CHUNK_CHARS", "16"))
+        self.stream_chunk_delay = float(env.get("MOCK_STREAM_CHUNK_DELAY", "0.005"))
+        self.db_latency = float(env.get("MOCK_DB_LATENCY", "0.002"))
+        self.user_keys = int(env.get("MOCK_USER_KEYS", "50"))
+        self.seed_quizzes = int(env.get("MOCK_SEED_QUIZZES", "2000"))
+        self.seed_users = int(env.get("MOCK_SEED_USERS", "500"))
+
+settings = MockSettings()
+
+def _now(offset_seconds: float = 0) -> str:
+    return (datetime.now(timezone.utc) - timedelta(seconds=offset_seconds)).isoformat()
+
+def user_api_key(index: int) -> str:
+    return f"bench-key-{index:04d}"
+
+def seed_tables(s: MockSettings) -> dict:
+    quiz = {"context": "seed", "topic": "seed", "level": "easy", "questions": [
+        {"stem": "Seed question?", "options": ["A", "B", "C", "D"], "correct_option": "A"}]}
+    return {
+        "user_api_keys": [
+            {"id": str(i + 1), "user_api_key": user_api_key(i), "user_type": "gold", "status": "active", "user_id": f"u{i}"}
+            for i in range(s.user_keys)
+        ],
+        "users": [
+            {"id": str(i + 1), "user_id": f"u{i}", "email": f"user{i}@example.com", "username": f"user{i}", "tier": "gold",
+             "api_key": user_api_key(i % max(1, s.user_keys)), "created_at": _now(i * 60), "updated_at": None, "is_active": True}
+            for i in range(s.seed_users)
+        ],
+        "models": [
+            {"id": "m1", "model_name": "bench/model-a", "description": "primary", "is_default": True},
+            {"id": "m2", "model_name": "bench/model-b", "description": "fallback", "is_default": False},
+        ],
+        "openrouter_api_keys": [
+            {"id": "o1", "api_key": "sk-bench-1", "description": "bench", "is_default": True},
+            {"id": "o2", "api_key": "sk-bench-2", "description": "bench", "is_default": False},
+        ],
+        "usage_limits": [
+            {"id": f"l{i}", "tier_name": tier, "max_daily_limit": 1_000_000, "max_monthly_limit": 10_000_000, "price": 0}
+            for i, tier in enumerate(("free", "silver", "gold"))
+        ],
+        "generated_quizzes": [
+            {"id": str(uuid.UUID(int=i + 1)), "user_api_key": user_api_key(i % max(1, s.user_keys)),
+             "generated_at": _now(i * 30), "quiz_content": quiz, "prompt_hash": None, "model_name": "bench/model-a"}
+            for i in range(s.seed_quizzes)
+        ],
+        "usage_logs": [],
+    }
+
+TABLES = seed_tables(settings)
+COUNTERS = {"completions": 0, "streams": 0, "errors": 0, "rate_limited": 0, "db_requests": 0}
+
+# PostgREST ----------------------------------------------------------------
+
+def _coerce(value: str):
+    return {"true": True, "false": False, "null": None}.get(value, value)
+
+def _compare(left, right) -> int:
+    # Numbers compare numerically, everything else (ISO timestamps included) as text
+    try:
+        left, right = float(left), float(right)
+    except (TypeError, ValueError):
+        left, right = str(left), str(right)
+    return (left > right) - (left < right)
+
+def _split_top_level(text: str) -> list:
+    parts, depth, quoted, current = [], 0, False, ""
+    for char in text:
+        if char == '"':
+            quoted = not quoted
+        elif not quoted and char == "(":
+            depth += 1
+        elif not quoted and char == ")":
+            depth -= 1
+        if char == "," and depth == 0 and not quoted:
+            parts.append(current)
+            current = ""
+        else:
+            current += char
+    parts.append(current)
+    return parts
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1].replace('\\"', '"').replace("\\\\", "\\")
+    return value
+
+def _condition(row: dict, column: str, expression: str) -> bool:
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    operator, _, raw = expression.partition(".")
+    actual = row.get(column.split("->>")[0])
+    value = _coerce(_unquote(raw))
+    if operator == "eq":
+        result = actual is not None and str(actual) == str(value) if value is not None else actual is None
+    elif operator == "neq":
+        result = actual is not None and str(actual) != str(value)
+    elif operator in ("gt", "gte", "lt", "lte"):
+        if actual is None:
+            result = False
+        else:
+            order = _compare(actual, value)
+            result = {"gt": order > 0, "gte": order >= 0, "lt": order < 0, "lte": order <= 0}[operator]
+    elif operator == "in":
+        result = str(actual) in {_unquote(item) for item in _split_top_level(raw.strip("()"))}
+    elif operator == "is":
+        result = actual is value
+    else:
+        raise ValueError(f"Unsupported operator: {operator}")
+    return result != negate
+
+def _logic(row: dict, operator: str, body: str) -> bool:
+    results = []
+    for part in _split_top_level(body.strip()[1:-1]):
+        head, _, rest = part.partition("(")
+        if head in ("and", "or", "not.and", "not.or") and rest:
+            inner = _logic(row, head.replace("not.", ""), "(" + rest)
+            results.append(not inner if head.startswith("not.") else inner)
+        else:
+            column, _, expression = part.partition(".")
+            results.append(_condition(row, column, expression))
+    return all(results) if operator == "and" else any(results)
+
+RESERVED = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+def _matches(row: dict, filters: list) -> bool:
+    for key, value in filters:
+        if key in ("or", "and"):
+            if not _logic(row, key, value):
+                return False
+        elif not _condition(row, key, value):
+            return False
+    return True
+
+def _sort(rows: list, order: str) -> list:
+    for part in reversed(order.split(",")):
+        column, *modifiers = part.split(".")
+        descending = "desc" in modifiers
+        nulls_first = "nullsfirst" in modifiers or ("nullslast" not in modifiers and descending)
+        present = [row for row in rows if row.get(column) is not None]
+        missing = [row for row in rows if row.get(column) is None]
+        # Same ordering as the range filters, so keyset pages line up (numeric strings sort as numbers)
+        present.sort(key=cmp_to_key(lambda left, right: _compare(left[column], right[column])), reverse=descending)
+        rows = missing + present if nulls_first else present + missing
+    return rows
+
+def _project(rows: list, select: str) -> list:
+    if select in ("", "*"):
+        return rows
+    columns = [column.strip() for column in select.split(",")]
+    return [{column: row.get(column) for column in columns} for row in rows]
+
+async def rest(request: Request):
+    COUNTERS["db_requests"] += 1
+    if settings.db_latency:
+        await asyncio.sleep(settings.db_latency)
+    table = request.path_params["table"]
+    rows = TABLES.setdefault(table, [])
+    items = request.query_params.multi_items()
+    params = dict(items)
+    filters = [(key, value) for key, value in items if key not in RESERVED]
+    prefer = request.headers.get("prefer", "")
+
+    if request.method in ("GET", "HEAD"):
+        result = [row for row in rows if _matches(row, filters)]
+        if "order" in params:
+            result = _sort(result, params["order"])
+        total = len(result)
+        start = int(params.get("offset", 0))
+        end = start + int(params["limit"]) if "limit" in params else None
+        if "range" in request.headers:
+            low, _, high = request.headers["range"].partition("-")
+            start, end = int(low), int(high) + 1
+        result = _project(result[start:end], params.get("select", "*"))
+        count = str(total) if "count=" in prefer else "*"
+        headers = {"content-range": f"{start}-{start + max(len(result), 1) - 1}/{count}" if result else f"*/{count}"}
+        if request.method == "HEAD":
+            return Response(headers=headers)
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(result) != 1:
+                return JSONResponse({"message": "JSON object requested, multiple (or no) rows returned",
+                                     "code": "PGRST116", "details": "", "hint": None}, status_code=406)
+            return JSONResponse(result[0], headers=headers)
+        return JSONResponse(result, headers=headers)
+
+    if request.method == "POST":
+        body = await request.json()
+        incoming = body if isinstance(body, list) else [body]
+        conflict = params.get("on_conflict")
+        merge = "resolution=merge-duplicates" in prefer
+        ignore = "resolution=ignore-duplicates" in prefer
+        written = []
+        for item in incoming:
+            item = dict(item)
+            existing = None
+            if merge or ignore:
+                keys = conflict.split(",") if conflict else ["id"]
+                existing = next((row for row in rows if all(row.get(k) == item.get(k) for k in keys)), None)
+            if existing is not None:
+                if merge:
+                    existing.update(item)
+                    written.append(existing)
+                continue
+            item.setdefault("id", str(uuid.uuid4()))
+            if table == "generated_quizzes":
+                item.setdefault("generated_at", _now())
+            item.setdefault("created_at", _now())
+            rows.append(item)
+            written.append(item)
+        if "return=minimal" in prefer:
+            return Response(status_code=201)
+        return JSONResponse(written, status_code=201)
+
+    if request.method == "PATCH":
+        body = await request.json()
+        updated = [row for row in rows if _matches(row, filters)]
+        for row in updated:
+            row.update(body)
+        return JSONResponse(updated)
+
+    if request.method == "DELETE":
+        deleted = [row for row in rows if _matches(row, filters)]
+        TABLES[table] = [row for row in rows if not _matches(row, filters)]
+        return JSONResponse(deleted)
+
+    return Response(status_code=405)
+
+def _record_demand(entries: list):
+    pools = TABLES.setdefault("question_bank_pools", [])
+    for entry in entries:
+        pool = next((row for row in pools if row["pool_key"] == entry["pool_key"]), None)
+        if pool is None:
+            pool = {"pool_key": entry["pool_key"], "params": entry["params"], "header": None, "requests": 0,
+                    "size": 0, "target_size": 0, "last_requested_at": None, "last_warmed_at": None}
+            pools.append(pool)
+        pool["requests"] += entry["requests"]
+        pool["last_requested_at"] = _now()
+
+def _decay(factor: float):
+    pools = TABLES.setdefault("question_bank_pools", [])
+    for pool in pools:
+        pool["requests"] *= factor
+    pools[:] = [pool for pool in pools if pool["size"] or pool["requests"] >= 0.01]
+
+# Stand-ins for the SQL functions in migrations/
+FUNCTIONS = {
+    "question_bank_record_demand": lambda body: _record_demand(body["entries"]),
+    "question_bank_decay": lambda body: _decay(body["factor"]),
+}
+
+async def rpc(request: Request):
+    COUNTERS["db_requests"] += 1
+    function = FUNCTIONS.get(request.path_params["function"])
+    if function is None:
+        return JSONResponse({"message": "Could not find the function", "code": "PGRST202"}, status_code=404)
+    function(await request.json())
+    return JSONResponse(None)
+
+# OpenRouter ---------------------------------------------------------------
+
+DEFAULT_QUESTION = {"stem": "Which option is correct?", "options": ["Alpha", "Beta", "Gamma", "Delta"],
+                    "correct_option": "Alpha", "explanation": "Alpha is correct."}
+_COUNT = re.compile(r"Here are (\d+) questions")
+WORDS = ("amber", "basalt", "cobalt", "delta", "ember", "fjord", "garnet", "harbor", "indigo", "juniper",
+         "kelp", "lagoon", "meadow", "nectar", "opal", "prairie", "quartz", "ridge", "sierra", "tundra")
+
+def _example_quiz(prompt: str) -> dict:
+    # The prompt templates end with an example of the expected JSON object
+    start = prompt.find("\n{\n")
+    end = prompt.rfind("\n}")
+    try:
+        quiz = json.loads(prompt[start + 1:end + 2])
+    except ValueError:
+        quiz = {}
+    if not isinstance(quiz, dict) or not quiz.get("questions"):
+        quiz = {"context": "Mock quiz", "questions": [DEFAULT_QUESTION]}
+    return quiz
+
+def quiz_for(prompt: str) -> str:
+    """A quiz shaped like the prompt's example, with as many questions as it asks for."""
+    quiz = _example_quiz(prompt)
+    match = _COUNT.search(prompt)
+    count = int(match.group(1)) if match else 5
+    template = quiz["questions"][0]
+    questions = []
+    for _ in range(count):
+        question = dict(template)
+        # Distinct stems, so quiz de-duplication keeps every question
+        question["stem"] = f"{template.get('stem', 'Question')} ({' '.join(random.sample(WORDS, 4))})"
+        questions.append(question)
+    quiz["questions"] = questions
+    return json.dumps(quiz)
+
+def _usage(prompt: str, content: str) -> dict:
+    prompt_tokens, completion_tokens = len(prompt) // 4, len(content) // 4
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+async def chat_completions(request: Request):
+    body = await request.json()
+    roll = random.random()
+    if roll < settings.rate_limit_rate:
+        COUNTERS["rate_limited"] += 1
+        return JSONResponse({"error": {"message": "Rate limited"}}, status_code=429, headers={"retry-after": "1"})
+    if roll < settings.rate_limit_rate + settings.error_rate:
+        COUNTERS["errors"] += 1
+        return JSONResponse({"error": {"message": "Upstream error"}}, status_code=502)
+
+    prompt = body["messages"][-1]["content"]
+    content = quiz_for(prompt)
+    delay = max(0.0, settings.latency + random.uniform(-settings.jitter, settings.jitter))
+
+    if body.get("stream"):
+        COUNTERS["streams"] += 1
+
+        async def events():
+            # Time to first token, then the content in small deltas
+            await asyncio.sleep(delay / 2)
+            size = settings.stream_chunk_chars
+            for index in range(0, len(content), size):
+                chunk = {"choices": [{"delta": {"content": content[index:index + size]}}]}
+                yield f"data: {json.dumps(chunk)}\n\n".encode()
+                if settings.stream_chunk_delay:
+                    await asyncio.sleep(settings.stream_chunk_delay)
+            yield f"data: {json.dumps({'choices': [], 'usage': _usage(prompt, content)})}\n\n".encode()
+            yield b"data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    COUNTERS["completions"] += 1
+    await asyncio.sleep(delay)
+    return JSONResponse({
+        "id": f"gen-{uuid.uuid4().hex}",
+        "model": body.get("model"),
+        "choices": [{"message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": _usage(prompt, content),
+    })
+
+async def list_models(request: Request):
+    return JSONResponse({"data": [{"id": row["model_name"]} for row in TABLES["models"]]})
+
+async def mock_stats(request: Request):
+    return JSONResponse({**COUNTERS, "rows": {table: len(rows) for table, rows in TABLES.items()}})
+
+app = Starlette(routes=[
+    Route("/rest/v1/rpc/{function}", rpc, methods=["POST"]),
+    Route("/rest/v1/{table}", rest, methods=["GET", "HEAD", "POST", "PATCH", "DELETE"]),
+    Route("/api/v1/chat/completions", chat_completions, methods=["POST"]),
+    Route("/api/v1/models", list_models),
+    Route("/mock/stats", mock_stats),
+])
@@ -1 +1,211 @@
-# Configuration file
\ No newline at end of file
+# Configuration file
+import os
+from dotenv import load_dotenv
+
+# Load environment variables before reading any settings below
+load_dotenv()
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return int(value) if value not in (None, "") else default
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    return float(value) if value not in (None, "") else default
+
+def _env_bool(name: str, default: bool) -> bool:
+    value = os.environ.get(name)
+    if value in (None, ""):
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+# OpenRouter HTTP client (one pooled client per uvicorn worker)
+OPENROUTER_BASE_URL = os.environ.get("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+OPENROUTER_CONNECT_TIMEOUT = _env_float("OPENROUTER_CONNECT_TIMEOUT", 5.0)
+OPENROUTER_READ_TIMEOUT = _env_float("OPENROUTER_READ_TIMEOUT", 120.0)
+OPENROUTER_WRITE_TIMEOUT = _env_float("OPENROUTER_WRITE_TIMEOUT", 10.0)
+OPENROUTER_POOL_TIMEOUT = _env_float("OPENROUTER_POOL_TIMEOUT", 10.0)
+OPENROUTER_MAX_CONNECTIONS = _env_int("OPENROUTER_MAX_CONNECTIONS", 200)
+OPENROUTER_MAX_KEEPALIVE = _env_int("OPENROUTER_MAX_KEEPALIVE", 50)
+OPENROUTER_KEEPALIVE_EXPIRY = _env_float("OPENROUTER_KEEPALIVE_EXPIRY", 30.0)
+OPENROUTER_HTTP2 = _env_bool("OPENROUTER_HTTP2", True)
+
+# OpenRouter key pool: every row of 'openrouter_api_keys' takes traffic
+# Key selection: "least_in_flight" or "round_robin" (weighted by the optional 'weight' column)
+OPENROUTER_KEY_STRATEGY = os.environ.get("OPENROUTER_KEY_STRATEGY", "least_in_flight")
+# Distinct keys to try per call before giving up
+OPENROUTER_KEY_MAX_ATTEMPTS = _env_int("OPENROUTER_KEY_MAX_ATTEMPTS", 3)
+# Consecutive 5xx/network failures that take a key out of rotation
+OPENROUTER_KEY_FAILURE_THRESHOLD = _env_int("OPENROUTER_KEY_FAILURE_THRESHOLD", 3)
+# Seconds a failing or rate-limited key (without Retry-After) sits out
+OPENROUTER_KEY_COOLDOWN = _env_float("OPENROUTER_KEY_COOLDOWN", 30.0)
+# Seconds a key rejected with 401/402/403 sits out
+OPENROUTER_KEY_AUTH_COOLDOWN = _env_float("OPENROUTER_KEY_AUTH_COOLDOWN", 300.0)
+
+# Supabase client pool
+SUPABASE_POOL_SIZE = _env_int("SUPABASE_POOL_SIZE", 10)
+SUPABASE_POOL_TIMEOUT = _env_float("SUPABASE_POOL_TIMEOUT", 30.0)
+SUPABASE_QUERY_TIMEOUT = _env_float("SUPABASE_QUERY_TIMEOUT", 30.0)
+
+# Local state shared by the workers on one host (SQLite files)
+STATE_DIR = os.environ.get("STATE_DIR", "var")
+
+# Cache invalidation across workers: "sqlite" (shared file in STATE_DIR) or "local"
+CACHE_INVALIDATION_BACKEND = os.environ.get("CACHE_INVALIDATION_BACKEND", "sqlite").lower()
+CACHE_INVALIDATION_POLL_INTERVAL = _env_float("CACHE_INVALIDATION_POLL_INTERVAL", 2.0)
+
+# API key verification cache
+API_KEY_CACHE_SIZE = _env_int("API_KEY_CACHE_SIZE", 10000)
+API_KEY_CACHE_TTL = _env_float("API_KEY_CACHE_TTL", 60.0)
+API_KEY_CACHE_NEGATIVE_TTL = _env_float("API_KEY_CACHE_NEGATIVE_TTL", 10.0)
+
+# Default model / OpenRouter key snapshot
+API_CONFIG_REFRESH_INTERVAL = _env_float("API_CONFIG_REFRESH_INTERVAL", 60.0)
+
+# Model routing over the 'models' table (see migrations/003_model_routing.sql)
+# Chain order: "priority" (priority column, then the default model) or "latency" (measured p95)
+MODEL_ROUTING_STRATEGY = os.environ.get("MODEL_ROUTING_STRATEGY", "priority")
+# Models tried per request before the default model closes the chain
+MODEL_FALLBACK_DEPTH = _env_int("MODEL_FALLBACK_DEPTH", 3)
+# Seconds without an answer before the next model in the chain is fired as a hedge (0 = no hedging)
+MODEL_HEDGE_DELAY = _env_float("MODEL_HEDGE_DELAY", 0.0)
+# Consecutive failures after which a model is moved to the end of the chain for MODEL_COOLDOWN seconds
+MODEL_FAILURE_THRESHOLD = _env_int("MODEL_FAILURE_THRESHOLD", 3)
+MODEL_COOLDOWN = _env_float("MODEL_COOLDOWN", 60.0)
+# Recent calls per model used for the latency percentiles
+MODEL_LATENCY_WINDOW = _env_int("MODEL_LATENCY_WINDOW", 200)
+
+# Structured output: ask OpenRouter for a bare JSON object (response_format) where the model supports it
+OPENROUTER_JSON_MODE = _env_bool("OPENROUTER_JSON_MODE", True)
+# Extra calls per quiz to replace questions that failed schema validation (or an unparseable response)
+QUIZ_REPAIR_RETRIES = _env_int("QUIZ_REPAIR_RETRIES", 1)
+
+# Generated quiz response cache
+QUIZ_CACHE_ENABLED = _env_bool("QUIZ_CACHE_ENABLED", True)
+QUIZ_CACHE_SIZE = _env_int("QUIZ_CACHE_SIZE", 1000)
+QUIZ_CACHE_TTL = _env_float("QUIZ_CACHE_TTL", 86400.0)
+# Distinct completions to collect per prompt before serving from the cache
+QUIZ_CACHE_VARIANTS = _env_int("QUIZ_CACHE_VARIANTS", 1)
+# Read/write prompt_hash on generated_quizzes (needs migrations/001_generated_quizzes_prompt_hash.sql)
+QUIZ_CACHE_PERSISTENT = _env_bool("QUIZ_CACHE_PERSISTENT", False)
+# Seconds a persistent-tier miss (or an incomplete set of variants) is remembered before the table is asked again
+QUIZ_CACHE_NEGATIVE_TTL = _env_float("QUIZ_CACHE_NEGATIVE_TTL", 30.0)
+
+# Batch quiz generation
+BATCH_MAX_ITEMS = _env_int("BATCH_MAX_ITEMS", 100)
+BATCH_MAX_CONCURRENCY = _env_int("BATCH_MAX_CONCURRENCY", 8)
+BATCH_ITEM_TIMEOUT = _env_float("BATCH_ITEM_TIMEOUT", 120.0)
+
+# Largest num_of_question accepted by every quiz endpoint (single, stream, batch items and jobs)
+MAX_QUESTIONS_PER_REQUEST = _env_int("MAX_QUESTIONS_PER_REQUEST", 100)
+
+# Chunked generation of large quizzes
+QUIZ_CHUNK_THRESHOLD = _env_int("QUIZ_CHUNK_THRESHOLD", 20)
+QUIZ_CHUNK_SIZE = _env_int("QUIZ_CHUNK_SIZE", 10)
+QUIZ_CHUNK_CONCURRENCY = _env_int("QUIZ_CHUNK_CONCURRENCY", 5)
+QUIZ_CHUNK_RETRIES = _env_int("QUIZ_CHUNK_RETRIES", 1)
+# Word-overlap (Jaccard) above which two question stems count as duplicates
+QUIZ_DEDUP_THRESHOLD = _env_float("QUIZ_DEDUP_THRESHOLD", 0.8)
+
+# Long documents: paragraph-mode content above DOCUMENT_SPLIT_TOKENS (estimated) tokens is split into
+# sections of about DOCUMENT_SECTION_TOKENS, generated in parallel and merged
+DOCUMENT_SPLIT_TOKENS = _env_int("DOCUMENT_SPLIT_TOKENS", 3000)  # 0 disables
+DOCUMENT_SECTION_TOKENS = _env_int("DOCUMENT_SECTION_TOKENS", 1500)
+DOCUMENT_MAX_SECTIONS = _env_int("DOCUMENT_MAX_SECTIONS", 40)
+DOCUMENT_SECTION_CONCURRENCY = _env_int("DOCUMENT_SECTION_CONCURRENCY", 5)
+
+# Background quiz generation jobs
+JOB_STORE_BACKEND = os.environ.get("JOB_STORE_BACKEND", "sqlite").lower()  # "sqlite" or "memory"
+JOB_WORKER_CONCURRENCY = _env_int("JOB_WORKER_CONCURRENCY", 4)  # per uvicorn worker; 0 disables
+JOB_POLL_INTERVAL = _env_float("JOB_POLL_INTERVAL", 1.0)
+JOB_LEASE_SECONDS = _env_float("JOB_LEASE_SECONDS", 600.0)
+JOB_MAX_ATTEMPTS = _env_int("JOB_MAX_ATTEMPTS", 3)
+JOB_RETENTION_SECONDS = _env_float("JOB_RETENTION_SECONDS", 86400.0)
+JOB_CALLBACK_TIMEOUT = _env_float("JOB_CALLBACK_TIMEOUT", 10.0)
+# Comma-separated callback hosts; when set, callbacks may only go to these hosts (private ones included),
+# otherwise any host that resolves to public addresses only
+JOB_CALLBACK_ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in os.environ.get("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if host.strip()
+)
+
+# Per-tier daily/monthly quotas from the 'usage_limits' table
+RATE_LIMIT_ENABLED = _env_bool("RATE_LIMIT_ENABLED", True)
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "sqlite").lower()  # "sqlite" or "memory"
+# Most units a worker reserves from the shared counters at once (1 = one store write per request);
+# up to RATE_LIMIT_LEASE_SIZE - 1 leased units per key can sit unspent in workers the key no longer uses
+RATE_LIMIT_LEASE_SIZE = _env_int("RATE_LIMIT_LEASE_SIZE", 1)
+
+# Write-behind persistence of generated_quizzes and usage_logs rows
+WRITE_BEHIND_ENABLED = _env_bool("WRITE_BEHIND_ENABLED", True)
+WRITE_BEHIND_BATCH_SIZE = _env_int("WRITE_BEHIND_BATCH_SIZE", 100)
+WRITE_BEHIND_FLUSH_INTERVAL = _env_float("WRITE_BEHIND_FLUSH_INTERVAL", 1.0)
+WRITE_BEHIND_MAX_QUEUE = _env_int("WRITE_BEHIND_MAX_QUEUE", 10000)
+WRITE_BEHIND_MAX_RETRIES = _env_int("WRITE_BEHIND_MAX_RETRIES", 5)
+WRITE_BEHIND_DRAIN_TIMEOUT = _env_float("WRITE_BEHIND_DRAIN_TIMEOUT", 15.0)
+# Write one usage_logs row per quiz request (needs migrations/002_usage_logs.sql)
+USAGE_LOGS_ENABLED = _env_bool("USAGE_LOGS_ENABLED", True)
+
+# Admin list endpoints: keyset page size cap and rows per query of the NDJSON exports
+ADMIN_PAGE_MAX_LIMIT = _env_int("ADMIN_PAGE_MAX_LIMIT", 1000)
+ADMIN_EXPORT_PAGE_SIZE = _env_int("ADMIN_EXPORT_PAGE_SIZE", 1000)
+
+# Admin dashboard statistics (see dashboard_stats.py)
+DASHBOARD_STATS_TTL = _env_float("DASHBOARD_STATS_TTL", 30.0)
+# "exact", "planned" / "estimated" (PostgREST estimates) or "counters" (needs migrations/004_dashboard_rollups.sql)
+DASHBOARD_COUNT_MODE = os.environ.get("DASHBOARD_COUNT_MODE", "exact").lower()
+
+# Admin health probes (see health.py)
+HEALTH_PROBE_TIMEOUT = _env_float("HEALTH_PROBE_TIMEOUT", 5.0)
+HEALTH_PROMPT_TIMEOUT = _env_float("HEALTH_PROMPT_TIMEOUT", 15.0)
+HEALTH_CACHE_TTL = _env_float("HEALTH_CACHE_TTL", 15.0)
+HEALTH_PROMPT_CACHE_TTL = _env_float("HEALTH_PROMPT_CACHE_TTL", 300.0)
+# Seconds between background database/OpenRouter probes per worker; 0 disables
+HEALTH_PROBE_INTERVAL = _env_float("HEALTH_PROBE_INTERVAL", 60.0)
+# Latency samples kept per probe for the p50/p95 history
+HEALTH_HISTORY_SIZE = _env_int("HEALTH_HISTORY_SIZE", 1440)
+
+# Prometheus metrics at GET /metrics (per uvicorn worker)
+METRICS_ENABLED = _env_bool("METRICS_ENABLED", True)
+
+# Pre-generated question bank (see question_bank.py; needs migrations/005_question_bank.sql)
+QUESTION_BANK_ENABLED = _env_bool("QUESTION_BANK_ENABLED", False)
+# UTC hours in which pools are warmed, "start-end" (end exclusive, may wrap past midnight); empty = any time
+QUESTION_BANK_WARM_HOURS = os.environ.get("QUESTION_BANK_WARM_HOURS", "2-6")
+# Seconds between warm passes (one per host), and between demand flushes / pool index refreshes per worker
+QUESTION_BANK_WARM_INTERVAL = _env_float("QUESTION_BANK_WARM_INTERVAL", 3600.0)
+QUESTION_BANK_TICK = _env_float("QUESTION_BANK_TICK", 60.0)
+# Most requested combinations warmed per pass, and the demand a combination needs to be warmed at all
+QUESTION_BANK_WARM_TOP = _env_int("QUESTION_BANK_WARM_TOP", 50)
+QUESTION_BANK_MIN_REQUESTS = _env_float("QUESTION_BANK_MIN_REQUESTS", 5.0)
+# Pool size = requests * QUESTION_BANK_QUESTIONS_PER_REQUEST, clamped to [MIN_SIZE, MAX_SIZE]
+QUESTION_BANK_QUESTIONS_PER_REQUEST = _env_float("QUESTION_BANK_QUESTIONS_PER_REQUEST", 2.0)
+QUESTION_BANK_MIN_SIZE = _env_int("QUESTION_BANK_MIN_SIZE", 30)
+QUESTION_BANK_MAX_SIZE = _env_int("QUESTION_BANK_MAX_SIZE", 300)
+# Demand is multiplied by this after each warm pass, so pools follow recent traffic
+QUESTION_BANK_DEMAND_DECAY = _env_float("QUESTION_BANK_DEMAND_DECAY", 0.5)
+# Questions per OpenRouter call while filling, and the cap on calls per warm pass
+QUESTION_BANK_BATCH_SIZE = _env_int("QUESTION_BANK_BATCH_SIZE", 10)
+QUESTION_BANK_MAX_CALLS = _env_int("QUESTION_BANK_MAX_CALLS", 200)
+# A quiz of N questions is only sampled when the pool holds N * factor questions the user has not seen
+QUESTION_BANK_MIN_POOL_FACTOR = _env_float("QUESTION_BANK_MIN_POOL_FACTOR", 3.0)
+# Seconds a question served to a user is kept out of their later samples (per worker)
+QUESTION_BANK_REPEAT_WINDOW = _env_float("QUESTION_BANK_REPEAT_WINDOW", 86400.0)
+# Seconds a loaded pool is kept in worker memory
+QUESTION_BANK_POOL_TTL = _env_float("QUESTION_BANK_POOL_TTL", 300.0)
+
+# Question-level near-duplicate index over generated_quizzes (see question_index.py; memory grows with the table)
+QUESTION_INDEX_ENABLED = _env_bool("QUESTION_INDEX_ENABLED", False)
+# MinHash functions per stem, split into LSH bands (permutations must be a multiple of bands)
+QUESTION_INDEX_PERMUTATIONS = _env_int("QUESTION_INDEX_PERMUTATIONS", 32)
+QUESTION_INDEX_BANDS = _env_int("QUESTION_INDEX_BANDS", 8)
+# Seconds between incremental syncs, and rows read per query
+QUESTION_INDEX_REFRESH_INTERVAL = _env_float("QUESTION_INDEX_REFRESH_INTERVAL", 60.0)
+QUESTION_INDEX_PAGE_SIZE = _env_int("QUESTION_INDEX_PAGE_SIZE", 1000)
+# Seconds a dedup report is cached per worker
+QUESTION_INDEX_REPORT_TTL = _env_float("QUESTION_INDEX_REPORT_TTL", 600.0)
+
+# Quiz content storage: "inline" (whole JSON on each generated_quizzes row) or "compact"
+# (shared compressed blobs in quiz_contents; needs migrations/006_compact_quiz_storage.sql)
+QUIZ_STORAGE = os.environ.get("QUIZ_STORAGE", "inline").lower()
+# Decoded quiz contents cached per worker for readers
+QUIZ_STORAGE_CACHE_SIZE = _env_int("QUIZ_STORAGE_CACHE_SIZE", 5000)
@@ -0,0 +1,110 @@
+# Admin dashboard statistics: concurrent counts, a short-TTL cache and daily rollups
+import asyncio
+from datetime import datetime, timedelta, timezone
+from cache import MISSING, TTLCache
+from singleflight import SingleFlight
+from supabase_pool import execute, get_supabase_pool
+import config
+
+# Dashboard figure -> (table, optional equality filter, admin_counters name)
+COUNTS = {
+    "total_users": ("users", None, "users"),
+    "active_api_keys": ("user_api_keys", ("status", "active"), "user_api_keys.active"),
+    "total_quizzes": ("generated_quizzes", None, "generated_quizzes"),
+    "total_openrouter_keys": ("openrouter_api_keys", None, "openrouter_api_keys"),
+}
+COUNT_MODES = ("exact", "planned", "estimated", "counters")
+ROLLUP_PAGE_SIZE = 1000
+
+_cache = TTLCache(maxsize=64, ttl=config.DASHBOARD_STATS_TTL)
+_flights = SingleFlight()
+
+async def _count(table: str, where, mode: str) -> int:
+    # limit(1): only the Content-Range total is wanted, not the ids
+    async with get_supabase_pool().connection() as db:
+        query = db.table(table).select('id', count=mode)
+        if where:
+            query = query.eq(*where)
+        response = await execute(query.limit(1))
+    return response.count if response.count is not None else 0
+
+async def _counts_from_counters() -> dict:
+    # One read of the trigger-maintained counters (migrations/004_dashboard_rollups.sql);
+    # any counter that is missing falls back to an exact count
+    async with get_supabase_pool().connection() as db:
+        rows = (await execute(db.table('admin_counters').select('name, value'))).data
+    values = {row['name']: row['value'] for row in rows}
+    missing = [name for name, (_, _, counter) in COUNTS.items() if counter not in values]
+    exact = await asyncio.gather(*(_count(COUNTS[name][0], COUNTS[name][1], "exact") for name in missing))
+    result = {name: values.get(counter, 0) for name, (_, _, counter) in COUNTS.items()}
+    result.update(zip(missing, exact))
+    return result
+
+async def _compute_counts(mode: str) -> dict:
+    if mode == "counters":
+        return await _counts_from_counters()
+    totals = await asyncio.gather(*(_count(table, where, mode) for table, where, _ in COUNTS.values()))
+    return dict(zip(COUNTS, totals))
+
+async def _cached(key, compute):
+    value = _cache.get(key)
+    if value is MISSING:
+        # Concurrent dashboard loads share one computation
+        value, _ = await _flights.do(key, compute)
+        _cache.set(key, value)
+    return value
+
+async def get_counts(mode: str = None, refresh: bool = False) -> dict:
+    """Dashboard totals, computed concurrently and cached for DASHBOARD_STATS_TTL seconds.
+
+    `mode` is "exact", "planned" / "estimated" (PostgREST count estimates,
+    cheap on large tables) or "counters" (trigger-maintained counts).
+    """
+    mode = mode or config.DASHBOARD_COUNT_MODE
+    if mode not in COUNT_MODES:
+        raise ValueError(f"Unknown count mode: {mode}")
+    if refresh:
+        _cache.delete(("counts", mode))
+    return await _cached(("counts", mode), lambda: _compute_counts(mode))
+
+async def _rollup_rows(since: str) -> list:
+    rows = []
+    async with get_supabase_pool().connection() as db:
+        while True:
+            # Primary key order, so the pages neither overlap nor skip rows
+            # .range() is inclusive at both ends
+            query = db.table('usage_daily_rollup').select('*').gte('day', since)\
+                .order('day,user_type,model_name')\
+                .range(len(rows), len(rows) + ROLLUP_PAGE_SIZE - 1)
+            page = (await execute(query)).data
+            rows.extend(page)
+            if len(page) < ROLLUP_PAGE_SIZE:
+                return rows
+
+def _add(totals: dict, key: str, row: dict):
+    entry = totals.setdefault(key, {"requests": 0, "quizzes": 0, "cached": 0, "total_tokens": 0})
+    for field in entry:
+        entry[field] += row.get(field) or 0
+
+async def _compute_rollup(days: int) -> dict:
+    since = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+    per_day, per_tier, per_model = {}, {}, {}
+    for row in await _rollup_rows(since):
+        _add(per_day, row['day'], row)
+        _add(per_tier, row['user_type'] or 'unknown', row)
+        _add(per_model, row['model_name'] or 'unknown', row)
+    return {
+        "since": since,
+        "per_day": [{"day": day, **totals} for day, totals in sorted(per_day.items())],
+        "per_tier": per_tier,
+        "per_model": per_model,
+    }
+
+async def get_rollup(days: int, refresh: bool = False) -> dict:
+    """Requests, quizzes, cache hits and tokens per day, tier and model over the last `days` days."""
+    if refresh:
+        _cache.delete(("rollup", days))
+    return await _cached(("rollup", days), lambda: _compute_rollup(days))
+
+def stats() -> dict:
+    return {"cache": _cache.stats(), "singleflight": _flights.stats()}
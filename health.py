@@ -0,0 +1,155 @@
+# Admin health probes: concurrent, deadline-bound, briefly cached, with latency history
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Dict, Optional
+from api_config import get_api_config
+from cache import MISSING, TTLCache
+from model_router import _percentile
+from openrouter_client import get_openrouter_client
+from singleflight import SingleFlight
+from supabase_pool import execute, get_supabase_pool
+import config
+
+logger = logging.getLogger(__name__)
+
+# Known table names only; probed with a one-row select
+TABLES = ['users', 'user_api_keys', 'openrouter_api_keys', 'models', 'generated_quizzes', 'usage_limits', 'usage_logs']
+
+PROMPTS = {
+    "easy": "What is 2+2?",
+    "medium": "Explain the process of photosynthesis in a paragraph.",
+    "hard": "Write a Python function to compute the nth Fibonacci number recursively and explain its time complexity.",
+    "extreme": "Generate a detailed, step-by-step solution to a complex calculus problem involving integration by parts, and provide a LaTeX-formatted answer."
+}
+PROMPT_MODEL = "openai/gpt-3.5-turbo"
+
+_cache = TTLCache(maxsize=16, ttl=config.HEALTH_CACHE_TTL)
+_flights = SingleFlight()
+# probe name -> deque of (unix time, latency_ms, ok)
+_history: Dict[str, deque] = {}
+_prober_task: Optional[asyncio.Task] = None
+
+def _record(name: str, latency_ms: float, ok: bool):
+    samples = _history.get(name)
+    if samples is None:
+        samples = _history[name] = deque(maxlen=config.HEALTH_HISTORY_SIZE)
+    samples.append((time.time(), latency_ms, ok))
+
+async def probe(name: str, check: Callable[[], Awaitable[None]], deadline: float) -> dict:
+    """Run `check` within `deadline` seconds; it signals failure by raising."""
+    start = time.monotonic()
+    try:
+        await asyncio.wait_for(check(), timeout=deadline)
+        result = {"status": "ok"}
+    except asyncio.TimeoutError:
+        result = {"status": "error", "error": f"Timed out after {deadline:g}s"}
+    except Exception as e:
+        result = {"status": "error", "error": str(e)}
+    latency_ms = (time.monotonic() - start) * 1000
+    _record(name, latency_ms, result["status"] == "ok")
+    return {"status": result["status"], "latency_ms": round(latency_ms, 2), **result}
+
+async def _select_one(table: str):
+    # On a probe timeout the query thread runs on to SUPABASE_QUERY_TIMEOUT, holding its pool client
+    async with get_supabase_pool().connection() as db:
+        await execute(db.table(table).select('id').limit(1))
+
+async def _openrouter_models():
+    resp = await get_openrouter_client().get("/models", timeout=config.HEALTH_PROBE_TIMEOUT)
+    if resp.status_code != 200:
+        raise RuntimeError(f"Status {resp.status_code}")
+
+async def _system() -> dict:
+    deadline = config.HEALTH_PROBE_TIMEOUT
+    database, openrouter = await asyncio.gather(
+        probe("database", lambda: _select_one('users'), deadline),
+        probe("openrouter", _openrouter_models, deadline),
+    )
+    return {"database": database, "openrouter": openrouter}
+
+async def _tables() -> list:
+    results = await asyncio.gather(*(
+        probe(f"table:{table}", lambda table=table: _select_one(table), config.HEALTH_PROBE_TIMEOUT)
+        for table in TABLES
+    ))
+    return [{"table": table, **result} for table, result in zip(TABLES, results)]
+
+async def _prompts() -> list:
+    snapshot = await get_api_config()
+    api_key = snapshot.openrouter_api_key
+    if not api_key:
+        raise RuntimeError("No OpenRouter API key found in database.")
+
+    async def complete(prompt: str):
+        resp = await get_openrouter_client().post(
+            "/chat/completions",
+            json={"model": PROMPT_MODEL, "messages": [{"role": "user", "content": prompt}]},
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=config.HEALTH_PROMPT_TIMEOUT,
+        )
+        if resp.status_code != 200:
+            raise RuntimeError(f"Status {resp.status_code}: {resp.text}")
+
+    results = await asyncio.gather(*(
+        probe(f"prompt:{level}", lambda prompt=prompt: complete(prompt), config.HEALTH_PROMPT_TIMEOUT)
+        for level, prompt in PROMPTS.items()
+    ))
+    return [{"level": level, **result, "prompt": prompt} for (level, prompt), result in zip(PROMPTS.items(), results)]
+
+async def _cached(key: str, compute, ttl: float, refresh: bool):
+    value = MISSING if refresh else _cache.get(key)
+    if value is MISSING:
+        # Dashboard refreshes that arrive together share one round of probes
+        value, _ = await _flights.do(key, compute)
+        _cache.set(key, value, ttl)
+    return value
+
+async def system_health(refresh: bool = False) -> dict:
+    return await _cached("system", _system, config.HEALTH_CACHE_TTL, refresh)
+
+async def tables_health(refresh: bool = False) -> list:
+    return await _cached("tables", _tables, config.HEALTH_CACHE_TTL, refresh)
+
+async def prompts_health(refresh: bool = False) -> list:
+    # Real completions cost tokens: cached for longer and never run by the background prober
+    return await _cached("prompts", _prompts, config.HEALTH_PROMPT_CACHE_TTL, refresh)
+
+def history() -> dict:
+    """Per-probe latency percentiles and error counts over the recorded samples."""
+    summary = {}
+    for name, samples in sorted(_history.items()):
+        latencies = [latency for _, latency, _ in samples]
+        summary[name] = {
+            "samples": len(samples),
+            "errors": sum(1 for _, _, ok in samples if not ok),
+            "p50_ms": round(_percentile(latencies, 0.5), 2),
+            "p95_ms": round(_percentile(latencies, 0.95), 2),
+            "last": {"at": samples[-1][0], "latency_ms": round(samples[-1][1], 2), "ok": samples[-1][2]},
+        }
+    return summary
+
+async def _probe_loop(interval: float):
+    while True:
+        try:
+            # Fresh probes; their results also refill the dashboard cache
+            await asyncio.gather(system_health(refresh=True), tables_health(refresh=True))
+        except Exception as e:
+            logger.error(f"Background health probe failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+def start_health_prober():
+    global _prober_task
+    if config.HEALTH_PROBE_INTERVAL > 0 and _prober_task is None:
+        _prober_task = asyncio.get_running_loop().create_task(_probe_loop(config.HEALTH_PROBE_INTERVAL))
+
+async def stop_health_prober():
+    global _prober_task
+    if _prober_task is not None:
+        _prober_task.cancel()
+        try:
+            await _prober_task
+        except asyncio.CancelledError:
+            pass
+        _prober_task = None
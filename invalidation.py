@@ -0,0 +1,130 @@
+# Cross-worker cache invalidation
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import config
+
+logger = logging.getLogger(__name__)
+
+class LocalInvalidationBus:
+    """No shared backend: invalidations only reach the current worker."""
+
+    def publish(self, channel: str, key: Optional[str]):
+        pass
+
+    def latest_id(self) -> int:
+        return 0
+
+    def poll(self, since_id: int) -> Tuple[int, List[Tuple[str, Optional[str]]]]:
+        return since_id, []
+
+class SqliteInvalidationBus:
+    """Invalidation log in a SQLite file shared by all workers on the host."""
+
+    def __init__(self, path: str, retention_seconds: float = 600.0):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS invalidations ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, "
+                "cache_key TEXT, created_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def publish(self, channel: str, key: Optional[str]):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO invalidations (channel, cache_key, created_at) VALUES (?, ?, ?)",
+                (channel, key, now),
+            )
+            conn.execute("DELETE FROM invalidations WHERE created_at < ?", (now - self.retention_seconds,))
+        conn.close()
+
+    def latest_id(self) -> int:
+        with self._connect() as conn:
+            row = conn.execute("SELECT COALESCE(MAX(id), 0) FROM invalidations").fetchone()
+        conn.close()
+        return row[0]
+
+    def poll(self, since_id: int) -> Tuple[int, List[Tuple[str, Optional[str]]]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, channel, cache_key FROM invalidations WHERE id > ? ORDER BY id",
+                (since_id,),
+            ).fetchall()
+        conn.close()
+        if not rows:
+            return since_id, []
+        return rows[-1][0], [(channel, key) for _, channel, key in rows]
+
+def create_invalidation_bus():
+    if config.CACHE_INVALIDATION_BACKEND == "sqlite":
+        return SqliteInvalidationBus(os.path.join(config.STATE_DIR, "invalidation.db"))
+    return LocalInvalidationBus()
+
+_bus = None
+_subscribers: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+_listener_task: Optional[asyncio.Task] = None
+
+def get_invalidation_bus():
+    global _bus
+    if _bus is None:
+        _bus = create_invalidation_bus()
+    return _bus
+
+def subscribe(channel: str, callback: Callable[[Optional[str]], None]):
+    """Register a callback run with the invalidated key (None means everything)."""
+    _subscribers.setdefault(channel, []).append(callback)
+
+def _dispatch(channel: str, key: Optional[str]):
+    for callback in _subscribers.get(channel, []):
+        try:
+            callback(key)
+        except Exception as e:
+            logger.error(f"Invalidation callback for {channel} failed: {str(e)}")
+
+async def publish(channel: str, key: Optional[str] = None):
+    # Apply locally right away, then tell the other workers
+    _dispatch(channel, key)
+    try:
+        await asyncio.to_thread(get_invalidation_bus().publish, channel, key)
+    except Exception as e:
+        logger.error(f"Failed to publish invalidation for {channel}: {str(e)}")
+
+async def _listen(interval: float):
+    bus = get_invalidation_bus()
+    last_id = await asyncio.to_thread(bus.latest_id)
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            last_id, events = await asyncio.to_thread(bus.poll, last_id)
+        except Exception as e:
+            logger.error(f"Failed to poll cache invalidations: {str(e)}")
+            continue
+        for channel, key in events:
+            _dispatch(channel, key)
+
+def start_invalidation_listener():
+    global _listener_task
+    if _listener_task is None and config.CACHE_INVALIDATION_BACKEND == "sqlite":
+        _listener_task = asyncio.create_task(_listen(config.CACHE_INVALIDATION_POLL_INTERVAL))
+
+async def stop_invalidation_listener():
+    global _listener_task
+    if _listener_task is not None:
+        _listener_task.cancel()
+        try:
+            await _listener_task
+        except asyncio.CancelledError:
+            pass
+        _listener_task = None
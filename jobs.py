@@ -0,0 +1,381 @@
+# Background job queue for quiz generation
+import asyncio
+import ipaddress
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Optional
+import httpx
+import config
+from quiz_service import verify_user, run_quiz_pipeline, QuizGenerationError
+from tracing import trace_id
+
+logger = logging.getLogger(__name__)
+
+JOB_COLUMNS = (
+    "id", "status", "user_api_key", "params", "bypass_cache", "callback_url",
+    "result", "error", "attempts", "created_at", "started_at", "finished_at", "lease_until"
+)
+
+def _new_job(user_api_key: str, params: dict, bypass_cache: bool, callback_url: Optional[str]) -> dict:
+    return {
+        "id": uuid.uuid4().hex,
+        "status": "queued",
+        "user_api_key": user_api_key,
+        "params": params,
+        "bypass_cache": bypass_cache,
+        "callback_url": callback_url,
+        "result": None,
+        "error": None,
+        "attempts": 0,
+        "created_at": time.time(),
+        "started_at": None,
+        "finished_at": None,
+        "lease_until": None,
+    }
+
+async def check_callback_url(url: str) -> Optional[str]:
+    """Why `url` may not be used as a job callback, or None if it may.
+
+    Callbacks are POSTed from inside our network, so unless the host is in
+    JOB_CALLBACK_ALLOWED_HOSTS every address it resolves to must be public
+    (no loopback, private, link-local or reserved ranges).
+    """
+    try:
+        parsed = httpx.URL(url)
+    except Exception:
+        return "callback_url is not a valid URL"
+    if parsed.scheme not in ("http", "https") or not parsed.host:
+        return "callback_url must be an http(s) URL"
+    host = parsed.host.lower()
+    if config.JOB_CALLBACK_ALLOWED_HOSTS:
+        return None if host in config.JOB_CALLBACK_ALLOWED_HOSTS else "callback_url host is not allowed"
+    try:
+        infos = await asyncio.get_running_loop().getaddrinfo(
+            host, parsed.port or (443 if parsed.scheme == "https" else 80), type=socket.SOCK_STREAM
+        )
+    except OSError:
+        return "callback_url host does not resolve"
+    for *_, sockaddr in infos:
+        # Scoped IPv6 addresses carry a "%zone" suffix
+        if not ipaddress.ip_address(sockaddr[0].split("%")[0]).is_global:
+            return "callback_url must point to a public address"
+    return None
+
+class MemoryJobStore:
+    """Per-process job store; jobs are lost on restart and not shared between workers."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, user_api_key: str, params: dict, bypass_cache: bool, callback_url: Optional[str]) -> dict:
+        job = _new_job(user_api_key, params, bypass_cache, callback_url)
+        with self._lock:
+            self._jobs[job["id"]] = job
+        return dict(job)
+
+    def claim(self, lease_seconds: float, max_attempts: int) -> Optional[dict]:
+        now = time.time()
+        with self._lock:
+            for job in sorted(self._jobs.values(), key=lambda j: j["created_at"]):
+                expired = job["status"] == "running" and job["lease_until"] < now
+                if job["status"] == "queued" or expired:
+                    if job["attempts"] >= max_attempts:
+                        job.update(status="failed", error="Too many attempts", finished_at=now)
+                        continue
+                    job.update(status="running", attempts=job["attempts"] + 1,
+                               started_at=now, lease_until=now + lease_seconds)
+                    return dict(job)
+        return None
+
+    def finish(self, job_id: str, status: str, result: Optional[dict], error: Optional[str]):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                job.update(status=status, result=result, error=error, finished_at=time.time())
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def purge(self, older_than: float) -> int:
+        with self._lock:
+            stale = [jid for jid, job in self._jobs.items()
+                     if job["finished_at"] is not None and job["finished_at"] < older_than]
+            for jid in stale:
+                del self._jobs[jid]
+        return len(stale)
+
+    def counts(self) -> dict:
+        with self._lock:
+            counts = {}
+            for job in self._jobs.values():
+                counts[job["status"]] = counts.get(job["status"], 0) + 1
+            return counts
+
+class SqliteJobStore:
+    """Job store in a SQLite file, shared by all workers on the host and kept across restarts."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, status TEXT NOT NULL, user_api_key TEXT NOT NULL, "
+                "params TEXT NOT NULL, bypass_cache INTEGER NOT NULL DEFAULT 0, callback_url TEXT, "
+                "result TEXT, error TEXT, attempts INTEGER NOT NULL DEFAULT 0, "
+                "created_at REAL NOT NULL, started_at REAL, finished_at REAL, lease_until REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created_idx ON jobs (status, created_at)")
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=10.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _row_to_job(row) -> dict:
+        job = dict(zip(JOB_COLUMNS, row))
+        job["params"] = json.loads(job["params"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        job["bypass_cache"] = bool(job["bypass_cache"])
+        return job
+
+    def enqueue(self, user_api_key: str, params: dict, bypass_cache: bool, callback_url: Optional[str]) -> dict:
+        job = _new_job(user_api_key, params, bypass_cache, callback_url)
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT INTO jobs (id, status, user_api_key, params, bypass_cache, callback_url, attempts, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, 0, ?)",
+                (job["id"], job["status"], user_api_key, json.dumps(params), int(bypass_cache), callback_url, job["created_at"]),
+            )
+        finally:
+            conn.close()
+        return job
+
+    def claim(self, lease_seconds: float, max_attempts: int) -> Optional[dict]:
+        now = time.time()
+        conn = self._connect()
+        try:
+            # BEGIN IMMEDIATE takes the write lock, so two workers never claim the same job
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', error = 'Too many attempts', finished_at = ? "
+                "WHERE status = 'running' AND lease_until < ? AND attempts >= ?",
+                (now, now, max_attempts),
+            )
+            row = conn.execute(
+                f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs "
+                "WHERE status = 'queued' OR (status = 'running' AND lease_until < ?) "
+                "ORDER BY created_at LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            job = self._row_to_job(row)
+            job.update(status="running", attempts=job["attempts"] + 1, started_at=now, lease_until=now + lease_seconds)
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = ?, started_at = ?, lease_until = ? WHERE id = ?",
+                (job["attempts"], now, job["lease_until"], job["id"]),
+            )
+            conn.execute("COMMIT")
+            return job
+        except Exception:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def finish(self, job_id: str, status: str, result: Optional[dict], error: Optional[str]):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, lease_until = NULL WHERE id = ?",
+                (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+            )
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> Optional[dict]:
+        conn = self._connect()
+        try:
+            row = conn.execute(f"SELECT {', '.join(JOB_COLUMNS)} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_job(row) if row else None
+
+    def purge(self, older_than: float) -> int:
+        conn = self._connect()
+        try:
+            cursor = conn.execute("DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (older_than,))
+            return cursor.rowcount
+        finally:
+            conn.close()
+
+    def counts(self) -> dict:
+        conn = self._connect()
+        try:
+            return dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall())
+        finally:
+            conn.close()
+
+def create_job_store():
+    if config.JOB_STORE_BACKEND == "memory":
+        return MemoryJobStore()
+    return SqliteJobStore(os.path.join(config.STATE_DIR, "jobs.db"))
+
+def job_view(job: dict) -> dict:
+    # Public representation of a job (no API key, no internal lease fields)
+    return {
+        "job_id": job["id"],
+        "status": job["status"],
+        "result": job["result"],
+        "error": job["error"],
+        "attempts": job["attempts"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+
+class JobQueue:
+    def __init__(self, store, concurrency: int):
+        self.store = store
+        self.concurrency = concurrency
+        self._wakeup = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        self._http: Optional[httpx.AsyncClient] = None
+        self._last_purge = 0.0
+
+    async def submit(self, user_api_key: str, params: dict, bypass_cache: bool = False, callback_url: Optional[str] = None) -> dict:
+        job = await asyncio.to_thread(self.store.enqueue, user_api_key, params, bypass_cache, callback_url)
+        self._wakeup.set()
+        return job
+
+    async def get(self, job_id: str) -> Optional[dict]:
+        return await asyncio.to_thread(self.store.get, job_id)
+
+    async def start(self):
+        self._http = httpx.AsyncClient(timeout=config.JOB_CALLBACK_TIMEOUT)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._workers:
+            task.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+    async def _next_job(self) -> dict:
+        while True:
+            job = await asyncio.to_thread(self.store.claim, config.JOB_LEASE_SECONDS, config.JOB_MAX_ATTEMPTS)
+            if job is not None:
+                return job
+            await self._maybe_purge()
+            # Sleep until a local submit or the poll interval (jobs from other workers)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=config.JOB_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _maybe_purge(self):
+        now = time.time()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        try:
+            await asyncio.to_thread(self.store.purge, now - config.JOB_RETENTION_SECONDS)
+        except Exception as e:
+            logger.error(f"Failed to purge finished jobs: {str(e)}")
+
+    async def _worker(self):
+        while True:
+            try:
+                job = await self._next_job()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Failed to claim job: {str(e)}")
+                await asyncio.sleep(config.JOB_POLL_INTERVAL)
+                continue
+            # Log lines of the job carry its ID as the trace ID
+            token = trace_id.set(job["id"])
+            try:
+                await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the worker alive; the job's lease expires and it is retried up to JOB_MAX_ATTEMPTS
+                logger.error(f"Job {job['id']} crashed the worker loop: {str(e)}")
+            finally:
+                trace_id.reset(token)
+
+    async def _run(self, job: dict):
+        # The job body is the regular pipeline: verify -> prompt -> config -> call -> save
+        try:
+            user_type = await verify_user(job["user_api_key"])
+            result = await run_quiz_pipeline(
+                job["user_api_key"], job["params"], bypass_cache=job["bypass_cache"],
+                user_type=user_type, endpoint="jobs"
+            )
+            status, payload, error = "succeeded", {"quiz_content": result.quiz_content, "questions": result.questions}, None
+        except QuizGenerationError as e:
+            status, payload, error = "failed", None, e.detail
+        except Exception as e:
+            logger.error(f"Job {job['id']} failed: {str(e)}")
+            status, payload, error = "failed", None, "Failed to generate quiz from API"
+        await asyncio.to_thread(self.store.finish, job["id"], status, payload, error)
+        job.update(status=status, result=payload, error=error, finished_at=time.time())
+        if job["callback_url"]:
+            await self._callback(job)
+
+    async def _callback(self, job: dict):
+        # Checked again at call time: the host may resolve differently than at submit
+        reason = await check_callback_url(job["callback_url"])
+        if reason is not None:
+            logger.warning(f"Skipping callback for job {job['id']}: {reason}")
+            return
+        for attempt in range(3):
+            try:
+                response = await self._http.post(job["callback_url"], json=job_view(job))
+                if response.status_code < 500:
+                    return
+            except httpx.HTTPError as e:
+                logger.warning(f"Callback for job {job['id']} failed: {str(e)}")
+            except Exception as e:
+                # e.g. httpx.InvalidURL, which is not an HTTPError; retrying will not help
+                logger.error(f"Callback for job {job['id']} failed: {str(e)}")
+                return
+            await asyncio.sleep(2 ** attempt)
+        logger.error(f"Giving up on callback for job {job['id']}")
+
+_queue: Optional[JobQueue] = None
+
+def get_job_queue() -> JobQueue:
+    global _queue
+    if _queue is None:
+        _queue = JobQueue(create_job_store(), config.JOB_WORKER_CONCURRENCY)
+    return _queue
+
+async def start_job_workers():
+    if config.JOB_WORKER_CONCURRENCY > 0:
+        await get_job_queue().start()
+
+async def stop_job_workers():
+    if _queue is not None:
+        await _queue.stop()
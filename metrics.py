@@ -0,0 +1,181 @@
+# In-process metrics rendered in the Prometheus text exposition format
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+# Latency buckets in seconds: sub-millisecond cache hits up to multi-minute generations
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    """Monotonic count per label set. Only touched from the event loop, so no locking."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in self._values.items()]
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, *labels, value: float):
+        self._values[labels] = value
+
+    def dec(self, *labels, amount: float = 1):
+        self.inc(*labels, amount=-amount)
+
+class CallbackGauge(_Metric):
+    """Gauge (or counter) read at scrape time from existing stats, e.g. cache hit counts."""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str], collect: Callable[[], Iterable[Tuple[tuple, float]]],
+                 kind: str = "gauge"):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self._collect = collect
+
+    def render(self) -> List[str]:
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in self._collect()]
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # labels -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[tuple, list] = {}
+
+    def observe(self, *labels, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total) in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.render()
+            except Exception:
+                # A broken stats callback must not take the whole scrape down
+                continue
+            lines.extend(metric.header())
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "quiz_http_requests_total", "HTTP requests by route and status code.", ("method", "route", "status")))
+http_request_duration = registry.register(Histogram(
+    "quiz_http_request_duration_seconds", "HTTP request duration by route.", ("method", "route")))
+http_in_flight = registry.register(Gauge(
+    "quiz_http_requests_in_flight", "HTTP requests currently being served."))
+stage_duration = registry.register(Histogram(
+    "quiz_stage_duration_seconds", "Duration of each quiz request stage.", ("stage",)))
+openrouter_requests = registry.register(Counter(
+    "quiz_openrouter_requests_total", "OpenRouter completion calls by model and outcome.", ("model", "outcome")))
+upstream_tokens = registry.register(Counter(
+    "quiz_upstream_tokens_total", "Tokens reported by OpenRouter, by model and kind.", ("model", "kind")))
+quiz_errors = registry.register(Counter(
+    "quiz_errors_total", "Quiz requests that failed, by status code.", ("status",)))
+
+# name -> stats() of a cache with "hits" / "misses" counters (see cache.TTLCache.stats)
+_caches: Dict[str, Callable[[], dict]] = {}
+# name -> callable returning how many of something are in flight right now
+_in_flight: Dict[str, Callable[[], float]] = {}
+
+def watch_cache(name: str, stats: Callable[[], dict]):
+    _caches[name] = stats
+
+def watch_in_flight(name: str, count: Callable[[], float]):
+    _in_flight[name] = count
+
+def _cache_lookups():
+    for name, stats in _caches.items():
+        values = stats()
+        yield (name, "hit"), values["hits"]
+        yield (name, "miss"), values["misses"]
+
+registry.register(CallbackGauge(
+    "quiz_cache_lookups_total", "Cache lookups by cache and result (hit ratio = hit / (hit + miss)).",
+    ("cache", "result"), _cache_lookups, kind="counter"))
+registry.register(CallbackGauge(
+    "quiz_in_flight", "Work currently in flight or queued, by kind.",
+    ("kind",), lambda: (((name,), count()) for name, count in _in_flight.items())))
+
+class stage:
+    """`with stage("verify_api_key"):` records the block's duration in quiz_stage_duration_seconds.
+
+    A plain class rather than @contextmanager: this sits on the hot path.
+    """
+    __slots__ = ("name", "started")
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        stage_duration.observe(self.name, value=time.perf_counter() - self.started)
+        return False
+
+def record_openrouter_call(model: str, outcome: str, usage=None):
+    openrouter_requests.inc(model, outcome)
+    if isinstance(usage, dict):
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if isinstance(usage.get(kind), (int, float)):
+                upstream_tokens.inc(model, kind, amount=usage[kind])
@@ -0,0 +1,7 @@
+-- Persistent tier of the quiz response cache (QUIZ_CACHE_PERSISTENT=true)
+alter table generated_quizzes add column if not exists prompt_hash text;
+alter table generated_quizzes add column if not exists model_name text;
+
+create index if not exists generated_quizzes_prompt_hash_idx
+    on generated_quizzes (prompt_hash, generated_at desc)
+    where prompt_hash is not null;
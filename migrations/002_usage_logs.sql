@@ -0,0 +1,18 @@
+-- Per-request usage rows written by the write-behind buffer (USAGE_LOGS_ENABLED=true)
+create table if not exists usage_logs (
+    id uuid primary key default gen_random_uuid(),
+    created_at timestamptz not null default now()
+);
+
+alter table usage_logs add column if not exists user_api_key text;
+alter table usage_logs add column if not exists user_type text;
+alter table usage_logs add column if not exists endpoint text;
+alter table usage_logs add column if not exists status text;
+alter table usage_logs add column if not exists model_name text;
+alter table usage_logs add column if not exists cached boolean not null default false;
+alter table usage_logs add column if not exists prompt_tokens integer not null default 0;
+alter table usage_logs add column if not exists completion_tokens integer not null default 0;
+alter table usage_logs add column if not exists total_tokens integer not null default 0;
+alter table usage_logs add column if not exists latency_ms double precision;
+
+create index if not exists usage_logs_created_at_idx on usage_logs (created_at desc);
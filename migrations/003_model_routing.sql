@@ -0,0 +1,6 @@
+-- Optional routing columns on models (see model_router.py); NULL means "no restriction"
+alter table models add column if not exists is_active boolean not null default true;
+alter table models add column if not exists priority integer not null default 0;
+alter table models add column if not exists tiers text[];
+alter table models add column if not exists min_questions integer;
+alter table models add column if not exists max_questions integer;
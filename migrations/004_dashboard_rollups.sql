@@ -0,0 +1,128 @@
+-- Precomputed admin dashboard aggregates (DASHBOARD_COUNT_MODE=counters and
+-- GET /api/admin/dashboard-stats/rollup). Triggers are statement-level, so a
+-- bulk insert from the write-behind buffer updates each counter once.
+
+-- Row counters ------------------------------------------------------------
+
+create table if not exists admin_counters (
+    name text primary key,
+    value bigint not null default 0
+);
+
+create or replace function admin_counter_add(counter text, delta bigint) returns void
+language sql as $$
+    insert into admin_counters (name, value) values (counter, delta)
+    on conflict (name) do update set value = admin_counters.value + excluded.value;
+$$;
+
+create or replace function admin_count_rows() returns trigger
+language plpgsql as $$
+begin
+    if TG_OP = 'INSERT' then
+        perform admin_counter_add(TG_TABLE_NAME, (select count(*) from new_rows));
+    elsif TG_OP = 'DELETE' then
+        perform admin_counter_add(TG_TABLE_NAME, -(select count(*) from old_rows));
+    end if;
+    return null;
+end $$;
+
+create or replace function admin_count_active_keys() returns trigger
+language plpgsql as $$
+declare
+    delta bigint := 0;
+begin
+    if TG_OP in ('INSERT', 'UPDATE') then
+        delta := delta + (select count(*) from new_rows where status = 'active');
+    end if;
+    if TG_OP in ('UPDATE', 'DELETE') then
+        delta := delta - (select count(*) from old_rows where status = 'active');
+    end if;
+    if delta <> 0 then
+        perform admin_counter_add('user_api_keys.active', delta);
+    end if;
+    return null;
+end $$;
+
+do $$
+declare
+    t text;
+begin
+    foreach t in array array['users', 'user_api_keys', 'generated_quizzes', 'openrouter_api_keys'] loop
+        execute format('drop trigger if exists admin_count_insert on %I', t);
+        execute format('create trigger admin_count_insert after insert on %I
+            referencing new table as new_rows for each statement execute function admin_count_rows()', t);
+        execute format('drop trigger if exists admin_count_delete on %I', t);
+        execute format('create trigger admin_count_delete after delete on %I
+            referencing old table as old_rows for each statement execute function admin_count_rows()', t);
+    end loop;
+end $$;
+
+drop trigger if exists admin_count_active_insert on user_api_keys;
+create trigger admin_count_active_insert after insert on user_api_keys
+    referencing new table as new_rows for each statement execute function admin_count_active_keys();
+drop trigger if exists admin_count_active_update on user_api_keys;
+create trigger admin_count_active_update after update on user_api_keys
+    referencing old table as old_rows new table as new_rows for each statement execute function admin_count_active_keys();
+drop trigger if exists admin_count_active_delete on user_api_keys;
+create trigger admin_count_active_delete after delete on user_api_keys
+    referencing old table as old_rows for each statement execute function admin_count_active_keys();
+
+-- (Re)seed the counters from the current tables; safe to re-run to correct drift
+insert into admin_counters (name, value)
+          select 'users', count(*) from users
+union all select 'user_api_keys', count(*) from user_api_keys
+union all select 'user_api_keys.active', count(*) from user_api_keys where status = 'active'
+union all select 'generated_quizzes', count(*) from generated_quizzes
+union all select 'openrouter_api_keys', count(*) from openrouter_api_keys
+on conflict (name) do update set value = excluded.value;
+
+-- Daily usage rollup (needs migrations/002_usage_logs.sql) ---------------------
+
+create table if not exists usage_daily_rollup (
+    day date not null,
+    user_type text not null default '',
+    model_name text not null default '',
+    requests bigint not null default 0,
+    quizzes bigint not null default 0,
+    cached bigint not null default 0,
+    total_tokens bigint not null default 0,
+    primary key (day, user_type, model_name)
+);
+
+create or replace function usage_daily_rollup_add() returns trigger
+language plpgsql as $$
+begin
+    insert into usage_daily_rollup as r (day, user_type, model_name, requests, quizzes, cached, total_tokens)
+    select (created_at at time zone 'utc')::date,
+           coalesce(user_type, ''),
+           coalesce(model_name, ''),
+           count(*),
+           count(*) filter (where status = 'success'),
+           count(*) filter (where cached),
+           coalesce(sum(total_tokens), 0)
+    from new_rows
+    group by 1, 2, 3
+    on conflict (day, user_type, model_name) do update set
+        requests = r.requests + excluded.requests,
+        quizzes = r.quizzes + excluded.quizzes,
+        cached = r.cached + excluded.cached,
+        total_tokens = r.total_tokens + excluded.total_tokens;
+    return null;
+end $$;
+
+drop trigger if exists usage_daily_rollup_insert on usage_logs;
+create trigger usage_daily_rollup_insert after insert on usage_logs
+    referencing new table as new_rows for each statement execute function usage_daily_rollup_add();
+
+-- Backfill from the existing usage_logs rows (replaces any partial rollup)
+truncate usage_daily_rollup;
+insert into usage_daily_rollup (day, user_type, model_name, requests, quizzes, cached, total_tokens)
+select (created_at at time zone 'utc')::date,
+       coalesce(user_type, ''),
+       coalesce(model_name, ''),
+       count(*),
+       count(*) filter (where status = 'success'),
+       count(*) filter (where cached),
+       coalesce(sum(total_tokens), 0)
+from usage_logs
+group by 1, 2, 3;
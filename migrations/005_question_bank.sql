@@ -0,0 +1,49 @@
+-- Pre-generated question bank (QUESTION_BANK_ENABLED=true, see question_bank.py).
+-- One pool per (topic, level, question_type, subject, exam, instruction)
+-- combination; workers add their observed request counts with
+-- question_bank_record_demand() and the off-peak warm pass fills the most
+-- requested pools up to a size derived from that demand.
+
+create table if not exists question_bank_pools (
+    pool_key text primary key,
+    -- Quiz parameters (without num_of_question) used to generate the pool
+    params jsonb not null,
+    -- Non-question fields of the generated quizzes (context, topic, ...)
+    header jsonb,
+    requests double precision not null default 0,
+    size integer not null default 0,
+    target_size integer not null default 0,
+    last_requested_at timestamptz,
+    last_warmed_at timestamptz
+);
+
+create index if not exists question_bank_pools_requests_idx on question_bank_pools (requests desc);
+
+create table if not exists question_bank (
+    id bigserial primary key,
+    pool_key text not null references question_bank_pools (pool_key) on delete cascade,
+    question jsonb not null,
+    model_name text,
+    created_at timestamptz not null default now()
+);
+
+create index if not exists question_bank_pool_key_idx on question_bank (pool_key);
+
+-- entries: [{"pool_key": ..., "params": {...}, "requests": n}, ...]
+create or replace function question_bank_record_demand(entries jsonb) returns void
+language sql as $$
+    insert into question_bank_pools (pool_key, params, requests, last_requested_at)
+    select e.pool_key, e.params, e.requests, now()
+    from jsonb_to_recordset(entries) as e(pool_key text, params jsonb, requests double precision)
+    on conflict (pool_key) do update
+        set requests = question_bank_pools.requests + excluded.requests,
+            last_requested_at = excluded.last_requested_at;
+$$;
+
+-- Run after each warm pass: pools follow recent demand, and combinations
+-- that were asked for once and never warmed eventually disappear
+create or replace function question_bank_decay(factor double precision) returns void
+language sql as $$
+    update question_bank_pools set requests = requests * factor;
+    delete from question_bank_pools where size = 0 and requests < 0.01;
+$$;
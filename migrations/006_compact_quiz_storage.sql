@@ -0,0 +1,19 @@
+-- Compact quiz content storage (QUIZ_STORAGE=compact, see quiz_storage.py).
+-- Each distinct quiz_content is stored once, zlib-compressed, under the
+-- SHA-256 of its JSON; generated_quizzes rows point at it by content_hash
+-- and leave quiz_content NULL. Convert existing rows with
+-- `python quiz_storage.py backfill` once the app runs with QUIZ_STORAGE=compact.
+
+create table if not exists quiz_contents (
+    content_hash text primary key,
+    encoding text not null,
+    body text not null,
+    -- Uncompressed JSON size in bytes
+    size integer not null,
+    created_at timestamptz not null default now()
+);
+
+alter table generated_quizzes add column if not exists content_hash text;
+alter table generated_quizzes alter column quiz_content drop not null;
+
+create index if not exists generated_quizzes_content_hash_idx on generated_quizzes (content_hash);
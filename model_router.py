@@ -0,0 +1,177 @@
+# Model routing over the 'models' table with fallback and hedged requests
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, List, Optional, Tuple, TypeVar
+import config
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+def _percentile(samples, fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class ModelHealth:
+    def __init__(self, window: int):
+        self.latencies_ms = deque(maxlen=window)
+        self.calls = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.fallback_wins = 0
+        self.degraded_until = 0.0
+
+    def p95(self) -> Optional[float]:
+        return _percentile(self.latencies_ms, 0.95) if self.latencies_ms else None
+
+class ModelRouter:
+    """Choose an ordered chain of models per request and run it.
+
+    A row of 'models' is eligible when it is active, lists the user's tier
+    in `tiers` (NULL = every tier) and the question count fits
+    `min_questions`..`max_questions` (NULL = no bound). Eligible models are
+    ordered by `priority` (or by measured p95 latency with
+    MODEL_ROUTING_STRATEGY=latency); models failing repeatedly go last for
+    MODEL_COOLDOWN seconds and the default model always closes the chain.
+    See migrations/003_model_routing.sql for the optional columns.
+    """
+
+    def __init__(self, strategy: str, window: int):
+        self.strategy = strategy
+        self.window = window
+        self._health = {}
+        self.hedges = 0
+        self.fallbacks = 0
+
+    def health(self, model: str) -> ModelHealth:
+        state = self._health.get(model)
+        if state is None:
+            state = self._health[model] = ModelHealth(self.window)
+        return state
+
+    @staticmethod
+    def _eligible(row: dict, user_type: Optional[str], question_count: int) -> bool:
+        if row.get('is_active') is False:
+            return False
+        tiers = row.get('tiers')
+        if tiers and user_type not in tiers:
+            return False
+        if row.get('min_questions') is not None and question_count < row['min_questions']:
+            return False
+        if row.get('max_questions') is not None and question_count > row['max_questions']:
+            return False
+        return True
+
+    def route(self, models: List[dict], default_model: str, user_type: Optional[str], question_count: int) -> List[str]:
+        eligible = [row for row in models if row.get('model_name') and self._eligible(row, user_type, question_count)]
+        now = time.monotonic()
+
+        def order(row: dict):
+            health = self.health(row['model_name'])
+            degraded = health.degraded_until > now
+            if self.strategy == "latency":
+                # Unmeasured models sort first so they get a sample
+                return (degraded, health.p95() or 0.0, -(row.get('priority') or 0))
+            return (degraded, -(row.get('priority') or 0), not row.get('is_default'))
+
+        chain = []
+        for row in sorted(eligible, key=order):
+            if row['model_name'] not in chain:
+                chain.append(row['model_name'])
+        chain = chain[:max(1, config.MODEL_FALLBACK_DEPTH)]
+        if default_model not in chain:
+            chain.append(default_model)
+        return chain
+
+    def record(self, model: str, latency_ms: float, ok: bool):
+        health = self.health(model)
+        health.calls += 1
+        health.latencies_ms.append(latency_ms)
+        if ok:
+            health.consecutive_failures = 0
+        else:
+            health.failures += 1
+            health.consecutive_failures += 1
+            if health.consecutive_failures >= config.MODEL_FAILURE_THRESHOLD:
+                health.degraded_until = time.monotonic() + config.MODEL_COOLDOWN
+
+    async def _timed(self, model: str, call: Callable[[str], Awaitable[Optional[T]]]) -> Optional[T]:
+        started = time.perf_counter()
+        try:
+            result = await call(model)
+        except asyncio.CancelledError:
+            # Lost a hedge race: still a (lower bound) latency sample
+            self.health(model).latencies_ms.append((time.perf_counter() - started) * 1000)
+            raise
+        except Exception as e:
+            logger.error(f"Error calling model {model}: {e}")
+            result = None
+        self.record(model, (time.perf_counter() - started) * 1000, result is not None)
+        return result
+
+    async def run(self, chain: List[str], call: Callable[[str], Awaitable[Optional[T]]],
+                  hedge_delay: float = None) -> Optional[Tuple[str, T]]:
+        """Call models from `chain` until one returns a non-None result.
+
+        A failed model falls through to the next one. When `hedge_delay`
+        seconds pass without an answer, the next model is started alongside
+        the slow one and whichever answers first wins; the other is cancelled.
+        """
+        hedge_delay = config.MODEL_HEDGE_DELAY if hedge_delay is None else hedge_delay
+        remaining = list(chain)
+        pending = {}
+
+        def launch():
+            model = remaining.pop(0)
+            pending[asyncio.ensure_future(self._timed(model, call))] = model
+
+        launch()
+        try:
+            while pending:
+                hedge = hedge_delay > 0 and remaining and len(pending) == 1
+                done, _ = await asyncio.wait(
+                    pending, timeout=hedge_delay if hedge else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    self.hedges += 1
+                    launch()
+                    continue
+                for task in done:
+                    model = pending.pop(task)
+                    result = task.result()
+                    if result is not None:
+                        if model != chain[0]:
+                            self.health(model).fallback_wins += 1
+                        return model, result
+                if not pending and remaining:
+                    self.fallbacks += 1
+                    launch()
+            return None
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {
+            "strategy": self.strategy,
+            "hedge_delay_s": config.MODEL_HEDGE_DELAY,
+            "hedges": self.hedges,
+            "fallbacks": self.fallbacks,
+            "models": {
+                model: {
+                    "calls": health.calls,
+                    "failures": health.failures,
+                    "consecutive_failures": health.consecutive_failures,
+                    "degraded": health.degraded_until > now,
+                    "fallback_wins": health.fallback_wins,
+                    "p50_ms": round(_percentile(health.latencies_ms, 0.5), 2) if health.latencies_ms else None,
+                    "p95_ms": round(health.p95(), 2) if health.latencies_ms else None,
+                }
+                for model, health in self._health.items()
+            },
+        }
+
+model_router = ModelRouter(config.MODEL_ROUTING_STRATEGY, config.MODEL_LATENCY_WINDOW)
@@ -0,0 +1,44 @@
+# Shared async HTTP client for OpenRouter
+import httpx
+from typing import Optional
+import config
+
+_client: Optional[httpx.AsyncClient] = None
+
+def create_openrouter_client() -> httpx.AsyncClient:
+    # One keep-alive connection pool per worker; HTTP/2 is negotiated via ALPN
+    # and falls back to HTTP/1.1 when the server does not support it.
+    return httpx.AsyncClient(
+        base_url=config.OPENROUTER_BASE_URL,
+        http2=config.OPENROUTER_HTTP2,
+        timeout=httpx.Timeout(
+            connect=config.OPENROUTER_CONNECT_TIMEOUT,
+            read=config.OPENROUTER_READ_TIMEOUT,
+            write=config.OPENROUTER_WRITE_TIMEOUT,
+            pool=config.OPENROUTER_POOL_TIMEOUT,
+        ),
+        limits=httpx.Limits(
+            max_connections=config.OPENROUTER_MAX_CONNECTIONS,
+            max_keepalive_connections=config.OPENROUTER_MAX_KEEPALIVE,
+            keepalive_expiry=config.OPENROUTER_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+async def init_openrouter_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = create_openrouter_client()
+    return _client
+
+async def close_openrouter_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def get_openrouter_client() -> httpx.AsyncClient:
+    # Normally created by the app lifespan; created lazily for scripts and tests
+    global _client
+    if _client is None:
+        _client = create_openrouter_client()
+    return _client
@@ -0,0 +1,147 @@
+# Pool of OpenRouter API keys with load balancing and circuit breakers
+import time
+from typing import Iterable, List, Optional, Set
+import config
+import metrics
+
+class KeyState:
+    def __init__(self, row: dict):
+        self.id = row.get('id')
+        self.api_key = row['api_key']
+        self.description = row.get('description')
+        self.is_default = bool(row.get('is_default'))
+        self.weight = max(1, int(row.get('weight') or 1))
+        # Live counters
+        self.in_flight = 0
+        self.requests = 0
+        self.successes = 0
+        self.rate_limited = 0
+        self.errors = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.last_error: Optional[str] = None
+        self.total_latency_ms = 0.0
+        self.current_weight = 0  # smooth weighted round-robin state
+
+    def is_open(self, now: float) -> bool:
+        return self.open_until > now
+
+    def stats(self, now: float) -> dict:
+        return {
+            "id": self.id,
+            "key": f"...{self.api_key[-4:]}",
+            "description": self.description,
+            "is_default": self.is_default,
+            "weight": self.weight,
+            "state": "open" if self.is_open(now) else "closed",
+            "cooldown_remaining_s": round(max(0.0, self.open_until - now), 1),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "successes": self.successes,
+            "rate_limited": self.rate_limited,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "avg_latency_ms": round(self.total_latency_ms / self.successes, 2) if self.successes else 0.0,
+        }
+
+class OpenRouterKeyPool:
+    """Spreads calls over every row of `openrouter_api_keys`.
+
+    Selection is least-in-flight (relative to weight) or smooth weighted
+    round-robin. A key is taken out of rotation (circuit open) after a 429,
+    after an auth/credit error, or after several consecutive 5xx/network
+    failures, and comes back once its cool-down has passed.
+    """
+
+    def __init__(self, strategy: str):
+        self.strategy = strategy
+        self._keys: List[KeyState] = []
+
+    def update(self, rows: Iterable[dict]):
+        # Rebuild from the table, keeping live counters for keys that still exist
+        existing = {state.api_key: state for state in self._keys}
+        keys = []
+        for row in rows:
+            if not row.get('api_key'):
+                continue
+            state = existing.get(row['api_key'])
+            if state is None:
+                state = KeyState(row)
+            else:
+                state.id = row.get('id')
+                state.description = row.get('description')
+                state.is_default = bool(row.get('is_default'))
+                state.weight = max(1, int(row.get('weight') or 1))
+            keys.append(state)
+        self._keys = keys
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def acquire(self, exclude: Optional[Set[str]] = None) -> Optional[KeyState]:
+        now = time.monotonic()
+        candidates = [k for k in self._keys if not (exclude and k.api_key in exclude)]
+        if not candidates:
+            return None
+        closed = [k for k in candidates if not k.is_open(now)]
+        if not closed:
+            # Every key is cooling down: probe the one that recovers first
+            key = min(candidates, key=lambda k: k.open_until)
+        elif self.strategy == "round_robin":
+            total = sum(k.weight for k in closed)
+            for k in closed:
+                k.current_weight += k.weight
+            key = max(closed, key=lambda k: k.current_weight)
+            key.current_weight -= total
+        else:
+            key = min(closed, key=lambda k: (k.in_flight / k.weight, not k.is_default, k.requests))
+        key.in_flight += 1
+        key.requests += 1
+        return key
+
+    def release_success(self, key: KeyState, latency_ms: float):
+        key.in_flight -= 1
+        key.successes += 1
+        key.consecutive_failures = 0
+        key.total_latency_ms += latency_ms
+
+    def release_failure(self, key: KeyState, status_code: Optional[int], error: str, retry_after: Optional[float] = None):
+        """Record a failed call; status_code is None for network errors."""
+        key.in_flight -= 1
+        key.last_error = error
+        now = time.monotonic()
+        if status_code == 429:
+            key.rate_limited += 1
+            key.open_until = now + (retry_after if retry_after else config.OPENROUTER_KEY_COOLDOWN)
+            return
+        key.errors += 1
+        if status_code in (401, 402, 403):
+            # Revoked key or out of credits: keep it out of rotation for longer
+            key.open_until = now + config.OPENROUTER_KEY_AUTH_COOLDOWN
+            return
+        key.consecutive_failures += 1
+        if key.consecutive_failures >= config.OPENROUTER_KEY_FAILURE_THRESHOLD:
+            key.open_until = now + config.OPENROUTER_KEY_COOLDOWN
+            key.consecutive_failures = 0
+
+    def release_neutral(self, key: KeyState):
+        # The request itself was bad (e.g. 400); the key is not at fault
+        key.in_flight -= 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        return {"strategy": self.strategy, "keys": [k.stats(now) for k in self._keys]}
+
+def is_retryable_status(status_code: Optional[int]) -> bool:
+    # Network errors, rate limits, key problems and upstream 5xx are worth another key
+    return status_code is None or status_code in (401, 402, 403, 408, 429) or status_code >= 500
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    try:
+        return max(0.0, float(value)) if value else None
+    except ValueError:
+        return None
+
+openrouter_key_pool = OpenRouterKeyPool(config.OPENROUTER_KEY_STRATEGY)
+
+metrics.watch_in_flight("openrouter_requests", lambda: sum(key.in_flight for key in openrouter_key_pool._keys))
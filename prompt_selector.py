@@ -1,6 +1,12 @@
 # Handles prompt selection logic
+import logging
+from typing import Union
+from prompt_templates import PromptTemplate
+from quiz_params import QuizParams, parse_quiz_params
 
-# Define the 6 predefined prompts
+logger = logging.getLogger(__name__)
+
+# Define the predefined prompts (content type x question type)
 PREDEFINED_PROMPTS = {
     ("topic", "mcq"): """You are an expert educational content generator. Create {num_of_question} unique and creatively framed multiple-choice questions that comprehensively assess understanding of the topic: "{content}". Ensure the questions vary in style—some direct, some conceptual, and some application-based—while maintaining the specified difficulty level: {level}. {subject_instruction} {exam_instruction} {custom_instruction}. Return the output strictly in this JSON format:
 {{
@@ -144,75 +150,181 @@ Use **___** for blanks. Return the output strictly in this JSON format:
 }}
 ```
 
-"""
-}
+""",
 
-def select_and_customize_prompt(params: dict) -> str:
-    content_type = params.get("content_type") # Corrected key
-    question_type = params.get("question_type") # Corrected key
-    level = params.get("level")
-    content = params.get("content")
-    num_of_question = params.get("num_of_question") # Corrected key
-    subject = params.get("subject")
-    exam = params.get("refrence exam")
-    custom_instruction = params.get("custom instruction")
-
-    print(f"Prompt selector received: content_type={content_type}, question_type={question_type}, level={level}, content={content}, num_of_question={num_of_question}") # Debug print
-
-    # Validate mandatory parameters explicitly
-    missing_params = []
-    if not content_type: missing_params.append("content_type")
-    if not question_type: missing_params.append("question_type")
-    if not level: missing_params.append("level")
-    if not content: missing_params.append("content")
-    if not num_of_question: missing_params.append("num_of_question")
-
-    if missing_params:
-        print(f"Missing or falsy mandatory parameters: {', '.join(missing_params)}")
-        # In a real application, you'd raise a specific error or return an error indicator
-        print("Missing mandatory parameters for prompt selection")
-        return ""
+    ("topic", "short_answer"): """You are an experienced examiner. Write **{num_of_question} short-answer questions** on the topic: "{content}" at {level} difficulty. Each question should be answerable in one to three sentences and test understanding rather than rote recall. {subject_instruction} {exam_instruction} {custom_instruction}
 
-    # Map frontend question type names to backend dictionary keys
-    question_type_mapping = {
-        "multiple_choice_quiz": "mcq",
-        "true_false_quiz": "true_false",
-        "short_answer_quiz": "short_answer", # Assuming this key exists or should exist
-        "fill_in_the_blanks_quiz": "fill_in_the_blanks",
-        "matching_quiz": "matching", # Assuming this key exists or should exist
-        "essay_questions": "essay_questions" # Assuming this key exists or should exist
-    }
+Return the output strictly in this JSON format:
 
-    mapped_question_type = question_type_mapping.get(question_type.lower())
+```json
+{{
+  "context": "Here are {num_of_question} questions on the topic: {content} with {level} difficulty.",
+  "topic": "{content}",
+  "exam": "{exam_instruction}",
+  "level": "{level}",
+  "questions": [
+    {{
+      "stem": "Question text",
+      "answer": "A concise model answer.",
+      "explanation": "Key points a correct answer must mention."
+    }}
+  ]
+}}
+```
 
-    if not mapped_question_type:
-        print(f"Unsupported question type received: {question_type}")
-        return "" # Handle unsupported type
+""",
 
-    prompt_key = (content_type.lower(), mapped_question_type)
+    ("topic", "matching"): """You are an expert test designer. Create **{num_of_question} matching questions** on the topic: "{content}" at {level} difficulty. Each question gives a short instruction and four to six pairs to match (terms with definitions, events with dates, causes with effects, and so on). {subject_instruction} {exam_instruction} {custom_instruction}
 
-    print(f"Looking up prompt key: {prompt_key}") # Debug print for prompt key
+Return the output strictly in this JSON format:
 
-    base_prompt = PREDEFINED_PROMPTS.get(prompt_key)
+```json
+{{
+  "context": "Here are {num_of_question} questions on the topic: {content} with {level} difficulty.",
+  "topic": "{content}",
+  "exam": "{exam_instruction}",
+  "level": "{level}",
+  "questions": [
+    {{
+      "stem": "Match each term with its definition.",
+      "pairs": [
+        {{"left": "Term 1", "right": "Definition 1"}},
+        {{"left": "Term 2", "right": "Definition 2"}}
+      ],
+      "explanation": "Brief explanation of the correct matches."
+    }}
+  ]
+}}
+```
+
+""",
+
+    ("topic", "essay_questions"): """You are a senior educator. Write **{num_of_question} open-ended essay questions** on the topic: "{content}" at {level} difficulty. Questions should invite analysis, comparison or argument rather than description. {subject_instruction} {exam_instruction} {custom_instruction}
+
+Return the output strictly in this JSON format:
+
+```json
+{{
+  "context": "Here are {num_of_question} questions on the topic: {content} with {level} difficulty.",
+  "topic": "{content}",
+  "exam": "{exam_instruction}",
+  "level": "{level}",
+  "questions": [
+    {{
+      "stem": "Essay question text",
+      "key_points": ["Point a strong answer covers", "Another expected point"],
+      "explanation": "What the question assesses and how to approach it."
+    }}
+  ]
+}}
+```
+
+""",
+
+    ("paragraph", "short_answer"): """Read the following paragraph and write **{num_of_question} short-answer questions** that check comprehension of its main ideas, details and implications. Each question should be answerable in one to three sentences using the paragraph.
+
+"{content}"
+
+{subject_instruction} {exam_instruction} {custom_instruction}
+
+Return the output strictly in this JSON format:
+
+```json
+{{
+  "context": "Here are {num_of_question} questions derived from the paragraph with {level} difficulty.",
+  "topic": "Derived from paragraph",
+  "exam": "{exam_instruction}",
+  "level": "{level}",
+  "questions": [
+    {{
+      "stem": "Question based on paragraph",
+      "answer": "A concise model answer drawn from the paragraph.",
+      "explanation": "Where in the paragraph the answer comes from."
+    }}
+  ]
+}}
+```
+
+""",
+
+    ("paragraph", "matching"): """From the following paragraph, create **{num_of_question} matching questions** at {level} difficulty. Each question gives a short instruction and four to six pairs to match, taken from the concepts, people, events or claims in the paragraph.
+
+"{content}"
+
+{subject_instruction} {exam_instruction} {custom_instruction}
+
+Return the output strictly in this JSON format:
+
+```json
+{{
+  "context": "Here are {num_of_question} questions derived from the paragraph with {level} difficulty.",
+  "topic": "Derived from paragraph",
+  "exam": "{exam_instruction}",
+  "level": "{level}",
+  "questions": [
+    {{
+      "stem": "Match each concept from the paragraph with its description.",
+      "pairs": [
+        {{"left": "Concept 1", "right": "Description 1"}},
+        {{"left": "Concept 2", "right": "Description 2"}}
+      ],
+      "explanation": "Explanation based on the paragraph."
+    }}
+  ]
+}}
+```
+
+""",
+
+    ("paragraph", "essay_questions"): """Read the following paragraph and write **{num_of_question} essay questions** at {level} difficulty that ask the reader to evaluate, extend or argue with its ideas.
+
+"{content}"
+
+{subject_instruction} {exam_instruction} {custom_instruction}
+
+Return the output strictly in this JSON format:
+
+```json
+{{
+  "context": "Here are {num_of_question} questions derived from the paragraph with {level} difficulty.",
+  "topic": "Derived from paragraph",
+  "exam": "{exam_instruction}",
+  "level": "{level}",
+  "questions": [
+    {{
+      "stem": "Essay question based on the paragraph",
+      "key_points": ["Point a strong answer covers", "Another expected point"],
+      "explanation": "What the question assesses and how the paragraph supports it."
+    }}
+  ]
+}}
+```
+
+"""
+}
+
+
+# Parsed once at import; rendering is a single join
+COMPILED_PROMPTS = {key: PromptTemplate(source) for key, source in PREDEFINED_PROMPTS.items()}
+
+def select_and_customize_prompt(params: Union[dict, QuizParams]) -> str:
+    """Render the prompt for validated quiz parameters; "" if they are missing or unsupported."""
+    quiz_params = parse_quiz_params(params)
+    if quiz_params is None:
+        return ""
 
-    if not base_prompt:
+    template = COMPILED_PROMPTS.get((quiz_params.content_type, quiz_params.question_type))
+    if template is None:
         # Handle unsupported combination
-        print(f"No prompt found for type {content_type} and question type {question_type}")
+        logger.warning(f"No prompt found for type {quiz_params.content_type} and question type {quiz_params.question_type}")
         return ""
 
     # Build optional instructions
-    subject_instruction = f"Subject: {subject}." if subject else ""
-    exam_instruction = f"Reference exam: {exam}." if exam else ""
-    custom_instruction_text = f"Custom instruction: {custom_instruction}." if custom_instruction else ""
-
-    # Format the prompt
-    final_prompt = base_prompt.format(
-        content=content,
-        level=level,
-        num_of_question=num_of_question,
-        subject_instruction=subject_instruction,
-        exam_instruction=exam_instruction,
-        custom_instruction=custom_instruction_text
-    )
-
-    return final_prompt
\ No newline at end of file
+    return template.render({
+        "content": quiz_params.content,
+        "level": quiz_params.level,
+        "num_of_question": str(quiz_params.num_of_question),
+        "subject_instruction": f"Subject: {quiz_params.subject}." if quiz_params.subject else "",
+        "exam_instruction": f"Reference exam: {quiz_params.reference_exam}." if quiz_params.reference_exam else "",
+        "custom_instruction": f"Custom instruction: {quiz_params.custom_instruction}." if quiz_params.custom_instruction else "",
+    })
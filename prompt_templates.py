@@ -0,0 +1,33 @@
+# Prompt templates parsed once and rendered with a single join
+from string import Formatter
+from typing import List, Tuple
+
+class PromptTemplate:
+    """A `str.format`-style template split into literal and field segments.
+
+    Parsing (including `{{`/`}}` escapes) happens once, when the template is
+    created; `render` only fills the field slots of a copy of the segment
+    list and joins it. Only plain `{name}` fields are supported.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._segments: List[str] = []
+        # (segment index, field name) for every field occurrence
+        self._slots: List[Tuple[int, str]] = []
+        for literal, field, spec, conversion in Formatter().parse(source):
+            if literal:
+                self._segments.append(literal)
+            if field is None:
+                continue
+            if not field.isidentifier() or spec or conversion:
+                raise ValueError(f"Unsupported template field: {{{field}}}")
+            self._slots.append((len(self._segments), field))
+            self._segments.append("")
+        self.fields = frozenset(name for _, name in self._slots)
+
+    def render(self, values: dict) -> str:
+        segments = self._segments.copy()
+        for index, name in self._slots:
+            segments[index] = values[name]
+        return "".join(segments)
@@ -0,0 +1,359 @@
+# Pre-generated question bank: pools of single questions warmed off-peak and sampled into quizzes
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import sqlite3
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from api_config import get_api_config
+from cache import MISSING, TTLCache
+from model_router import model_router
+from prompt_selector import select_and_customize_prompt
+from quiz_chunking import dedupe_questions, repair_params
+from quiz_params import parse_quiz_params
+from quiz_schema import normalize_quiz
+from singleflight import SingleFlight
+from supabase_pool import execute, get_supabase_pool
+from utils import call_openrouter_api
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# The count in a header's "context" ("Here are 5 questions on ..."), written for the batch it came with
+_CONTEXT_COUNT = re.compile(r"\b\d+(?=\s+(?:[\w-]+\s+){0,2}questions?\b)", re.IGNORECASE)
+
+def pool_of(params) -> Optional[Tuple[str, dict, int]]:
+    """(pool key, pool parameters, requested count) for bankable requests, else None.
+
+    Only topic quizzes are banked; paragraph content is different every time.
+    Every parameter but the question count identifies the pool, compared
+    case- and whitespace-insensitively.
+    """
+    quiz_params = parse_quiz_params(params)
+    if quiz_params is None or quiz_params.content_type != "topic":
+        return None
+    pool_params = quiz_params.to_params()
+    count = pool_params.pop("num_of_question")
+    identity = {name: " ".join(str(value).lower().split()) for name, value in pool_params.items()}
+    key = hashlib.sha256(json.dumps(identity, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+    return key, pool_params, count
+
+def target_size(requests: float) -> int:
+    size = int(requests * config.QUESTION_BANK_QUESTIONS_PER_REQUEST)
+    return max(config.QUESTION_BANK_MIN_SIZE, min(config.QUESTION_BANK_MAX_SIZE, size))
+
+def in_warm_window(hour: int, spec: str) -> bool:
+    # "2-6" is 02:00-05:59 UTC; "22-4" wraps past midnight; "" is always
+    if not spec.strip():
+        return True
+    start, _, end = spec.partition("-")
+    start, end = int(start), int(end)
+    return start <= hour < end if start <= end else hour >= start or hour < end
+
+class WarmLease:
+    """Host-wide marker of the last warm pass in STATE_DIR, so only one worker runs each pass."""
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = self._connect()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS warm_passes (name TEXT PRIMARY KEY, started_at REAL NOT NULL)")
+        conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def try_acquire(self, interval: float) -> bool:
+        now = time.time()
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT started_at FROM warm_passes WHERE name = 'warm'").fetchone()
+            if row is not None and now - row[0] < interval:
+                conn.execute("ROLLBACK")
+                return False
+            conn.execute("INSERT OR REPLACE INTO warm_passes (name, started_at) VALUES ('warm', ?)", (now,))
+            conn.execute("COMMIT")
+            return True
+        finally:
+            conn.close()
+
+class QuestionBank:
+    """Per-worker view of the question bank tables (migrations/005_question_bank.sql).
+
+    Requests only read memory: the pool index (key -> size) is refreshed in
+    the background, and a pool's questions are loaded once per
+    QUESTION_BANK_POOL_TTL. Demand is counted in memory and added to
+    `question_bank_pools.requests` every QUESTION_BANK_TICK seconds.
+    """
+
+    def __init__(self):
+        self._sizes: Dict[str, int] = {}
+        self._headers: Dict[str, dict] = {}
+        self._pools = TTLCache(maxsize=max(1, config.QUESTION_BANK_WARM_TOP) * 4, ttl=config.QUESTION_BANK_POOL_TTL)
+        self._loads = SingleFlight()
+        # (user_api_key, pool key) -> ids of questions served to that user since the entry was created;
+        # the set grows in place so the entry still expires QUESTION_BANK_REPEAT_WINDOW after that
+        self._served = TTLCache(maxsize=100_000, ttl=config.QUESTION_BANK_REPEAT_WINDOW)
+        # pool key -> [pool parameters, requests since the last flush]
+        self._demand: Dict[str, list] = {}
+        self._warm_task: Optional[asyncio.Task] = None
+        self.hits = 0
+        self.misses = 0
+        self.last_pass: Optional[dict] = None
+
+    def observe(self, key: str, pool_params: dict):
+        entry = self._demand.get(key)
+        if entry is None:
+            entry = self._demand[key] = [pool_params, 0]
+        entry[1] += 1
+
+    async def _fetch_rows(self, key: str) -> List[dict]:
+        async with get_supabase_pool().connection() as db:
+            query = db.table('question_bank').select('id, question, model_name').eq('pool_key', key)\
+                .order('id', desc=True).limit(config.QUESTION_BANK_MAX_SIZE)
+            return (await execute(query)).data or []
+
+    async def _rows(self, key: str) -> List[dict]:
+        rows = self._pools.get(key)
+        if rows is MISSING:
+            rows, _ = await self._loads.do(key, lambda: self._fetch_rows(key))
+            self._pools.set(key, rows)
+        return rows
+
+    async def sample(self, params: dict, user_api_key: str) -> Optional[Tuple[dict, str]]:
+        """(quiz, model) assembled from the pool for `params`, or None to generate live.
+
+        The questions are distinct, and none of them was served to this user
+        within QUESTION_BANK_REPEAT_WINDOW. A pool that cannot offer
+        QUESTION_BANK_MIN_POOL_FACTOR times the requested count counts as thin.
+        """
+        pool = pool_of(params)
+        if pool is None:
+            return None
+        key, pool_params, count = pool
+        self.observe(key, pool_params)
+        needed = count * config.QUESTION_BANK_MIN_POOL_FACTOR
+        if self._sizes.get(key, 0) < needed:
+            self.misses += 1
+            return None
+        try:
+            rows = await self._rows(key)
+        except Exception as e:
+            logger.error(f"Question bank lookup failed: {str(e)}")
+            self.misses += 1
+            return None
+        seen = self._served.peek((user_api_key, key), None)
+        unseen = [row for row in rows if seen is None or row['id'] not in seen]
+        if len(unseen) < needed:
+            self.misses += 1
+            return None
+        picked = random.sample(unseen, count)
+        if seen is None:
+            seen = set()
+            self._served.set((user_api_key, key), seen)
+        seen.update(row['id'] for row in picked)
+        self.hits += 1
+        quiz = {**(self._headers.get(key) or {}), "questions": [row['question'] for row in picked]}
+        if isinstance(quiz.get("context"), str):
+            quiz["context"] = _CONTEXT_COUNT.sub(str(count), quiz["context"], count=1)
+        model = Counter(row.get('model_name') for row in picked).most_common(1)[0][0] or "question-bank"
+        return quiz, model
+
+    async def flush_demand(self):
+        if not self._demand:
+            return
+        demand, self._demand = self._demand, {}
+        entries = [{"pool_key": key, "params": params, "requests": requests} for key, (params, requests) in demand.items()]
+        try:
+            async with get_supabase_pool().connection() as db:
+                await execute(db.rpc('question_bank_record_demand', {"entries": entries}))
+        except Exception as e:
+            logger.error(f"Recording question bank demand failed: {str(e)}")
+            # Keep the counts for the next flush
+            for key, (params, requests) in demand.items():
+                self._demand.setdefault(key, [params, 0])[1] += requests
+
+    async def refresh_index(self):
+        async with get_supabase_pool().connection() as db:
+            query = db.table('question_bank_pools').select('pool_key, size, header').gt('size', 0)\
+                .order('requests', desc=True).limit(max(1, config.QUESTION_BANK_WARM_TOP) * 4)
+            rows = (await execute(query)).data or []
+        sizes = {row['pool_key']: row['size'] for row in rows}
+        for key, size in sizes.items():
+            # Pools that grew since they were loaded are re-read on their next request
+            if self._sizes.get(key) != size:
+                self._pools.delete(key)
+        self._sizes = sizes
+        self._headers = {row['pool_key']: row['header'] for row in rows if isinstance(row.get('header'), dict)}
+
+    async def _complete(self, prompt: str, model: str, api_key: str) -> Optional[dict]:
+        response = await call_openrouter_api(prompt, model, api_key, json_mode=config.OPENROUTER_JSON_MODE)
+        if not response or not response.get("choices"):
+            return None
+        return response
+
+    async def _generate(self, pool_params: dict, count: int, stems: List[str]):
+        # Steered away from a sample of the questions already in the pool
+        steer = random.sample(stems, min(20, len(stems)))
+        prompt = select_and_customize_prompt(repair_params({**pool_params, "num_of_question": count}, count, steer))
+        question_type = parse_quiz_params({**pool_params, "num_of_question": count}).question_type
+        snapshot = await get_api_config()
+        models = model_router.route(snapshot.models, snapshot.model, None, count)
+        routed = await model_router.run(models, lambda model: self._complete(prompt, model, snapshot.openrouter_api_key))
+        if routed is None:
+            return None
+        model, response = routed
+        quiz = normalize_quiz(response["choices"][0]["message"]["content"], question_type)
+        if quiz is None or not quiz.questions:
+            return None
+        return quiz, model
+
+    async def _fill(self, pool: dict, target: int, budget: int) -> Tuple[int, int, Optional[dict]]:
+        """Generate into `pool` up to `target` questions with at most `budget` calls: (added, calls, header)."""
+        key = pool['pool_key']
+        questions = [row['question'] for row in await self._fetch_rows(key)]
+        header = pool.get('header')
+        added = calls = 0
+        while len(questions) < target and calls < budget:
+            count = min(config.QUESTION_BANK_BATCH_SIZE, target - len(questions))
+            generated = await self._generate(pool['params'], count, [q.get('stem', '') for q in questions])
+            calls += 1
+            if generated is None:
+                break
+            quiz, model = generated
+            if header is None:
+                header = quiz.quiz
+            new = {id(question) for question in quiz.questions}
+            fresh = [q for q in dedupe_questions(questions + quiz.questions, config.QUIZ_DEDUP_THRESHOLD) if id(q) in new]
+            if not fresh:
+                # The model keeps repeating what the pool already has
+                break
+            async with get_supabase_pool().connection() as db:
+                await execute(db.table('question_bank').insert(
+                    [{"pool_key": key, "question": question, "model_name": model} for question in fresh]
+                ))
+            questions.extend(fresh)
+            added += len(fresh)
+        return added, calls, header
+
+    async def warm(self) -> dict:
+        """Fill the most requested pools up to their demand-based target size, then decay demand."""
+        started = time.monotonic()
+        summary = {"started_at": datetime.now(timezone.utc).isoformat(), "pools": 0, "added": 0, "calls": 0}
+        async with get_supabase_pool().connection() as db:
+            query = db.table('question_bank_pools').select('pool_key, params, header, requests, size')\
+                .gte('requests', config.QUESTION_BANK_MIN_REQUESTS)\
+                .order('requests', desc=True).limit(config.QUESTION_BANK_WARM_TOP)
+            pools = (await execute(query)).data or []
+        for pool in pools:
+            target = target_size(pool['requests'])
+            update = {"target_size": target, "last_warmed_at": datetime.now(timezone.utc).isoformat()}
+            budget = config.QUESTION_BANK_MAX_CALLS - summary["calls"]
+            if pool['size'] < target and budget > 0:
+                try:
+                    added, calls, header = await self._fill(pool, target, budget)
+                except Exception as e:
+                    logger.error(f"Filling question bank pool {pool['pool_key']} failed: {str(e)}")
+                    added, calls, header = 0, 1, pool.get('header')
+                summary["added"] += added
+                summary["calls"] += calls
+                update["size"] = pool['size'] + added
+                if header is not None:
+                    update["header"] = header
+            summary["pools"] += 1
+            async with get_supabase_pool().connection() as db:
+                await execute(db.table('question_bank_pools').update(update).eq('pool_key', pool['pool_key']))
+        async with get_supabase_pool().connection() as db:
+            await execute(db.rpc('question_bank_decay', {"factor": config.QUESTION_BANK_DEMAND_DECAY}))
+        summary["duration_s"] = round(time.monotonic() - started, 3)
+        logger.info(f"Question bank warm pass: {summary['added']} questions in {summary['pools']} pools "
+                    f"({summary['calls']} calls)")
+        self.last_pass = summary
+        await self.refresh_index()
+        return summary
+
+    def warm_in_background(self) -> bool:
+        """Start a warm pass unless one is already running in this worker."""
+        if self._warm_task is not None and not self._warm_task.done():
+            return False
+        self._warm_task = asyncio.get_running_loop().create_task(self._warm_logged())
+        return True
+
+    async def _warm_logged(self):
+        try:
+            await self.warm()
+        except Exception as e:
+            logger.error(f"Question bank warm pass failed: {str(e)}")
+
+    async def stop(self):
+        if self._warm_task is not None and not self._warm_task.done():
+            self._warm_task.cancel()
+            try:
+                await self._warm_task
+            except asyncio.CancelledError:
+                pass
+        await self.flush_demand()
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "pools_indexed": len(self._sizes),
+            "questions_indexed": sum(self._sizes.values()),
+            "pending_demand": sum(requests for _, requests in self._demand.values()),
+            "warming": self._warm_task is not None and not self._warm_task.done(),
+            "last_pass": self.last_pass,
+            "pool_cache": self._pools.stats(),
+        }
+
+question_bank = QuestionBank()
+metrics.watch_cache("question_bank", question_bank.stats)
+
+_ticker: Optional[asyncio.Task] = None
+
+async def _tick_loop(lease: WarmLease):
+    while True:
+        try:
+            await question_bank.flush_demand()
+            hour = datetime.now(timezone.utc).hour
+            if in_warm_window(hour, config.QUESTION_BANK_WARM_HOURS) and \
+                    await asyncio.to_thread(lease.try_acquire, config.QUESTION_BANK_WARM_INTERVAL):
+                question_bank.warm_in_background()
+            await question_bank.refresh_index()
+        except Exception as e:
+            logger.error(f"Question bank background tick failed: {str(e)}")
+        await asyncio.sleep(config.QUESTION_BANK_TICK)
+
+def start_question_bank():
+    global _ticker
+    if not config.QUESTION_BANK_ENABLED or _ticker is not None:
+        return
+    try:
+        in_warm_window(0, config.QUESTION_BANK_WARM_HOURS)
+    except ValueError:
+        logger.error(f"Invalid QUESTION_BANK_WARM_HOURS {config.QUESTION_BANK_WARM_HOURS!r}; expected e.g. '2-6'")
+        return
+    lease = WarmLease(os.path.join(config.STATE_DIR, "question_bank.db"))
+    _ticker = asyncio.get_running_loop().create_task(_tick_loop(lease))
+
+async def stop_question_bank():
+    global _ticker
+    if _ticker is not None:
+        _ticker.cancel()
+        try:
+            await _ticker
+        except asyncio.CancelledError:
+            pass
+        _ticker = None
+        await question_bank.stop()
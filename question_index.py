@@ -0,0 +1,273 @@
+# Question-level near-duplicate index (MinHash + LSH) over generated_quizzes
+import asyncio
+import logging
+import random
+from typing import Dict, List, Optional, Set, Tuple
+from admin_pagination import ListSpec, build_page_query
+from cache import MISSING, TTLCache
+from quiz_chunking import normalize_stem
+from quiz_parsing import extract_quiz_json
+from quiz_storage import quiz_content_store
+from singleflight import SingleFlight
+from supabase_pool import execute, get_supabase_pool
+import config
+
+logger = logging.getLogger(__name__)
+
+# Mersenne prime for the (a * x + b) mod p hash family
+_PRIME = (1 << 61) - 1
+_MASK = (1 << 61) - 1
+
+# Oldest first, so the stored cursor doubles as the watermark for incremental updates
+QUIZZES = ListSpec('generated_quizzes', key='id', sort='generated_at', desc=False,
+                   default_fields=['id', 'generated_at', 'quiz_content'],
+                   allowed_fields=['id', 'generated_at', 'quiz_content'], content_store=quiz_content_store)
+
+def shingles(normalized: str) -> Set[str]:
+    # Single words: MinHash then estimates the same word Jaccard that confirms candidates
+    return set(normalized.split())
+
+def jaccard(left: str, right: str) -> float:
+    # Same word-overlap measure as quiz_chunking.dedupe_questions
+    left_words, right_words = set(left.split()), set(right.split())
+    union = left_words | right_words
+    return len(left_words & right_words) / len(union) if union else 0.0
+
+def quiz_questions(quiz_content) -> List[dict]:
+    """Questions of a stored `generated_quizzes.quiz_content` value (JSON or raw-text rows)."""
+    if isinstance(quiz_content, dict) and set(quiz_content) == {"content"}:
+        quiz_content = extract_quiz_json(quiz_content["content"]) if isinstance(quiz_content["content"], str) else None
+    questions = quiz_content.get("questions") if isinstance(quiz_content, dict) else None
+    return [q for q in questions if isinstance(q, dict)] if isinstance(questions, list) else []
+
+class QuestionIndex:
+    """In-memory MinHash/LSH index of question stems, for one worker.
+
+    Stems are normalized (quiz_chunking.normalize_stem), split into words
+    and MinHashed with `permutations` hash functions; the signature is split
+    into `bands` bands, and stems sharing any band bucket are candidates,
+    confirmed with the exact word Jaccard. A pair with word Jaccard s
+    becomes a candidate with probability 1 - (1 - s^rows)^bands: with the
+    defaults (8 bands of 4 rows) about 98% at 0.8 (QUIZ_DEDUP_THRESHOLD)
+    and 89% at 0.7. Python's string hash is per process, which is fine:
+    signatures never leave the worker.
+    """
+
+    def __init__(self, permutations: int, bands: int):
+        if permutations % bands:
+            raise ValueError("permutations must be a multiple of bands")
+        self.rows = permutations // bands
+        rng = random.Random(0x5EED)
+        self._perms = [(rng.randrange(1, _PRIME), rng.randrange(0, _PRIME)) for _ in range(permutations)]
+        self._bands: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        # Entry number -> (quiz id, position in the quiz, original stem, normalized stem)
+        self.entries: List[Tuple[str, int, str, str]] = []
+        self._quiz_ids: Set[str] = set()
+
+    def signature(self, normalized: str) -> List[int]:
+        hashes = [hash(shingle) & _MASK for shingle in shingles(normalized)] or [0]
+        return [min((a * h + b) % _PRIME for h in hashes) for a, b in self._perms]
+
+    def _band_keys(self, signature: List[int]):
+        rows = self.rows
+        for band in range(len(self._bands)):
+            yield band, hash(tuple(signature[band * rows:(band + 1) * rows]))
+
+    def add_quiz(self, quiz_id: str, questions: List[dict]) -> int:
+        """Index the questions of one stored quiz; a quiz already indexed is ignored. Returns questions added."""
+        if quiz_id in self._quiz_ids:
+            return 0
+        self._quiz_ids.add(quiz_id)
+        added = 0
+        for position, question in enumerate(questions):
+            stem = question.get("stem")
+            normalized = normalize_stem(stem) if isinstance(stem, str) else ""
+            if not normalized:
+                continue
+            entry = len(self.entries)
+            self.entries.append((quiz_id, position, stem, normalized))
+            for band, key in self._band_keys(self.signature(normalized)):
+                self._bands[band].setdefault(key, []).append(entry)
+            added += 1
+        return added
+
+    def similar(self, stem: str, threshold: float, limit: int) -> List[dict]:
+        """Indexed questions whose stem shares >= `threshold` of its words with `stem`, most similar first."""
+        normalized = normalize_stem(stem)
+        if not normalized:
+            return []
+        candidates = set()
+        for band, key in self._band_keys(self.signature(normalized)):
+            candidates.update(self._bands[band].get(key, ()))
+        matches = []
+        for entry in candidates:
+            quiz_id, position, original, other = self.entries[entry]
+            similarity = jaccard(normalized, other)
+            if similarity >= threshold:
+                matches.append({"quiz_id": quiz_id, "position": position, "stem": original,
+                                "similarity": round(similarity, 3)})
+        matches.sort(key=lambda match: match["similarity"], reverse=True)
+        return matches[:limit]
+
+    def is_duplicate(self, stem: str, threshold: float) -> bool:
+        return bool(self.similar(stem, threshold, 1))
+
+    async def clusters(self, threshold: float) -> List[List[int]]:
+        """Groups of entries that are near-duplicates of each other (union-find over LSH candidates).
+
+        Within a bucket each entry is only compared with up to 8 cluster
+        leaders, so huge buckets of identical stems stay linear. Yields to
+        the event loop between bands.
+        """
+        parent = list(range(len(self.entries)))
+
+        def find(entry: int) -> int:
+            while parent[entry] != entry:
+                parent[entry] = parent[parent[entry]]
+                entry = parent[entry]
+            return entry
+
+        for buckets in self._bands:
+            for members in buckets.values():
+                if len(members) < 2:
+                    continue
+                leaders: List[int] = []
+                for entry in members:
+                    normalized = self.entries[entry][3]
+                    for leader in leaders:
+                        if jaccard(normalized, self.entries[leader][3]) >= threshold:
+                            parent[find(entry)] = find(leader)
+                            break
+                    else:
+                        if len(leaders) < 8:
+                            leaders.append(entry)
+            await asyncio.sleep(0)
+
+        groups: Dict[int, List[int]] = {}
+        for entry in range(len(self.entries)):
+            groups.setdefault(find(entry), []).append(entry)
+        return [members for members in groups.values() if len(members) > 1]
+
+    def stats(self) -> dict:
+        return {
+            "quizzes": len(self._quiz_ids),
+            "questions": len(self.entries),
+            "buckets": sum(len(buckets) for buckets in self._bands),
+            "permutations": len(self._perms),
+            "bands": len(self._bands),
+        }
+
+class QuestionIndexService:
+    """Keeps a QuestionIndex in step with generated_quizzes and serves lookups and reports.
+
+    The first sync pages through the whole table; later syncs (every
+    QUESTION_INDEX_REFRESH_INTERVAL seconds) only read rows generated after
+    the last one indexed. Rows without a generated_at are indexed by the
+    first sync only.
+    """
+
+    def __init__(self):
+        self.index = QuestionIndex(config.QUESTION_INDEX_PERMUTATIONS, config.QUESTION_INDEX_BANDS)
+        self._cursor: Optional[list] = None
+        self._synced_once = False
+        # Syncs and reports both walk the buckets: one at a time
+        self._lock = asyncio.Lock()
+        self._reports = TTLCache(maxsize=16, ttl=config.QUESTION_INDEX_REPORT_TTL)
+        self._report_flights = SingleFlight()
+        self.syncs = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._synced_once
+
+    async def sync(self) -> int:
+        """Index rows added since the last sync; returns the number of questions added."""
+        added = 0
+        async with self._lock:
+            cursor = self._cursor
+            while True:
+                async with get_supabase_pool().connection() as db:
+                    query = build_page_query(db, QUIZZES, QUIZZES.columns(None), config.QUESTION_INDEX_PAGE_SIZE, cursor)
+                    if self._synced_once:
+                        query = query.filter('generated_at', 'not.is', 'null')
+                    rows = (await execute(query)).data or []
+                rows = await QUIZZES.expand(rows)
+                for row in rows:
+                    added += self.index.add_quiz(str(row['id']), quiz_questions(row.get('quiz_content')))
+                    # NULL generated_at sorts last; the watermark stays on the newest dated row
+                    if row.get('generated_at') is not None:
+                        self._cursor = QUIZZES.cursor_values(row)
+                if len(rows) <= config.QUESTION_INDEX_PAGE_SIZE:
+                    break
+                cursor = QUIZZES.cursor_values(rows[-1])
+                await asyncio.sleep(0)
+        self._synced_once = True
+        self.syncs += 1
+        return added
+
+    def similar(self, stem: str, threshold: float = None, limit: int = 10) -> List[dict]:
+        return self.index.similar(stem, config.QUIZ_DEDUP_THRESHOLD if threshold is None else threshold, limit)
+
+    async def _report(self, threshold: float, limit: int) -> dict:
+        async with self._lock:
+            clusters = await self.index.clusters(threshold)
+        entries = self.index.entries
+        clusters.sort(key=len, reverse=True)
+        duplicates = sum(len(members) - 1 for members in clusters)
+        return {
+            "threshold": threshold,
+            "questions": len(entries),
+            "clusters": len(clusters),
+            # Questions that could be dropped, keeping one per cluster
+            "duplicates": duplicates,
+            "duplicate_ratio": round(duplicates / len(entries), 4) if entries else 0.0,
+            "top": [
+                {"size": len(members), "questions": [
+                    {"quiz_id": entries[entry][0], "position": entries[entry][1], "stem": entries[entry][2]}
+                    for entry in members[:5]
+                ]}
+                for members in clusters[:limit]
+            ],
+        }
+
+    async def report(self, threshold: float = None, limit: int = 50, refresh: bool = False) -> dict:
+        """Near-duplicate clusters over every indexed question, cached for QUESTION_INDEX_REPORT_TTL seconds."""
+        threshold = config.QUIZ_DEDUP_THRESHOLD if threshold is None else threshold
+        key = (threshold, limit)
+        value = MISSING if refresh else self._reports.get(key)
+        if value is MISSING:
+            value, _ = await self._report_flights.do(key, lambda: self._report(threshold, limit))
+            self._reports.set(key, value)
+        return value
+
+    def stats(self) -> dict:
+        return {"ready": self.ready, "syncs": self.syncs, "cursor": self._cursor, **self.index.stats()}
+
+question_index = QuestionIndexService()
+
+_sync_task: Optional[asyncio.Task] = None
+
+async def _sync_loop(interval: float):
+    while True:
+        try:
+            added = await question_index.sync()
+            if added:
+                logger.info(f"Question index: added {added} questions ({len(question_index.index.entries)} total)")
+        except Exception as e:
+            logger.error(f"Question index sync failed: {str(e)}")
+        await asyncio.sleep(interval)
+
+def start_question_index():
+    global _sync_task
+    if config.QUESTION_INDEX_ENABLED and _sync_task is None:
+        _sync_task = asyncio.get_running_loop().create_task(_sync_loop(config.QUESTION_INDEX_REFRESH_INTERVAL))
+
+async def stop_question_index():
+    global _sync_task
+    if _sync_task is not None:
+        _sync_task.cancel()
+        try:
+            await _sync_task
+        except asyncio.CancelledError:
+            pass
+        _sync_task = None
@@ -0,0 +1,118 @@
+# Content-addressed cache of generated quizzes
+import hashlib
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+from cache import TTLCache, MISSING
+from supabase_pool import get_supabase_pool, execute
+from quiz_storage import quiz_content_store
+import metrics
+import config
+
+logger = logging.getLogger(__name__)
+
+def quiz_cache_key(model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+class _Variants:
+    def __init__(self, contents: List[str]):
+        self.contents = contents
+        self.next = 0
+
+class QuizResponseCache:
+    """Two-tier cache of raw quiz completions keyed on hash(model, prompt).
+
+    The memory tier is a per-worker LRU. The optional persistent tier reads
+    recent rows of `generated_quizzes` carrying the same `prompt_hash`.
+    Up to `variants` distinct completions are kept per key; a key only
+    produces hits once that many exist, and hits rotate through them.
+    Keys with fewer are kept in memory for only `negative_ttl` seconds when
+    the persistent tier is on, so rows written by other workers are found.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, variants: int, persistent: bool, negative_ttl: float = 30.0):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.variants = max(1, variants)
+        self.persistent = persistent
+        self.memory = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.persistent_hits = 0
+
+    async def _load_persistent(self, key: str) -> List[str]:
+        since = (datetime.now(timezone.utc) - timedelta(seconds=self.ttl)).isoformat()
+        async with get_supabase_pool().connection() as supabase:
+            response = await execute(
+                supabase.table('generated_quizzes')
+                .select(quiz_content_store.select('quiz_content'))
+                .eq('prompt_hash', key)
+                .gte('generated_at', since)
+                .order('generated_at', desc=True)
+                .limit(self.variants * 4)
+            )
+        contents = []
+        for row in await quiz_content_store.expand(response.data or []):
+            content = stored_quiz_to_text(row['quiz_content'])
+            if content and content not in contents:
+                contents.append(content)
+            if len(contents) >= self.variants:
+                break
+        return contents
+
+    async def get(self, key: str) -> Optional[str]:
+        entry = self.memory.get(key)
+        if entry is MISSING:
+            contents = []
+            if self.persistent:
+                try:
+                    contents = await self._load_persistent(key)
+                except Exception as e:
+                    logger.error(f"Quiz cache persistent lookup failed: {str(e)}")
+            entry = _Variants(contents)
+            self.memory.set(key, entry, ttl=self._ttl_for(entry))
+            if len(contents) >= self.variants:
+                self.persistent_hits += 1
+        if len(entry.contents) < self.variants:
+            return None
+        content = entry.contents[entry.next % len(entry.contents)]
+        entry.next += 1
+        return content
+
+    def add(self, key: str, content: str):
+        entry = self.memory.peek(key)
+        if entry is MISSING:
+            entry = _Variants([])
+        if content not in entry.contents:
+            entry.contents.append(content)
+            del entry.contents[:-self.variants]
+        self.memory.set(key, entry, ttl=self._ttl_for(entry))
+
+    def _ttl_for(self, entry: _Variants) -> Optional[float]:
+        # Only complete entries are trusted for the full TTL; memory-only caches have nowhere else to look
+        if self.persistent and len(entry.contents) < self.variants:
+            return self.negative_ttl
+        return None
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats["persistent_hits"] = self.persistent_hits
+        stats["variants"] = self.variants
+        return stats
+
+def stored_quiz_to_text(quiz_content) -> Optional[str]:
+    # Rebuild the raw completion from a `generated_quizzes.quiz_content` value
+    if isinstance(quiz_content, dict) and set(quiz_content) == {"content"}:
+        return quiz_content["content"]
+    if quiz_content is None:
+        return None
+    return json.dumps(quiz_content)
+
+quiz_response_cache = QuizResponseCache(
+    maxsize=config.QUIZ_CACHE_SIZE,
+    ttl=config.QUIZ_CACHE_TTL,
+    variants=config.QUIZ_CACHE_VARIANTS,
+    persistent=config.QUIZ_CACHE_PERSISTENT,
+    negative_ttl=config.QUIZ_CACHE_NEGATIVE_TTL,
+)
+
+metrics.watch_cache("quiz_response", quiz_response_cache.stats)
@@ -0,0 +1,62 @@
+# Splitting large quiz requests into parallel chunks
+import re
+from typing import List
+
+_NON_WORD = re.compile(r"[^\w\s]")
+_SPACES = re.compile(r"\s+")
+
+def split_question_counts(total: int, chunk_size: int) -> List[int]:
+    """Split `total` questions into chunk sizes of at most `chunk_size`, as even as possible."""
+    chunks = -(-total // chunk_size)
+    base, extra = divmod(total, chunks)
+    return [base + (1 if i < extra else 0) for i in range(chunks)]
+
+def chunk_params(params: dict, count: int, part: int, parts: int) -> dict:
+    # Each chunk gets its own count and a distinct instruction, so chunk
+    # prompts differ (no cache/in-flight sharing between them) and the
+    # model is steered away from repeating the other chunks.
+    chunk = dict(params)
+    chunk["num_of_question"] = count
+    steer = (
+        f"This is part {part} of {parts} of a larger quiz; "
+        f"focus on different aspects and sub-topics than the other parts (aspect #{part})"
+    )
+    existing = params.get("custom instruction") or params.get("custom_instruction")
+    chunk["custom instruction"] = f"{existing}. {steer}" if existing else steer
+    return chunk
+
+def repair_params(params: dict, count: int, existing_stems: list) -> dict:
+    # Ask for replacements of questions that were dropped as malformed,
+    # steering away from the ones already kept
+    repair = dict(params)
+    repair["num_of_question"] = count
+    steer = "Return only well-formed questions in exactly the JSON format shown"
+    if existing_stems:
+        listed = "; ".join(str(stem)[:120] for stem in existing_stems[:20])
+        steer += f". Do not repeat these questions: {listed}"
+    existing = params.get("custom instruction") or params.get("custom_instruction")
+    repair["custom instruction"] = f"{existing}. {steer}" if existing else steer
+    return repair
+
+def normalize_stem(stem: str) -> str:
+    stem = _NON_WORD.sub(" ", str(stem).lower())
+    return _SPACES.sub(" ", stem).strip()
+
+def dedupe_questions(questions: List[dict], threshold: float) -> List[dict]:
+    """Drop questions whose stem shares >= `threshold` of its words (Jaccard) with an earlier one."""
+    kept = []
+    kept_tokens = []
+    for question in questions:
+        if not isinstance(question, dict):
+            continue
+        tokens = set(normalize_stem(question.get("stem", "")).split())
+        duplicate = False
+        for other in kept_tokens:
+            union = tokens | other
+            if union and len(tokens & other) / len(union) >= threshold:
+                duplicate = True
+                break
+        if not duplicate:
+            kept.append(question)
+            kept_tokens.append(tokens)
+    return kept
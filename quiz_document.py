@@ -0,0 +1,108 @@
+# Splitting long paragraph-mode content into sections generated in parallel
+import math
+import re
+from typing import Iterator, List, Tuple
+
+# Rough size of an English token in characters; models differ, so this is only an estimate
+CHARS_PER_TOKEN = 4
+
+# Blank lines between paragraphs
+_PARAGRAPH_BREAK = re.compile(r"\n[ \t]*\n\s*")
+# Headings at the start of a paragraph: markdown, "Chapter 3", "2.1 Title", or a short upper-case line
+_HEADING = re.compile(
+    r"\s*(?:#{1,6}\s|(?i:chapter|section|part|unit|lesson)\s+[\w.]+|\d+(?:\.\d+)*[.)]?\s+[A-Z]|[A-Z][A-Z0-9 ,:'&-]{2,60}\n)"
+)
+_SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+")
+_SPACE = re.compile(r"\s")
+
+Span = Tuple[int, int]
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def _span_tokens(span: Span) -> int:
+    return math.ceil((span[1] - span[0]) / CHARS_PER_TOKEN)
+
+def _paragraphs(content: str) -> Iterator[Span]:
+    start = 0
+    for match in _PARAGRAPH_BREAK.finditer(content):
+        if match.start() > start:
+            yield start, match.start()
+        start = match.end()
+    if start < len(content):
+        yield start, len(content)
+
+def _pieces(content: str, span: Span, max_chars: int) -> Iterator[Span]:
+    # A paragraph longer than a section, cut at sentence ends (or at whitespace, or anywhere)
+    start, end = span
+    while end - start > max_chars:
+        limit = start + max_chars
+        cut = None
+        for match in _SENTENCE_END.finditer(content, start + max_chars // 2, limit):
+            cut = match.end()
+        if cut is None:
+            spaces = [match.end() for match in _SPACE.finditer(content, start + max_chars // 2, limit)]
+            cut = spaces[-1] if spaces else limit
+        yield start, cut
+        start = cut
+    if end > start:
+        yield start, end
+
+def iter_sections(content: str, section_tokens: int) -> Iterator[Span]:
+    """(start, end) offsets of consecutive sections of `content` of about `section_tokens` tokens each.
+
+    Whole paragraphs are packed into a section; a heading starts a new one
+    once the current section is at least half full, and paragraphs longer
+    than a section are cut at sentence ends. Only offsets are produced, so
+    the text itself is sliced once, when a section is rendered.
+    """
+    max_chars = max(1, section_tokens * CHARS_PER_TOKEN)
+    start = end = None
+    for paragraph in _paragraphs(content):
+        if start is not None:
+            heading = _HEADING.match(content, paragraph[0], paragraph[1]) is not None
+            if (heading and end - start >= max_chars // 2) or paragraph[1] - start > max_chars:
+                yield start, end
+                start = None
+        for piece in _pieces(content, paragraph, max_chars):
+            if start is not None and piece[1] - start > max_chars:
+                yield start, end
+                start = None
+            if start is None:
+                start = piece[0]
+            end = piece[1]
+    if start is not None:
+        yield start, end
+
+def plan_sections(content: str, num_questions: int, section_tokens: int, max_sections: int, max_tokens: int = 0) -> List[Span]:
+    # Sections grow past `section_tokens` rather than outnumber the questions (or `max_sections`),
+    # but never past `max_tokens`: then some sections get no questions (allocate_questions)
+    limit = max(1, min(max_sections, num_questions))
+    size = max(section_tokens, math.ceil(estimate_tokens(content) / limit))
+    if max_tokens > 0:
+        size = min(size, max_tokens)
+    return list(iter_sections(content, size))
+
+def allocate_questions(spans: List[Span], total: int) -> List[int]:
+    """Split `total` questions over sections in proportion to their length (largest remainder)."""
+    weights = [_span_tokens(span) for span in spans]
+    whole = sum(weights) or 1
+    shares = [total * weight / whole for weight in weights]
+    counts = [int(share) for share in shares]
+    by_remainder = sorted(range(len(spans)), key=lambda i: (shares[i] - counts[i], weights[i]), reverse=True)
+    for i in by_remainder[:total - sum(counts)]:
+        counts[i] += 1
+    return counts
+
+def section_params(params: dict, content: str, count: int, part: int, parts: int) -> dict:
+    # Same shape as quiz_chunking.chunk_params, with the section as the paragraph
+    section = dict(params)
+    section["content"] = content
+    section["num_of_question"] = count
+    steer = (
+        f"The paragraph is section {part} of {parts} of a longer document; "
+        f"ask only about what this section says"
+    )
+    existing = params.get("custom instruction") or params.get("custom_instruction")
+    section["custom instruction"] = f"{existing}. {steer}" if existing else steer
+    return section
@@ -0,0 +1,80 @@
+# Typed quiz generation parameters
+import logging
+from typing import Literal, Optional
+from pydantic import AliasChoices, BaseModel, Field, ValidationError, field_validator
+import config
+
+logger = logging.getLogger(__name__)
+
+# Frontend question type names -> prompt keys (the prompt keys are accepted as well)
+QUESTION_TYPE_MAPPING = {
+    "multiple_choice_quiz": "mcq",
+    "true_false_quiz": "true_false",
+    "short_answer_quiz": "short_answer",
+    "fill_in_the_blanks_quiz": "fill_in_the_blanks",
+    "matching_quiz": "matching",
+    "essay_questions": "essay_questions",
+}
+QUESTION_TYPES = frozenset(QUESTION_TYPE_MAPPING.values())
+
+QuestionType = Literal["mcq", "true_false", "short_answer", "fill_in_the_blanks", "matching", "essay_questions"]
+
+class QuizParams(BaseModel):
+    content_type: Literal["topic", "paragraph"]
+    question_type: QuestionType
+    level: str = Field(min_length=1)
+    content: str = Field(min_length=1)
+    # Bounded: chunked generation fans a request out into num_of_question / QUIZ_CHUNK_SIZE upstream calls
+    num_of_question: int = Field(ge=1, le=config.MAX_QUESTIONS_PER_REQUEST)
+    subject: Optional[str] = None
+    # The legacy keys contain spaces (and a typo); the snake_case spellings are accepted too
+    reference_exam: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("refrence exam", "reference_exam"),
+        serialization_alias="refrence exam",
+    )
+    custom_instruction: Optional[str] = Field(
+        default=None,
+        validation_alias=AliasChoices("custom instruction", "custom_instruction"),
+        serialization_alias="custom instruction",
+    )
+    model_config = {
+        "extra": "ignore",
+        "str_strip_whitespace": True,
+    }
+
+    @field_validator("content_type", mode="before")
+    @classmethod
+    def _normalize_content_type(cls, value):
+        return value.lower() if isinstance(value, str) else value
+
+    @field_validator("question_type", mode="before")
+    @classmethod
+    def _normalize_question_type(cls, value):
+        if not isinstance(value, str):
+            return value
+        value = value.strip().lower()
+        return QUESTION_TYPE_MAPPING.get(value, value)
+
+    @field_validator("num_of_question", mode="before")
+    @classmethod
+    def _reject_bool(cls, value):
+        if isinstance(value, bool):
+            raise ValueError("must be an integer")
+        return value
+
+    def to_params(self) -> dict:
+        # Back to the raw dict shape used by jobs, batches and chunking
+        return self.model_dump(by_alias=True, exclude_none=True)
+
+def parse_quiz_params(params) -> Optional[QuizParams]:
+    """Validate raw request parameters; None (with the failing fields logged) if they are invalid."""
+    if isinstance(params, QuizParams):
+        return params
+    try:
+        return QuizParams.model_validate(params)
+    except ValidationError as e:
+        # Field names only: the input may be a large paragraph
+        fields = ", ".join(".".join(str(part) for part in error["loc"]) or "body" for error in e.errors())
+        logger.info(f"Invalid quiz parameters: {fields}")
+        return None
@@ -0,0 +1,59 @@
+# Parsing of quiz JSON out of LLM completions
+from typing import Optional
+import orjson
+from quiz_stream import QuestionStreamParser
+
+def loads(text: str):
+    # orjson.JSONDecodeError is a ValueError
+    return orjson.loads(text)
+
+def dumps(value) -> str:
+    # Compact JSON text with non-ASCII characters kept as is
+    return orjson.dumps(value).decode()
+
+def _load_object(text: str) -> Optional[dict]:
+    try:
+        value = loads(text)
+    except ValueError:
+        return None
+    return value if isinstance(value, dict) else None
+
+def _fenced_blocks(text: str):
+    # ```json ... ``` blocks, found with str.find instead of a DOTALL regex
+    start = text.find("```")
+    while start != -1:
+        end = text.find("```", start + 3)
+        if end == -1:
+            return
+        block = text[start + 3:end]
+        if block[:4].lower() == "json":
+            block = block[4:]
+        yield block
+        start = text.find("```", end + 3)
+
+def extract_quiz_json(text: str) -> Optional[dict]:
+    """Return the quiz object from a completion, with or without a ```json fence."""
+    if not text:
+        return None
+    # JSON mode responses are a bare object: one parse and done
+    stripped = text.strip()
+    if stripped.startswith("{"):
+        value = _load_object(stripped)
+        if value is not None:
+            return value
+    for block in _fenced_blocks(text):
+        value = _load_object(block)
+        if value is not None:
+            return value
+    start, end = text.find("{"), text.rfind("}")
+    if 0 <= start < end:
+        return _load_object(text[start:end + 1])
+    return None
+
+def salvage_quiz_json(text: str) -> Optional[dict]:
+    """Keep the complete questions of a truncated or otherwise broken completion."""
+    if not text:
+        return None
+    parser = QuestionStreamParser()
+    questions = parser.feed(text)
+    return {"questions": questions} if questions else None
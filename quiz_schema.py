@@ -0,0 +1,111 @@
+# Per-question-type schemas for generated quizzes
+import re
+from typing import List, Optional
+from pydantic import BaseModel, Field, ValidationError, model_validator
+from quiz_parsing import extract_quiz_json, salvage_quiz_json
+
+_OPTION_LETTER = re.compile(r"^\(?(?:option\s+)?([a-z])[\).:]?$", re.I)
+
+def resolve_option(answer: str, options: List[str]) -> Optional[str]:
+    """Map an answer to one of `options`: exact text, text ignoring case/space, or a letter ("B", "b)", "Option B")."""
+    if answer in options:
+        return answer
+    folded = answer.strip().casefold()
+    for option in options:
+        if option.strip().casefold() == folded:
+            return option
+    match = _OPTION_LETTER.match(answer.strip())
+    if match:
+        index = ord(match.group(1).lower()) - ord("a")
+        if index < len(options):
+            return options[index]
+    return None
+
+class Question(BaseModel):
+    stem: str = Field(min_length=1)
+    explanation: Optional[str] = None
+    # Extra keys from the model are kept as they are
+    model_config = {"extra": "allow", "str_strip_whitespace": True}
+
+class McqQuestion(Question):
+    options: List[str] = Field(min_length=2)
+    correct_option: str
+
+    @model_validator(mode="after")
+    def _answer_is_an_option(self):
+        resolved = resolve_option(self.correct_option, self.options)
+        if resolved is None:
+            raise ValueError("correct_option is not one of the options")
+        self.correct_option = resolved
+        return self
+
+class TrueFalseQuestion(Question):
+    # "true"/"false"/"True"/1/0 are coerced to a bool
+    correct_option: bool
+
+class FillInTheBlanksQuestion(Question):
+    options: Optional[List[str]] = None
+    correct_option: str = Field(min_length=1)
+
+    @model_validator(mode="after")
+    def _has_blank(self):
+        if "__" not in self.stem:
+            raise ValueError("stem has no blank")
+        if self.options:
+            resolved = resolve_option(self.correct_option, self.options)
+            if resolved is None:
+                raise ValueError("correct_option is not one of the options")
+            self.correct_option = resolved
+        return self
+
+class ShortAnswerQuestion(Question):
+    answer: str = Field(min_length=1)
+
+class MatchingPair(BaseModel):
+    left: str = Field(min_length=1)
+    right: str = Field(min_length=1)
+
+class MatchingQuestion(Question):
+    pairs: List[MatchingPair] = Field(min_length=2)
+
+class EssayQuestion(Question):
+    key_points: List[str] = []
+
+QUESTION_SCHEMAS = {
+    "mcq": McqQuestion,
+    "true_false": TrueFalseQuestion,
+    "fill_in_the_blanks": FillInTheBlanksQuestion,
+    "short_answer": ShortAnswerQuestion,
+    "matching": MatchingQuestion,
+    "essay_questions": EssayQuestion,
+}
+
+def validate_question(question_type: Optional[str], question) -> Optional[dict]:
+    """Return the normalized question, or None if it does not fit the type's schema."""
+    schema = QUESTION_SCHEMAS.get(question_type, Question)
+    try:
+        return schema.model_validate(question).model_dump(exclude_none=True)
+    except ValidationError:
+        return None
+
+class NormalizedQuiz:
+    def __init__(self, quiz: dict, questions: List[dict], invalid: int):
+        self.quiz = quiz
+        self.questions = questions
+        # Questions dropped because they did not fit the schema
+        self.invalid = invalid
+
+    def to_dict(self) -> dict:
+        return {**self.quiz, "questions": self.questions}
+
+def normalize_quiz(text: str, question_type: Optional[str]) -> Optional[NormalizedQuiz]:
+    """Parse a completion and validate each question; None if no quiz object can be recovered."""
+    quiz = extract_quiz_json(text) or salvage_quiz_json(text)
+    if quiz is None:
+        return None
+    raw_questions = quiz.get("questions")
+    if not isinstance(raw_questions, list):
+        return NormalizedQuiz(quiz, [], 0)
+    questions = [q for q in (validate_question(question_type, raw) for raw in raw_questions) if q is not None]
+    header = {key: value for key, value in quiz.items() if key != "questions"}
+    return NormalizedQuiz(header, questions, len(raw_questions) - len(questions))
@@ -0,0 +1,527 @@
+# Quiz generation pipeline shared by the HTTP endpoints
+import asyncio
+import logging
+import time
+from functools import cached_property
+from typing import List, Optional
+from utils import (
+    verify_api_key, fetch_api_config, save_generated_quiz, record_usage,
+    call_openrouter_api, stream_openrouter_api
+)
+from quiz_stream import QuestionStreamParser
+from quiz_parsing import extract_quiz_json, dumps
+from quiz_chunking import split_question_counts, chunk_params, repair_params, dedupe_questions
+from quiz_document import estimate_tokens, plan_sections, allocate_questions, section_params
+from quiz_schema import normalize_quiz, validate_question
+from quiz_params import parse_quiz_params
+from prompt_selector import select_and_customize_prompt
+from quiz_cache import quiz_response_cache, quiz_cache_key
+from singleflight import SingleFlight
+from api_config import get_api_config
+from model_router import model_router
+from question_bank import question_bank
+import metrics
+from metrics import stage
+import config
+
+logger = logging.getLogger(__name__)
+
+# Identical prompt+model generations in flight in this worker share one upstream call
+inflight_generations = SingleFlight()
+metrics.watch_in_flight("generations", lambda: inflight_generations.stats()["in_flight"])
+
+class QuizGenerationError(Exception):
+    """Pipeline failure carrying the HTTP status the endpoints should return."""
+
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+class QuizResult:
+    def __init__(self, quiz_content: str, model: str, prompt_hash: str, cached: bool = False, shared: bool = False,
+                 usage: Optional[dict] = None, banked: bool = False):
+        self.quiz_content = quiz_content
+        self.model = model
+        self.prompt_hash = prompt_hash
+        self.cached = cached
+        self.shared = shared
+        # Sampled from the pre-generated question bank (also counts as cached: no tokens spent)
+        self.banked = banked
+        # OpenRouter token usage spent on this result (empty for cache hits and shared calls)
+        self.usage = usage or {}
+
+    @cached_property
+    def quiz_json(self) -> dict:
+        # Parsed once: endpoints read it for the response, the saved row and usage logging
+        return parse_quiz_content(self.quiz_content)
+
+    @property
+    def questions(self) -> list:
+        questions = self.quiz_json.get("questions")
+        return questions if isinstance(questions, list) else []
+
+def parse_quiz_content(quiz_content: str) -> dict:
+    # Parse quiz_content as JSON (bare or inside a ```json fence)
+    quiz = extract_quiz_json(quiz_content)
+    if quiz is None:
+        # If not JSON, store as a simple dictionary or string
+        return {"content": quiz_content}
+    return quiz
+
+async def verify_user(user_api_key: str) -> str:
+    """Return the user's tier ('free', 'silver', 'gold') or raise QuizGenerationError."""
+    if not user_api_key:
+        raise QuizGenerationError(401, "User API key missing")
+
+    # Verify API key
+    user_status = await verify_api_key(user_api_key)
+    if user_status is None:
+        raise QuizGenerationError(401, "Invalid API key")
+    if user_status == 'inactive':
+        raise QuizGenerationError(403, "API key is inactive")
+    return user_status
+
+async def run_quiz_pipeline(user_api_key: str, params: dict, bypass_cache: bool = False,
+                            user_type: str = None, endpoint: str = "generate-quiz") -> QuizResult:
+    """Prompt -> config -> generate -> save (+ usage log) for an already verified user."""
+    started = time.monotonic()
+    # Select and customize prompt
+    with stage("select_prompt"):
+        final_prompt = select_and_customize_prompt(params)
+    if not final_prompt:
+        raise QuizGenerationError(400, "Missing or unsupported quiz parameters")
+
+    # Popular topics are assembled from the pre-generated question bank when it has enough questions
+    result = None
+    if config.QUESTION_BANK_ENABLED and not bypass_cache:
+        with stage("question_bank"):
+            result = await sample_question_bank(params, user_api_key)
+
+    if result is None:
+        # Fetch API config from DB and pick the models for this request
+        with stage("fetch_api_config"):
+            _, openrouter_api_key = await fetch_api_config()
+            models = await route_models(user_type, params)
+
+        # Serve from the response cache or call OpenRouter API (in parallel chunks for large quizzes)
+        with stage("generate"):
+            result = await generate_quiz_for_params(params, final_prompt, models, openrouter_api_key, bypass_cache=bypass_cache)
+
+        # Process and return the quiz data from the API response
+        if result is None:
+            await log_quiz_usage(user_api_key, user_type, endpoint, started, None, model=models[0])
+            raise QuizGenerationError(500, "Failed to generate quiz from API")
+
+    # Save the generated quiz and its usage row (queued, written in the background)
+    with stage("save_generated_quiz"):
+        await save_generated_quiz(user_api_key, result.quiz_json, prompt_hash=result.prompt_hash, model=result.model)
+    await log_quiz_usage(user_api_key, user_type, endpoint, started, result)
+    return result
+
+async def sample_question_bank(params: dict, user_api_key: str) -> Optional[QuizResult]:
+    sampled = await question_bank.sample(params, user_api_key)
+    if sampled is None:
+        return None
+    quiz, model = sampled
+    return QuizResult(dumps(quiz), model, None, cached=True, banked=True)
+
+async def log_quiz_usage(user_api_key: str, user_type: str, endpoint: str, started: float,
+                         result: Optional["QuizResult"], model: str = None):
+    await record_usage(
+        user_api_key, user_type, endpoint,
+        status="success" if result is not None else "error",
+        latency_ms=(time.monotonic() - started) * 1000,
+        model=result.model if result is not None else model,
+        usage=result.usage if result is not None else None,
+        cached=bool(result and result.cached)
+    )
+
+async def route_models(user_type: Optional[str], params: dict) -> List[str]:
+    """Ordered model chain for a request: the first model is tried first, the rest are fallbacks."""
+    snapshot = await get_api_config()
+    return model_router.route(snapshot.models, snapshot.model, user_type, requested_question_count(params))
+
+def question_type_of(params: Optional[dict]) -> Optional[str]:
+    quiz_params = parse_quiz_params(params) if params is not None else None
+    return quiz_params.question_type if quiz_params is not None else None
+
+def _add_usage(total: dict, usage: dict):
+    for field, value in usage.items():
+        if isinstance(value, (int, float)):
+            total[field] = total.get(field, 0) + value
+
+async def generate_quiz_content(final_prompt: str, models: List[str], openrouter_api_key: str, bypass_cache: bool = False,
+                                params: Optional[dict] = None) -> Optional[QuizResult]:
+    """Cached, coalesced generation of one prompt; with `params` the response is schema-validated and repaired."""
+    # Cached and coalesced under the first model of the chain, even when a fallback answers: the
+    # lookup happens before routing, and the same chain asked the same prompt should get that answer
+    prompt_hash = quiz_cache_key(models[0], final_prompt)
+    if config.QUIZ_CACHE_ENABLED and not bypass_cache:
+        cached_content = await quiz_response_cache.get(prompt_hash)
+        if cached_content is not None:
+            return QuizResult(cached_content, models[0], prompt_hash, cached=True)
+
+    outcome, shared = await inflight_generations.do(
+        prompt_hash, lambda: _call_and_cache(final_prompt, models, openrouter_api_key, prompt_hash, params)
+    )
+    if outcome is None:
+        return None
+    quiz_content, usage, model = outcome
+    # Followers did not spend any tokens of their own
+    return QuizResult(quiz_content, model, prompt_hash, shared=shared, usage=None if shared else usage)
+
+async def _call_model(final_prompt: str, model: str, openrouter_api_key: str) -> Optional[dict]:
+    # Call OpenRouter API; None unless the response carries a completion
+    api_response = await call_openrouter_api(final_prompt, model, openrouter_api_key, json_mode=config.OPENROUTER_JSON_MODE)
+    if not api_response or not api_response.get("choices"):
+        return None
+    return api_response
+
+async def _call_and_cache(final_prompt: str, models: List[str], openrouter_api_key: str, prompt_hash: str,
+                          params: Optional[dict] = None) -> Optional[tuple]:
+    """Return (quiz_content, usage, model) from the first model of the chain that answers, or None."""
+    routed = await model_router.run(models, lambda model: _call_model(final_prompt, model, openrouter_api_key))
+    if routed is None:
+        return None
+    model, api_response = routed
+
+    # Assuming the generated quiz content is in the first message's content
+    quiz_content = api_response["choices"][0]["message"]["content"]
+    usage = dict(api_response.get("usage") or {})
+    valid = True
+    if params is not None:
+        quiz_content, valid = await _validate_and_repair(quiz_content, params, models, openrouter_api_key, usage)
+    # Unparseable responses are returned as they are but never cached. prompt_hash is keyed on
+    # models[0], not `model` (see generate_quiz_content)
+    if config.QUIZ_CACHE_ENABLED and valid:
+        quiz_response_cache.add(prompt_hash, quiz_content)
+    return quiz_content, usage, model
+
+async def _validate_and_repair(quiz_content: str, params: dict, models: List[str], openrouter_api_key: str,
+                               usage: dict) -> tuple:
+    """Return (normalized quiz JSON, True), or (the original text, False) if no questions could be recovered.
+
+    Questions that fail their type's schema are dropped and, up to
+    QUIZ_REPAIR_RETRIES times, only the missing ones are requested again;
+    an unparseable response is retried whole. Repair calls add to `usage`.
+    """
+    question_type = question_type_of(params)
+    requested = requested_question_count(params)
+    quiz = normalize_quiz(quiz_content, question_type)
+    for _ in range(config.QUIZ_REPAIR_RETRIES):
+        kept = quiz.questions if quiz is not None else []
+        missing = requested - len(kept)
+        if missing <= 0 or (quiz is not None and not quiz.invalid):
+            break
+        logger.info(f"Re-requesting {missing} malformed or missing quiz questions")
+        prompt = select_and_customize_prompt(repair_params(params, missing, [q["stem"] for q in kept]))
+        routed = await model_router.run(models, lambda model: _call_model(prompt, model, openrouter_api_key))
+        if routed is None:
+            break
+        _add_usage(usage, routed[1].get("usage") or {})
+        extra = normalize_quiz(routed[1]["choices"][0]["message"]["content"], question_type)
+        if extra is None:
+            continue
+        if quiz is None:
+            quiz = extra
+        else:
+            quiz.questions = dedupe_questions(kept + extra.questions, config.QUIZ_DEDUP_THRESHOLD)[:requested]
+            quiz.invalid = extra.invalid
+    if quiz is None or not quiz.questions:
+        return quiz_content, False
+    return dumps(quiz.to_dict()), True
+
+async def stream_quiz_questions(final_prompt: str, models: List[str], openrouter_api_key: str, bypass_cache: bool = False,
+                                question_type: Optional[str] = None):
+    """Yield ("question", dict) for each question as it is parsed, then ("done", QuizResult).
+
+    Questions that fail the schema of `question_type` are skipped. The next
+    model of the chain is tried if one fails before producing any output;
+    streams are not hedged or repaired.
+    """
+    prompt_hash = quiz_cache_key(models[0], final_prompt)
+    parser = QuestionStreamParser()
+    if config.QUIZ_CACHE_ENABLED and not bypass_cache:
+        cached_content = await quiz_response_cache.get(prompt_hash)
+        if cached_content is not None:
+            for question in parser.feed(cached_content):
+                yield "question", question
+            yield "done", QuizResult(cached_content, models[0], prompt_hash, cached=True)
+            return
+
+    for position, model in enumerate(models):
+        started = time.perf_counter()
+        try:
+            async for delta in stream_openrouter_api(final_prompt, model, openrouter_api_key, json_mode=config.OPENROUTER_JSON_MODE):
+                for question in parser.feed(delta):
+                    question = validate_question(question_type, question)
+                    if question is not None:
+                        yield "question", question
+        except Exception:
+            model_router.record(model, (time.perf_counter() - started) * 1000, ok=False)
+            if parser.buffer or position == len(models) - 1:
+                raise
+            model_router.fallbacks += 1
+            continue
+        model_router.record(model, (time.perf_counter() - started) * 1000, ok=True)
+        if position:
+            model_router.health(model).fallback_wins += 1
+        break
+
+    quiz_content = parser.buffer
+    quiz = normalize_quiz(quiz_content, question_type)
+    if quiz is not None and quiz.questions:
+        quiz_content = dumps(quiz.to_dict())
+        if config.QUIZ_CACHE_ENABLED:
+            quiz_response_cache.add(prompt_hash, quiz_content)
+    yield "done", QuizResult(quiz_content, model, prompt_hash)
+
+async def generate_quiz_batch(items: list, openrouter_api_key: str, concurrency: int, timeout: float, bypass_cache: bool = False) -> list:
+    """Generate one quiz per (params, final_prompt, models) item with at most `concurrency` running at once.
+
+    Returns a list aligned with `items` holding a QuizResult or an error string.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(params: dict, prompt: str, models: List[str]):
+        async with semaphore:
+            try:
+                result = await asyncio.wait_for(
+                    generate_quiz_for_params(params, prompt, models, openrouter_api_key, bypass_cache=bypass_cache),
+                    timeout=timeout
+                )
+            except asyncio.TimeoutError:
+                return f"Timed out after {timeout:g}s"
+            except Exception as e:
+                logger.error(f"Error generating batch item: {e}")
+                return "Failed to generate quiz from API"
+            return result if result is not None else "Failed to generate quiz from API"
+
+    return await asyncio.gather(*(run(params, prompt, models) for params, prompt, models in items))
+
+def requested_question_count(params: dict) -> int:
+    try:
+        return int(params.get("num_of_question") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+def needs_chunking(params: dict) -> bool:
+    return config.QUIZ_CHUNK_SIZE > 0 and requested_question_count(params) > config.QUIZ_CHUNK_THRESHOLD
+
+def needs_document_split(params: dict) -> bool:
+    content = params.get("content")
+    return (
+        config.DOCUMENT_SPLIT_TOKENS > 0
+        and str(params.get("content_type") or "").lower() == "paragraph"
+        and isinstance(content, str)
+        and estimate_tokens(content) > config.DOCUMENT_SPLIT_TOKENS
+    )
+
+async def generate_quiz_for_params(params: dict, final_prompt: str, models: List[str], openrouter_api_key: str, bypass_cache: bool = False) -> Optional[QuizResult]:
+    # Long paragraphs are generated per section and large requests in parallel chunks; the rest use a single call
+    if needs_document_split(params):
+        return await generate_document_quiz(params, final_prompt, models, openrouter_api_key, bypass_cache=bypass_cache)
+    if needs_chunking(params):
+        return await generate_chunked_quiz(params, final_prompt, models, openrouter_api_key, bypass_cache=bypass_cache)
+    return await generate_quiz_content(final_prompt, models, openrouter_api_key, bypass_cache=bypass_cache, params=params)
+
+async def generate_chunked_quiz(params: dict, final_prompt: str, models: List[str], openrouter_api_key: str, bypass_cache: bool = False) -> Optional[QuizResult]:
+    # Cached and coalesced under the hash of the full (unchunked) prompt
+    prompt_hash = quiz_cache_key(models[0], final_prompt)
+    if config.QUIZ_CACHE_ENABLED and not bypass_cache:
+        cached_content = await quiz_response_cache.get(prompt_hash)
+        if cached_content is not None:
+            return QuizResult(cached_content, models[0], prompt_hash, cached=True)
+
+    outcome, shared = await inflight_generations.do(
+        prompt_hash, lambda: _generate_chunks(params, models, openrouter_api_key, prompt_hash, bypass_cache)
+    )
+    if outcome is None:
+        return None
+    quiz_content, usage, model = outcome
+    return QuizResult(quiz_content, model, prompt_hash, shared=shared, usage=None if shared else usage)
+
+async def _generate_chunks(params: dict, models: List[str], openrouter_api_key: str, prompt_hash: str, bypass_cache: bool) -> Optional[tuple]:
+    counts = split_question_counts(requested_question_count(params), config.QUIZ_CHUNK_SIZE)
+    parts = [chunk_params(params, count, part + 1, len(counts)) for part, count in enumerate(counts)]
+    prompts = [select_and_customize_prompt(part) for part in parts]
+    semaphore = asyncio.Semaphore(max(1, config.QUIZ_CHUNK_CONCURRENCY))
+    usage = {}
+    answered_by = []
+
+    async def run(index: int, bypass: bool) -> Optional[dict]:
+        async with semaphore:
+            result = await generate_quiz_content(prompts[index], models, openrouter_api_key, bypass_cache=bypass, params=parts[index])
+        if result is None:
+            return None
+        answered_by.append(result.model)
+        _add_usage(usage, result.usage)
+        quiz = extract_quiz_json(result.quiz_content)
+        if not quiz or not isinstance(quiz.get("questions"), list) or not quiz["questions"]:
+            return None
+        return quiz
+
+    chunks = await asyncio.gather(*(run(i, bypass_cache) for i in range(len(prompts))))
+    # Re-request only the chunks that failed or did not parse
+    for _ in range(config.QUIZ_CHUNK_RETRIES):
+        failed = [i for i, quiz in enumerate(chunks) if quiz is None]
+        if not failed:
+            break
+        logger.info(f"Retrying {len(failed)} of {len(chunks)} quiz chunks")
+        retried = await asyncio.gather(*(run(i, True) for i in failed))
+        for i, quiz in zip(failed, retried):
+            chunks[i] = quiz
+
+    chunks = [quiz for quiz in chunks if quiz is not None]
+    if not chunks:
+        return None
+
+    merged = {key: value for key, value in chunks[0].items() if key != "questions"}
+    merged["questions"] = dedupe_questions(
+        [question for quiz in chunks for question in quiz["questions"]],
+        config.QUIZ_DEDUP_THRESHOLD
+    )
+    quiz_content = dumps(merged)
+    if config.QUIZ_CACHE_ENABLED:
+        quiz_response_cache.add(prompt_hash, quiz_content)
+    # Chunks may come from different models of the chain; report the one that produced most of them
+    return quiz_content, usage, max(set(answered_by), key=answered_by.count)
+
+class DocumentGeneration:
+    """One long paragraph-mode document, generated section by section.
+
+    Sections are planned as offsets into the content (quiz_document) and
+    each gets a share of the questions proportional to its length. A
+    section's text and prompt only exist while its generation runs, at most
+    DOCUMENT_SECTION_CONCURRENCY at a time. `questions()` yields the new
+    questions of each section as it completes, dropping near-duplicates of
+    earlier ones; `result()` then merges them in document order.
+    """
+
+    def __init__(self, params: dict, models: List[str], openrouter_api_key: str, bypass_cache: bool = False):
+        self.params = params
+        self.models = models
+        self.openrouter_api_key = openrouter_api_key
+        self.bypass_cache = bypass_cache
+        requested = requested_question_count(params)
+        self.spans = plan_sections(params["content"], requested, config.DOCUMENT_SECTION_TOKENS,
+                                   config.DOCUMENT_MAX_SECTIONS, config.DOCUMENT_SPLIT_TOKENS)
+        self.counts = allocate_questions(self.spans, requested)
+        self.usage = {}
+        self.answered_by = []
+        # (section, non-question fields) of the earliest section that produced a quiz
+        self._header = None
+        self._sections = {}
+        self._kept = []
+
+    async def _generate_section(self, index: int, semaphore: asyncio.Semaphore) -> tuple:
+        start, end = self.spans[index]
+        for attempt in range(1 + max(0, config.QUIZ_CHUNK_RETRIES)):
+            if attempt:
+                logger.info(f"Retrying document section {index + 1} of {len(self.spans)}")
+            async with semaphore:
+                params = section_params(self.params, self.params["content"][start:end].strip(),
+                                        self.counts[index], index + 1, len(self.spans))
+                prompt = select_and_customize_prompt(params)
+                if not prompt:
+                    return index, None
+                # Re-requests skip the cache, like failed chunks. Never generate_quiz_for_params: a
+                # section must not be split again as a document
+                bypass = self.bypass_cache or attempt > 0
+                if needs_chunking(params):
+                    result = await generate_chunked_quiz(params, prompt, self.models, self.openrouter_api_key, bypass_cache=bypass)
+                else:
+                    result = await generate_quiz_content(prompt, self.models, self.openrouter_api_key, bypass_cache=bypass,
+                                                         params=params)
+            if result is None:
+                continue
+            self.answered_by.append(result.model)
+            _add_usage(self.usage, result.usage)
+            quiz = extract_quiz_json(result.quiz_content)
+            if quiz and isinstance(quiz.get("questions"), list) and quiz["questions"]:
+                return index, quiz
+        return index, None
+
+    async def questions(self):
+        logger.info(f"Generating a document of ~{estimate_tokens(self.params['content'])} tokens in {len(self.spans)} sections")
+        semaphore = asyncio.Semaphore(max(1, config.DOCUMENT_SECTION_CONCURRENCY))
+        tasks = [
+            asyncio.ensure_future(self._generate_section(index, semaphore))
+            for index, count in enumerate(self.counts) if count
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                index, quiz = await next_done
+                if quiz is None:
+                    continue
+                if self._header is None or index < self._header[0]:
+                    self._header = (index, {key: value for key, value in quiz.items() if key != "questions"})
+                # Kept questions are distinct from each other, so they all survive the dedupe
+                fresh = dedupe_questions(self._kept + quiz["questions"], config.QUIZ_DEDUP_THRESHOLD)[len(self._kept):]
+                self._kept.extend(fresh)
+                self._sections[index] = fresh
+                for question in fresh:
+                    yield question
+        finally:
+            # The consumer stopped early (e.g. the client disconnected)
+            for task in tasks:
+                task.cancel()
+
+    def result(self, prompt_hash: str) -> Optional[tuple]:
+        """(quiz_content, usage, model) of the merged quiz, or None if no section produced questions."""
+        if self._header is None or not self._kept:
+            return None
+        merged = dict(self._header[1])
+        merged["questions"] = [question for index in sorted(self._sections) for question in self._sections[index]]
+        quiz_content = dumps(merged)
+        if config.QUIZ_CACHE_ENABLED:
+            quiz_response_cache.add(prompt_hash, quiz_content)
+        # Sections may come from different models of the chain; report the one that produced most of them
+        return quiz_content, self.usage, max(set(self.answered_by), key=self.answered_by.count)
+
+async def generate_document_quiz(params: dict, final_prompt: str, models: List[str], openrouter_api_key: str,
+                                 bypass_cache: bool = False) -> Optional[QuizResult]:
+    # Cached and coalesced under the hash of the whole-document prompt
+    prompt_hash = quiz_cache_key(models[0], final_prompt)
+    if config.QUIZ_CACHE_ENABLED and not bypass_cache:
+        cached_content = await quiz_response_cache.get(prompt_hash)
+        if cached_content is not None:
+            return QuizResult(cached_content, models[0], prompt_hash, cached=True)
+
+    outcome, shared = await inflight_generations.do(
+        prompt_hash, lambda: _generate_document(params, models, openrouter_api_key, prompt_hash, bypass_cache)
+    )
+    if outcome is None:
+        return None
+    quiz_content, usage, model = outcome
+    return QuizResult(quiz_content, model, prompt_hash, shared=shared, usage=None if shared else usage)
+
+async def _generate_document(params: dict, models: List[str], openrouter_api_key: str, prompt_hash: str,
+                             bypass_cache: bool) -> Optional[tuple]:
+    document = DocumentGeneration(params, models, openrouter_api_key, bypass_cache)
+    async for _ in document.questions():
+        pass
+    return document.result(prompt_hash)
+
+async def stream_document_questions(params: dict, final_prompt: str, models: List[str], openrouter_api_key: str,
+                                    bypass_cache: bool = False):
+    """stream_quiz_questions for long documents: each section's questions are yielded as the section completes."""
+    prompt_hash = quiz_cache_key(models[0], final_prompt)
+    if config.QUIZ_CACHE_ENABLED and not bypass_cache:
+        cached_content = await quiz_response_cache.get(prompt_hash)
+        if cached_content is not None:
+            for question in QuestionStreamParser().feed(cached_content):
+                yield "question", question
+            yield "done", QuizResult(cached_content, models[0], prompt_hash, cached=True)
+            return
+
+    document = DocumentGeneration(params, models, openrouter_api_key, bypass_cache)
+    async for question in document.questions():
+        yield "question", question
+    outcome = document.result(prompt_hash)
+    if outcome is None:
+        yield "done", QuizResult("", models[0], prompt_hash)
+        return
+    quiz_content, usage, model = outcome
+    yield "done", QuizResult(quiz_content, model, prompt_hash, usage=usage)
@@ -0,0 +1,229 @@
+# Compact quiz content storage: compressed, content-addressed blobs shared by generated_quizzes rows
+import argparse
+import asyncio
+import base64
+import hashlib
+import logging
+import zlib
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import orjson
+from dotenv import load_dotenv
+from cache import MISSING, TTLCache
+from supabase_pool import execute, get_supabase_pool, init_supabase_pool, close_supabase_pool
+import config
+
+logger = logging.getLogger(__name__)
+
+ENCODING = "zlib+base64"
+# content_hash values per `in` filter (64 hex characters each)
+_LOOKUP_CHUNK = 100
+
+def encode_content(quiz_content) -> dict:
+    """The `quiz_contents` row for one quiz_content value; the hash is over the JSON before compression."""
+    raw = orjson.dumps(quiz_content)
+    return {
+        "content_hash": hashlib.sha256(raw).hexdigest(),
+        "encoding": ENCODING,
+        "body": base64.b64encode(zlib.compress(raw, 6)).decode("ascii"),
+        "size": len(raw),
+    }
+
+def decode_content(row: dict) -> Any:
+    if row.get("encoding") != ENCODING:
+        raise ValueError(f"Unknown quiz content encoding: {row.get('encoding')}")
+    return orjson.loads(zlib.decompress(base64.b64decode(row["body"])))
+
+def compact_enabled() -> bool:
+    return config.QUIZ_STORAGE == "compact"
+
+# Key of the quiz_contents row a compacted generated_quizzes row carries until write_blobs() stores it
+BLOB_FIELD = "_content_blob"
+
+class QuizContentStore:
+    """Per-worker side of compact storage: splits records on write, restores them on read.
+
+    Decoded contents are cached by hash (they never change). Hashes this
+    worker has stored are remembered, so the same quiz is not written again.
+    """
+
+    def __init__(self, cache_size: int):
+        self._contents = TTLCache(maxsize=cache_size, ttl=3600.0)
+        self._written = TTLCache(maxsize=cache_size, ttl=3600.0)
+        self.blobs_written = 0
+        self.blobs_deduplicated = 0
+        self.missing = 0
+
+    def compact(self, records: Iterable[dict]) -> List[dict]:
+        """generated_quizzes rows with content_hash; rows whose content this worker has not stored carry it in BLOB_FIELD."""
+        rows = []
+        for record in records:
+            row = dict(record)
+            content = row.pop('quiz_content', None)
+            blob = encode_content(content)
+            row['content_hash'] = blob['content_hash']
+            # Readers in this worker never need a round trip for a quiz it just wrote
+            self._contents.set(blob['content_hash'], content)
+            if self._written.peek(blob['content_hash']) is MISSING:
+                row[BLOB_FIELD] = blob
+            else:
+                self.blobs_deduplicated += 1
+            rows.append(row)
+        return rows
+
+    async def write_blobs(self, db, rows: List[dict]) -> List[dict]:
+        """Store the contents `rows` carry, then return the rows without them, ready to insert.
+
+        Run on the connection that inserts the rows, just before, so a row
+        never lands without its content; a hash only counts as stored once
+        the upsert has succeeded.
+        """
+        blobs, clean = {}, []
+        for row in rows:
+            blob = row.get(BLOB_FIELD)
+            if blob is not None:
+                row = {name: value for name, value in row.items() if name != BLOB_FIELD}
+                if self._written.peek(blob['content_hash']) is MISSING:
+                    blobs[blob['content_hash']] = blob
+            clean.append(row)
+        if blobs:
+            await execute(db.table('quiz_contents').upsert(
+                list(blobs.values()), ignore_duplicates=True, on_conflict='content_hash'))
+            for content_hash in blobs:
+                self._written.set(content_hash, True)
+            self.blobs_written += len(blobs)
+        return clean
+
+    def columns(self, requested: List[str]) -> List[str]:
+        # ListSpec hook: rows need their content_hash to be expanded
+        if compact_enabled() and 'quiz_content' in requested and 'content_hash' not in requested:
+            return requested + ['content_hash']
+        return requested
+
+    def select(self, columns: str) -> str:
+        return ", ".join(self.columns([column.strip() for column in columns.split(",")]))
+
+    async def load(self, hashes: Iterable[str]) -> Dict[str, Any]:
+        found, wanted = {}, []
+        for content_hash in set(hashes):
+            content = self._contents.get(content_hash)
+            if content is MISSING:
+                wanted.append(content_hash)
+            else:
+                found[content_hash] = content
+        for start in range(0, len(wanted), _LOOKUP_CHUNK):
+            async with get_supabase_pool().connection() as db:
+                query = db.table('quiz_contents').select('content_hash, encoding, body')\
+                    .in_('content_hash', wanted[start:start + _LOOKUP_CHUNK])
+                rows = (await execute(query)).data or []
+            for row in rows:
+                content = decode_content(row)
+                self._contents.set(row['content_hash'], content)
+                found[row['content_hash']] = content
+        return found
+
+    async def expand(self, rows: List[dict]) -> List[dict]:
+        """Fill `quiz_content` on compact rows (in place); inline rows are left as they are."""
+        hashes = [row['content_hash'] for row in rows if row.get('content_hash') and row.get('quiz_content') is None]
+        if not hashes:
+            return rows
+        contents = await self.load(hashes)
+        for row in rows:
+            content_hash = row.get('content_hash')
+            if content_hash and row.get('quiz_content') is None:
+                if content_hash not in contents:
+                    # The content write is still queued in another worker, or was lost
+                    self.missing += 1
+                    logger.warning(f"Quiz content {content_hash} not found")
+                row['quiz_content'] = contents.get(content_hash)
+        return rows
+
+    def stats(self) -> dict:
+        return {
+            "storage": config.QUIZ_STORAGE,
+            "contents_cache": self._contents.stats(),
+            "blobs_written": self.blobs_written,
+            "blobs_deduplicated": self.blobs_deduplicated,
+            "missing": self.missing,
+        }
+
+quiz_content_store = QuizContentStore(config.QUIZ_STORAGE_CACHE_SIZE)
+
+# Backfill --------------------------------------------------------------------
+
+async def _page(db, after, batch_size: int, compact: bool) -> List[dict]:
+    query = db.table('generated_quizzes').select('id, user_api_key, quiz_content, content_hash')
+    # backfill: rows still inline; restore: rows stored compactly
+    query = query.filter('quiz_content', 'not.is', 'null') if compact else query.filter('content_hash', 'not.is', 'null')
+    if after is not None:
+        query = query.gt('id', after)
+    return (await execute(query.order('id').limit(batch_size))).data or []
+
+async def backfill(batch_size: int, dry_run: bool = False, restore: bool = False) -> dict:
+    """Convert inline rows to compact storage (or back, with `restore`), one keyset page at a time.
+
+    Contents are written before the rows that point at them, so an
+    interrupted run leaves every row readable and can simply be re-run.
+    """
+    summary = {"rows": 0, "distinct_contents": 0, "inline_bytes": 0, "stored_bytes": 0}
+    seen = set()
+    after = None
+    while True:
+        async with get_supabase_pool().connection() as db:
+            rows = await _page(db, after, batch_size, compact=not restore)
+        if not rows:
+            break
+        after = rows[-1]['id']
+        if restore:
+            contents = await quiz_content_store.load(row['content_hash'] for row in rows)
+            updates = [{"id": row['id'], "user_api_key": row['user_api_key'],
+                        "quiz_content": contents[row['content_hash']], "content_hash": None}
+                       for row in rows if row['content_hash'] in contents]
+        else:
+            blobs = {}
+            updates = []
+            for row in rows:
+                blob = encode_content(row['quiz_content'])
+                summary["inline_bytes"] += blob["size"]
+                if blob['content_hash'] not in seen:
+                    seen.add(blob['content_hash'])
+                    blobs[blob['content_hash']] = blob
+                    summary["stored_bytes"] += len(blob["body"])
+                updates.append({"id": row['id'], "user_api_key": row['user_api_key'],
+                                "quiz_content": None, "content_hash": blob['content_hash']})
+            if not dry_run and blobs:
+                async with get_supabase_pool().connection() as db:
+                    await execute(db.table('quiz_contents').upsert(
+                        list(blobs.values()), ignore_duplicates=True, on_conflict='content_hash'))
+        if not dry_run and updates:
+            # Upsert on id only touches the columns sent
+            async with get_supabase_pool().connection() as db:
+                await execute(db.table('generated_quizzes').upsert(updates, on_conflict='id'))
+        summary["rows"] += len(updates)
+        logger.info(f"{'Restored' if restore else 'Compacted'} {summary['rows']} rows")
+    summary["distinct_contents"] = len(seen)
+    return summary
+
+def main():
+    # python quiz_storage.py backfill [--batch-size 500] [--dry-run] | restore [--batch-size 500]
+    parser = argparse.ArgumentParser(description="Convert generated_quizzes rows to or from compact storage")
+    parser.add_argument("command", choices=["backfill", "restore"],
+                        help="backfill: inline rows -> compact; restore: compact rows -> inline")
+    parser.add_argument("--batch-size", type=int, default=500, help="rows per page")
+    parser.add_argument("--dry-run", action="store_true", help="backfill: only report the space it would save")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s:%(name)s: %(message)s")
+
+    async def run():
+        await init_supabase_pool()
+        try:
+            return await backfill(args.batch_size, dry_run=args.dry_run, restore=args.command == "restore")
+        finally:
+            await close_supabase_pool()
+
+    summary = asyncio.run(run())
+    print(orjson.dumps(summary, option=orjson.OPT_INDENT_2).decode())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Incremental extraction of questions from a streamed quiz completion
+import json
+import re
+from typing import List
+
+_QUESTIONS_START = re.compile(r'"questions"\s*:\s*\[')
+
+class QuestionStreamParser:
+    """Pull complete question objects out of the `questions` array as text arrives.
+
+    The model output may wrap the JSON in a ```json fence or prose; only the
+    `"questions": [...]` array is tracked. Each top-level object in that
+    array is decoded as soon as its closing brace is seen.
+    """
+
+    def __init__(self):
+        self.buffer = ""
+        self.questions: List[dict] = []
+        self._pos = 0              # next character to scan
+        self._in_array = False
+        self._done = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._object_start = -1
+
+    def feed(self, text: str) -> List[dict]:
+        """Add a chunk of completion text; return the questions it completed."""
+        self.buffer += text
+        completed = []
+        if self._done:
+            return completed
+        if not self._in_array:
+            match = _QUESTIONS_START.search(self.buffer, self._pos)
+            if match is None:
+                # Keep a tail so a key split across chunks is still found
+                self._pos = max(0, len(self.buffer) - 32)
+                return completed
+            self._in_array = True
+            self._pos = match.end()
+
+        buffer = self.buffer
+        i = self._pos
+        end = len(buffer)
+        while i < end:
+            ch = buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                if self._depth == 0 and ch == "{":
+                    self._object_start = i
+                self._depth += 1
+            elif ch in "}]":
+                if self._depth == 0 and ch == "]":
+                    self._done = True
+                    i += 1
+                    break
+                self._depth -= 1
+                if self._depth == 0 and ch == "}" and self._object_start >= 0:
+                    try:
+                        question = json.loads(buffer[self._object_start:i + 1])
+                    except json.JSONDecodeError:
+                        question = None
+                    if isinstance(question, dict):
+                        self.questions.append(question)
+                        completed.append(question)
+                    self._object_start = -1
+            i += 1
+        self._pos = i
+        return completed
@@ -0,0 +1,263 @@
+# Tier-aware quota enforcement for quiz generation
+import asyncio
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from cache import TTLCache, MISSING
+from api_config import get_api_config, API_CONFIG_CHANNEL
+import config
+import invalidation
+
+logger = logging.getLogger(__name__)
+
+# (counter_key, limit, reset_at epoch seconds)
+Window = Tuple[str, int, float]
+
+def _grant(remaining: int, need: int, extra: int, parked: int) -> int:
+    # `need` plus a lease that keeps every worker's unspent leases for a window within `extra` units
+    # in total, and shrinks to a tenth of what is left as the quota runs out
+    return need + max(0, min(extra - parked, (remaining - need) // 10))
+
+class MemoryCounterStore:
+    """Per-process counters; each uvicorn worker enforces its own share."""
+
+    def __init__(self):
+        self._counters = {}
+        # counter_key -> {worker: units leased by its last reservation}
+        self._leases = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, windows: List[Window], need: int, extra: int, worker: str = "") -> Tuple[int, Optional[float]]:
+        """Take `need` (plus up to `extra`) units from every window: (granted, None), or (0, reset_at) if over quota.
+
+        `worker` has spent any lease it took before; leases other workers may
+        still hold count against `extra`.
+        """
+        now = time.time()
+        with self._lock:
+            remaining = None
+            parked = 0
+            for counter_key, limit, reset_at in windows:
+                count, expires_at = self._counters.get(counter_key, (0, 0.0))
+                if expires_at <= now:
+                    count = 0
+                    self._leases.pop(counter_key, None)
+                if count + need > limit:
+                    return 0, reset_at
+                remaining = limit - count if remaining is None else min(remaining, limit - count)
+                leases = self._leases.get(counter_key, {})
+                parked = max(parked, sum(units for owner, units in leases.items() if owner != worker))
+            granted = _grant(remaining, need, extra, parked)
+            for counter_key, limit, reset_at in windows:
+                count, expires_at = self._counters.get(counter_key, (0, 0.0))
+                if expires_at <= now:
+                    count = 0
+                self._counters[counter_key] = (count + granted, reset_at)
+                if extra:
+                    self._leases.setdefault(counter_key, {})[worker] = granted - need
+            if len(self._counters) > 100000:
+                self._counters = {k: v for k, v in self._counters.items() if v[1] > now}
+                self._leases = {k: v for k, v in self._leases.items() if k in self._counters}
+        return granted, None
+
+class SqliteCounterStore:
+    """Counters in a SQLite file shared by all workers on the host.
+
+    One connection per worker, opened on first use and shared by the
+    threads that call reserve() (serialized by a lock).
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._reservations = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            conn = self._connection()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS counters ("
+                "counter_key TEXT PRIMARY KEY, count INTEGER NOT NULL, expires_at REAL NOT NULL)"
+            )
+            # Units each worker leased with its last reservation, until it reserves again
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "counter_key TEXT NOT NULL, worker TEXT NOT NULL, units INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, PRIMARY KEY (counter_key, worker))"
+            )
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn = conn
+        return self._conn
+
+    def reserve(self, windows: List[Window], need: int, extra: int, worker: str = "") -> Tuple[int, Optional[float]]:
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            try:
+                # Check and increment every window in one write transaction
+                conn.execute("BEGIN IMMEDIATE")
+                remaining = None
+                parked = 0
+                for counter_key, limit, reset_at in windows:
+                    row = conn.execute(
+                        "SELECT count FROM counters WHERE counter_key = ? AND expires_at > ?",
+                        (counter_key, now),
+                    ).fetchone()
+                    count = row[0] if row else 0
+                    if count + need > limit:
+                        conn.execute("COMMIT")
+                        return 0, reset_at
+                    remaining = limit - count if remaining is None else min(remaining, limit - count)
+                    if extra:
+                        parked = max(parked, conn.execute(
+                            "SELECT COALESCE(SUM(units), 0) FROM leases "
+                            "WHERE counter_key = ? AND worker != ? AND expires_at > ?",
+                            (counter_key, worker, now),
+                        ).fetchone()[0])
+                granted = _grant(remaining, need, extra, parked)
+                for counter_key, limit, reset_at in windows:
+                    conn.execute(
+                        "INSERT INTO counters (counter_key, count, expires_at) VALUES (?, ?, ?) "
+                        "ON CONFLICT(counter_key) DO UPDATE SET "
+                        "count = CASE WHEN expires_at > ? THEN count + excluded.count ELSE excluded.count END, "
+                        "expires_at = excluded.expires_at",
+                        (counter_key, granted, reset_at, now),
+                    )
+                    if extra:
+                        conn.execute(
+                            "INSERT OR REPLACE INTO leases (counter_key, worker, units, expires_at) VALUES (?, ?, ?, ?)",
+                            (counter_key, worker, granted - need, reset_at),
+                        )
+                self._reservations += 1
+                if self._reservations % 1000 == 0:
+                    conn.execute("DELETE FROM counters WHERE expires_at <= ?", (now,))
+                    conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+                conn.execute("COMMIT")
+                return granted, None
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                # Start over with a fresh connection next time
+                conn.close()
+                self._conn = None
+                raise
+
+def create_counter_store():
+    if config.RATE_LIMIT_BACKEND == "memory":
+        return MemoryCounterStore()
+    return SqliteCounterStore(os.path.join(config.STATE_DIR, "rate_limits.db"))
+
+def _limit_value(value) -> Optional[int]:
+    # NULL or negative means unlimited
+    if value is None:
+        return None
+    value = int(value)
+    return value if value >= 0 else None
+
+def quota_windows(api_key: str, limits: dict, now: datetime) -> List[Window]:
+    """Daily and monthly (UTC calendar) windows for a key under its tier's limits."""
+    windows = []
+    daily = _limit_value(limits.get('max_daily_limit'))
+    if daily is not None:
+        day_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+        windows.append((f"{api_key}:d:{day_start:%Y-%m-%d}", daily, day_start.timestamp() + 86400))
+    monthly = _limit_value(limits.get('max_monthly_limit'))
+    if monthly is not None:
+        month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        if month_start.month == 12:
+            next_month = month_start.replace(year=month_start.year + 1, month=1)
+        else:
+            next_month = month_start.replace(month=month_start.month + 1)
+        windows.append((f"{api_key}:m:{month_start:%Y-%m}", monthly, next_month.timestamp()))
+    return windows
+
+class RateLimiter:
+    """Quota checks against leases of the shared counters.
+
+    The shared store is only touched when this worker's lease for a key
+    runs out: it then reserves the units needed plus a lease that later
+    requests spend in process. The store keeps the leases of all workers
+    for a window within RATE_LIMIT_LEASE_SIZE - 1 units, which no other
+    worker can spend: a key whose traffic stays on one worker can be
+    refused up to that many requests short of its quota. Unspent units
+    expire with their window.
+    """
+
+    def __init__(self, store, lease_size: int = 1):
+        self.store = store
+        self.lease_size = max(1, lease_size)
+        # Who holds a lease in the shared store
+        self.worker = f"{os.getpid()}-{id(self):x}"
+        # Window keys of an API key -> units reserved in the shared store but not yet spent
+        self._leases = TTLCache(maxsize=100000, ttl=86400.0)
+        # api_key -> reset_at for keys known to be over quota, so repeat
+        # offenders are rejected without touching the shared store
+        self._denied = TTLCache(maxsize=10000, ttl=60.0)
+        self.allowed = 0
+        self.denied = 0
+        self.reservations = 0
+
+    def clear_denials(self, _key=None):
+        self._denied.clear()
+
+    async def check(self, api_key: str, user_type: str, cost: int = 1) -> Optional[int]:
+        """Count `cost` requests against the key's quota; return Retry-After seconds if over it."""
+        now = time.time()
+        reset_at = self._denied.get(api_key)
+        if reset_at is not MISSING and reset_at > now:
+            self.denied += 1
+            return max(1, math.ceil(reset_at - now))
+
+        snapshot = await get_api_config()
+        limits = snapshot.usage_limits.get(user_type)
+        if limits is None:
+            # Tiers without a usage_limits row are not limited
+            self.allowed += 1
+            return None
+
+        windows = quota_windows(api_key, limits, datetime.now(timezone.utc))
+        if not windows:
+            self.allowed += 1
+            return None
+        lease_key = tuple(window[0] for window in windows)
+        expires_in = min(window[2] for window in windows) - now
+        # Take the whole lease before awaiting, so concurrent checks never spend the same units
+        leased = self._leases.peek(lease_key, 0)
+        if leased >= cost:
+            self._leases.set(lease_key, leased - cost, ttl=expires_in)
+            self.allowed += 1
+            return None
+        self._leases.delete(lease_key)
+        self.reservations += 1
+        granted, reset_at = await asyncio.to_thread(
+            self.store.reserve, windows, cost - leased, self.lease_size - 1, self.worker
+        )
+        left = self._leases.peek(lease_key, 0) + (leased + granted - cost if granted else leased)
+        if left:
+            self._leases.set(lease_key, left, ttl=expires_in)
+        if granted:
+            self.allowed += 1
+            return None
+        self.denied += 1
+        if cost == 1:
+            self._denied.set(api_key, reset_at, ttl=reset_at - now)
+        return max(1, math.ceil(reset_at - now))
+
+    def stats(self) -> dict:
+        return {"allowed": self.allowed, "denied": self.denied, "reservations": self.reservations,
+                "leases": len(self._leases), "denied_keys_cached": len(self._denied)}
+
+rate_limiter = RateLimiter(create_counter_store(), config.RATE_LIMIT_LEASE_SIZE)
+
+# Tier limits changed: forget cached denials so raised quotas apply at once
+invalidation.subscribe(API_CONFIG_CHANNEL, rate_limiter.clear_denials)
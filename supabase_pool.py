@@ -0,0 +1,130 @@
+# Process-wide pool of Supabase clients
+import asyncio
+import contextvars
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
+import config
+import metrics
+
+# Queries started through the connection checked out by the current task
+_running: contextvars.ContextVar[Optional[list]] = contextvars.ContextVar("supabase_running", default=None)
+
+class SupabasePool:
+    """Bounded pool of long-lived Supabase clients.
+
+    Each client keeps its own keep-alive HTTP session to PostgREST, so a
+    checkout reuses warm connections instead of building a new client.
+    """
+
+    def __init__(self, url: str, key: str, size: int, checkout_timeout: float):
+        self.size = size
+        self.checkout_timeout = checkout_timeout
+        self._clients = [
+            create_client(url, key, ClientOptions(postgrest_client_timeout=config.SUPABASE_QUERY_TIMEOUT))
+            for _ in range(size)
+        ]
+        self._idle: asyncio.Queue = asyncio.Queue()
+        for client in self._clients:
+            self._idle.put_nowait(client)
+        # Metrics
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.late_returns = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        start = time.monotonic()
+        if self._idle.empty():
+            self.waits += 1
+        try:
+            client = await asyncio.wait_for(self._idle.get(), timeout=self.checkout_timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        wait_ms = (time.monotonic() - start) * 1000
+        self.checkouts += 1
+        self.total_wait_ms += wait_ms
+        self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+        running = []
+        token = _running.set(running)
+        try:
+            yield client
+        finally:
+            _running.reset(token)
+            pending = [future for future in running if not future.done()]
+            if pending:
+                # The caller gave up (timeout or cancellation) while a worker thread is still
+                # running a query on this client: it goes back to the pool once the thread ends
+                self.late_returns += 1
+                done = asyncio.gather(*pending, return_exceptions=True)
+                done.add_done_callback(lambda _: self._idle.put_nowait(client))
+            else:
+                self._idle.put_nowait(client)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size,
+            "in_use": self.size - self._idle.qsize(),
+            "idle": self._idle.qsize(),
+            "checkouts": self.checkouts,
+            "waits": self.waits,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": round(self.total_wait_ms / self.checkouts, 2) if self.checkouts else 0.0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+            "late_returns": self.late_returns,
+        }
+
+    def close(self):
+        for client in self._clients:
+            if client._postgrest is not None:
+                client._postgrest.aclose()
+
+_pool: Optional[SupabasePool] = None
+metrics.watch_in_flight("supabase_clients", lambda: _pool.size - _pool._idle.qsize() if _pool is not None else 0)
+
+def create_supabase_pool() -> SupabasePool:
+    url: str = os.environ.get("SUPABASE_URL")
+    key: str = os.environ.get("SUPABASE_KEY")
+    return SupabasePool(url, key, config.SUPABASE_POOL_SIZE, config.SUPABASE_POOL_TIMEOUT)
+
+async def init_supabase_pool() -> SupabasePool:
+    global _pool
+    if _pool is None:
+        _pool = create_supabase_pool()
+    return _pool
+
+async def close_supabase_pool():
+    global _pool
+    if _pool is not None:
+        _pool.close()
+        _pool = None
+
+def get_supabase_pool() -> SupabasePool:
+    # Normally created by the app lifespan; created lazily for scripts and tests
+    global _pool
+    if _pool is None:
+        _pool = create_supabase_pool()
+    return _pool
+
+async def execute(query):
+    # supabase-py 2.0 only ships a blocking client; run the HTTP call in a
+    # worker thread so it does not stall the event loop. Cancelling the caller
+    # cannot stop the thread, so the future is shielded and recorded for
+    # SupabasePool.connection(), which keeps the client checked out until it ends.
+    loop = asyncio.get_running_loop()
+    call = functools.partial(contextvars.copy_context().run, query.execute)
+    future = loop.run_in_executor(None, call)
+    # Nobody may be left to see the error of an abandoned query
+    future.add_done_callback(lambda done: done.cancelled() or done.exception())
+    running = _running.get()
+    if running is not None:
+        running.append(future)
+    return await asyncio.shield(future)
@@ -0,0 +1,56 @@
+import pytest
+from fastapi import HTTPException
+from postgrest import SyncPostgrestClient
+from admin_pagination import ListSpec, build_page_query
+
+QUIZZES = ListSpec("quizzes", "id", ["id", "title"], ["id", "title", "created_at"], sort="created_at",
+                   user_key_column="user_api_key", date_column="created_at")
+USERS = ListSpec("users", "id", ["id", "email"], ["id", "email"], sort=None, desc=False)
+
+def db():
+    return SyncPostgrestClient("http://localhost/rest/v1")
+
+def test_cursor_round_trip():
+    row = {"id": 42, "created_at": "2026-01-02T03:04:05+00:00", "title": "t"}
+    assert QUIZZES.decode_cursor(QUIZZES.cursor_of(row)) == ["2026-01-02T03:04:05+00:00", 42]
+    assert USERS.decode_cursor(USERS.cursor_of({"id": 7})) == [7]
+
+@pytest.mark.parametrize("cursor", ["not base64!", "e30", USERS.cursor_of({"id": 7})])
+def test_bad_cursors_are_rejected(cursor):
+    with pytest.raises(HTTPException) as error:
+        QUIZZES.decode_cursor(cursor)
+    assert error.value.status_code == 400
+
+def test_columns_always_include_the_cursor_columns():
+    assert QUIZZES.columns("title") == "title, created_at, id"
+    assert QUIZZES.columns(None) == "id, title, created_at"
+    with pytest.raises(HTTPException):
+        QUIZZES.columns("title,password")
+
+def test_first_page_orders_on_both_columns_and_over_fetches_one_row():
+    params = build_page_query(db(), QUIZZES, "id", 50).params
+    assert params["order"] == "created_at.desc.nullslast,id.desc"
+    assert params["limit"] == "51"
+    assert "or" not in params
+
+def test_next_page_filters_after_the_cursor():
+    params = build_page_query(db(), QUIZZES, "id", 50, ["2026-01-02T03:04:05+00:00", 42]).params
+    assert params["or"] == (
+        '(created_at.lt."2026-01-02T03:04:05+00:00",'
+        'and(created_at.eq."2026-01-02T03:04:05+00:00",id.lt."42"),'
+        'created_at.is.null)'
+    )
+
+def test_null_sort_values_page_on_the_key_alone():
+    params = build_page_query(db(), QUIZZES, "id", 50, [None, 42]).params
+    assert params["created_at"] == "is.null"
+    assert params["id"] == "lt.42"
+
+def test_key_only_ascending_spec():
+    params = build_page_query(db(), USERS, "id", 10, [7]).params
+    assert params["id"] == "gt.7"
+    assert params["order"] == "id"
+
+def test_unsupported_filters_are_rejected():
+    with pytest.raises(HTTPException):
+        build_page_query(db(), USERS, "id", 10, user_api_key="k")
@@ -0,0 +1,74 @@
+# Which requests are charged against the rate limit
+import pytest
+from fastapi.testclient import TestClient
+import app as app_module
+import config
+from quiz_service import QuizResult
+
+VALID = {"content_type": "topic", "question_type": "mcq", "level": "easy", "content": "Tides", "num_of_question": 2}
+HEADERS = {"X-User-API-Key": "key"}
+
+@pytest.fixture
+def charges(monkeypatch):
+    charged = []
+
+    async def verify_user(user_api_key):
+        return "free"
+
+    async def check(api_key, user_type, cost=1):
+        charged.append(cost)
+        return None
+
+    async def fetch_api_config():
+        return "model-a", "openrouter-key"
+
+    async def route_models(user_type, params):
+        return ["model-a"]
+
+    async def generate_quiz_batch(items, openrouter_api_key, concurrency, timeout, bypass_cache=False):
+        return [QuizResult('{"questions": []}', "model-a", "hash") for _ in items]
+
+    async def noop(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(config, "RATE_LIMIT_ENABLED", True)
+    monkeypatch.setattr(app_module, "verify_user", verify_user)
+    monkeypatch.setattr(app_module.rate_limiter, "check", check)
+    monkeypatch.setattr(app_module, "fetch_api_config", fetch_api_config)
+    monkeypatch.setattr(app_module, "route_models", route_models)
+    monkeypatch.setattr(app_module, "generate_quiz_batch", generate_quiz_batch)
+    monkeypatch.setattr(app_module, "save_generated_quizzes", noop)
+    monkeypatch.setattr(app_module, "log_quiz_usage", noop)
+    return charged
+
+@pytest.fixture
+def client():
+    # No lifespan: nothing here reaches Supabase or OpenRouter
+    return TestClient(app_module.app)
+
+def test_batch_charges_only_valid_items(client, charges):
+    response = client.post("/generate-quiz/batch", headers=HEADERS, json={
+        "items": [VALID, {**VALID, "num_of_question": 0}, "not an object", VALID]
+    })
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 2
+    assert charges == [2]
+
+def test_batch_without_valid_items_is_not_charged(client, charges):
+    response = client.post("/generate-quiz/batch", headers=HEADERS, json={"items": [{"content": "x"}]})
+    assert response.status_code == 200
+    assert response.json()["succeeded"] == 0
+    assert charges == []
+
+def test_batch_rejects_a_non_numeric_concurrency(client, charges):
+    response = client.post("/generate-quiz/batch", headers=HEADERS, json={"items": [VALID], "concurrency": "lots"})
+    assert response.status_code == 400
+    assert charges == []
+
+@pytest.mark.parametrize("path", ["/generate-quiz", "/generate-quiz/stream", "/jobs/generate-quiz"])
+def test_invalid_requests_are_not_charged(client, charges, path):
+    response = client.post(path, headers=HEADERS, json={**VALID, "num_of_question": "many"})
+    assert response.status_code == 400
+    response = client.post(path, headers=HEADERS, json=[VALID])
+    assert response.status_code == 400
+    assert charges == []
@@ -0,0 +1,42 @@
+import asyncio
+from contextlib import asynccontextmanager
+from types import SimpleNamespace
+import pytest
+import dashboard_stats
+
+class RollupTable:
+    """Serves `rows` for the offset/limit of each query, and records the ranges asked for."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.ranges = []
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        return self
+
+    def gte(self, column, value):
+        return self
+
+    def order(self, columns):
+        return self
+
+    def range(self, start, end):
+        self.ranges.append((start, end))
+        return SimpleNamespace(execute=lambda: SimpleNamespace(data=self.rows[start:end + 1]))
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self
+
+@pytest.mark.parametrize("count", [0, 3, 10, 25])
+def test_rollup_pages_are_page_size_rows_without_overlap(monkeypatch, count):
+    monkeypatch.setattr(dashboard_stats, "ROLLUP_PAGE_SIZE", 10)
+    table = RollupTable([{"n": n} for n in range(count)])
+    monkeypatch.setattr(dashboard_stats, "get_supabase_pool", lambda: table)
+    rows = asyncio.run(dashboard_stats._rollup_rows("2026-01-01"))
+    assert [row["n"] for row in rows] == list(range(count))
+    assert all(end - start + 1 == 10 for start, end in table.ranges)
+    assert len(table.ranges) == count // 10 + 1
@@ -0,0 +1,61 @@
+import asyncio
+import threading
+import health
+import supabase_pool
+from supabase_pool import SupabasePool
+
+class SlowClient:
+    """Stands in for a Supabase client whose queries block until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.running = 0
+        self.most_running = 0
+        self._lock = threading.Lock()
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        return self
+
+    def limit(self, count):
+        return self
+
+    def execute(self):
+        with self._lock:
+            self.running += 1
+            self.most_running = max(self.most_running, self.running)
+        self.release.wait(5)
+        with self._lock:
+            self.running -= 1
+        return None
+
+def make_pool(monkeypatch, client) -> SupabasePool:
+    monkeypatch.setattr(supabase_pool, "create_client", lambda *args, **kwargs: client)
+    pool = SupabasePool("http://localhost", "key", size=1, checkout_timeout=0.05)
+    monkeypatch.setattr(health, "get_supabase_pool", lambda: pool)
+    return pool
+
+def test_timed_out_probe_keeps_the_client_until_its_query_ends(monkeypatch):
+    client = SlowClient()
+
+    async def scenario():
+        pool = make_pool(monkeypatch, client)
+        result = await health.probe("database", lambda: health._select_one("users"), 0.05)
+        assert result["status"] == "error" and "Timed out" in result["error"]
+        # The query thread is still running: its client must not be handed out again
+        assert pool.stats()["in_use"] == 1
+        second = await health.probe("database", lambda: health._select_one("users"), 0.2)
+        assert second["status"] == "error"
+        assert client.most_running == 1
+        client.release.set()
+        for _ in range(100):
+            if pool.stats()["idle"] == 1:
+                break
+            await asyncio.sleep(0.01)
+        assert pool.stats()["idle"] == 1
+        assert pool.late_returns == 1
+        assert (await health.probe("database", lambda: health._select_one("users"), 1.0))["status"] == "ok"
+
+    asyncio.run(scenario())
@@ -0,0 +1,92 @@
+import asyncio
+import pytest
+import config
+import jobs
+from jobs import JobQueue, MemoryJobStore, check_callback_url
+from quiz_service import QuizResult
+
+PARAMS = {"content_type": "topic", "question_type": "mcq", "level": "easy", "content": "Tides", "num_of_question": 2}
+
+class FlakyStore(MemoryJobStore):
+    """Fails the first `failures` finish() calls, as a locked or unwritable database would."""
+
+    def __init__(self, failures: int):
+        super().__init__()
+        self.failures = failures
+
+    def finish(self, job_id, status, result, error):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        super().finish(job_id, status, result, error)
+
+@pytest.fixture(autouse=True)
+def stub_pipeline(monkeypatch):
+    async def verify_user(user_api_key):
+        return "free"
+
+    async def run_quiz_pipeline(user_api_key, params, **kwargs):
+        return QuizResult('{"questions": []}', "model-a", "hash")
+
+    monkeypatch.setattr(jobs, "verify_user", verify_user)
+    monkeypatch.setattr(jobs, "run_quiz_pipeline", run_quiz_pipeline)
+    monkeypatch.setattr(config, "JOB_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(config, "JOB_LEASE_SECONDS", 0.05)
+    monkeypatch.setattr(config, "JOB_CALLBACK_ALLOWED_HOSTS", frozenset())
+
+async def wait_for_status(queue: JobQueue, job_id: str, status: str):
+    for _ in range(200):
+        job = await queue.get(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"job {job_id} never became {status}: {job['status']}")
+
+def test_worker_survives_a_failing_store():
+    async def scenario():
+        queue = JobQueue(FlakyStore(failures=1), concurrency=1)
+        await queue.start()
+        try:
+            first = await queue.submit("key", PARAMS)
+            second = await queue.submit("key", PARAMS)
+            # The failed finish leaves the first job leased; it is claimed again once the lease expires
+            assert (await wait_for_status(queue, second["id"], "succeeded"))["attempts"] == 1
+            assert (await wait_for_status(queue, first["id"], "succeeded"))["attempts"] == 2
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_worker_survives_an_invalid_callback_url():
+    async def scenario():
+        queue = JobQueue(MemoryJobStore(), concurrency=1)
+        await queue.start()
+        try:
+            first = await queue.submit("key", PARAMS, callback_url="http://[::1")
+            second = await queue.submit("key", PARAMS)
+            await wait_for_status(queue, first["id"], "succeeded")
+            await wait_for_status(queue, second["id"], "succeeded")
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+@pytest.mark.parametrize("url", [
+    "http://[::1",
+    "ftp://example.com/hook",
+    "http://127.0.0.1:8000/hook",
+    "http://10.0.0.5/hook",
+    "http://169.254.169.254/latest/meta-data",
+    "http://[::1]/hook",
+    "http://localhost/hook",
+])
+def test_callback_url_rejects_internal_targets(url):
+    assert asyncio.run(check_callback_url(url)) is not None
+
+def test_callback_url_accepts_public_addresses():
+    assert asyncio.run(check_callback_url("https://93.184.216.34/hook")) is None
+
+def test_callback_allowlist(monkeypatch):
+    monkeypatch.setattr(config, "JOB_CALLBACK_ALLOWED_HOSTS", frozenset({"hooks.internal"}))
+    assert asyncio.run(check_callback_url("http://hooks.internal/done")) is None
+    assert asyncio.run(check_callback_url("https://93.184.216.34/hook")) is not None
@@ -0,0 +1,81 @@
+import pytest
+import config
+import openrouter_keys
+from openrouter_keys import OpenRouterKeyPool, is_retryable_status, parse_retry_after
+
+ROWS = [{"id": 1, "api_key": "sk-one", "is_default": True}, {"id": 2, "api_key": "sk-two"}]
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(openrouter_keys.time, "monotonic", clock.monotonic)
+    monkeypatch.setattr(config, "OPENROUTER_KEY_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(config, "OPENROUTER_KEY_COOLDOWN", 30.0)
+    monkeypatch.setattr(config, "OPENROUTER_KEY_AUTH_COOLDOWN", 600.0)
+    return clock
+
+def pool(strategy: str = "least_in_flight") -> OpenRouterKeyPool:
+    keys = OpenRouterKeyPool(strategy)
+    keys.update(ROWS)
+    return keys
+
+def test_least_in_flight_spreads_concurrent_calls(clock):
+    keys = pool()
+    assert [keys.acquire().api_key for _ in range(4)] == ["sk-one", "sk-two", "sk-one", "sk-two"]
+
+def test_round_robin_follows_weights(clock):
+    keys = OpenRouterKeyPool("round_robin")
+    keys.update([{"api_key": "sk-one", "weight": 3}, {"api_key": "sk-two", "weight": 1}])
+    picks = []
+    for _ in range(8):
+        key = keys.acquire()
+        picks.append(key.api_key)
+        keys.release_success(key, 10.0)
+    assert picks.count("sk-one") == 6
+
+def test_circuit_opens_after_consecutive_failures_and_closes_after_the_cooldown(clock):
+    keys = pool()
+    first = keys._keys[0]
+    for _ in range(3):
+        keys.release_failure(keys.acquire(exclude={"sk-two"}), 502, "bad gateway")
+    assert first.is_open(clock.now)
+    assert all(keys.acquire().api_key == "sk-two" for _ in range(3))
+    clock.now += 31
+    assert not first.is_open(clock.now)
+
+def test_a_success_resets_the_failure_count(clock):
+    keys = pool()
+    first = keys._keys[0]
+    for status in (500, 500):
+        keys.release_failure(keys.acquire(exclude={"sk-two"}), status, "error")
+    keys.release_success(keys.acquire(exclude={"sk-two"}), 10.0)
+    keys.release_failure(keys.acquire(exclude={"sk-two"}), 500, "error")
+    assert not first.is_open(clock.now)
+
+def test_rate_limits_honour_retry_after_and_auth_errors_cool_down_longer(clock):
+    keys = pool()
+    first, second = keys._keys
+    keys.release_failure(keys.acquire(exclude={"sk-two"}), 429, "rate limited", retry_after=5.0)
+    keys.release_failure(keys.acquire(exclude={"sk-one"}), 401, "revoked")
+    assert first.open_until == clock.now + 5.0
+    assert second.open_until == clock.now + 600.0
+    # Every key open: the one that recovers first is probed
+    assert keys.acquire().api_key == "sk-one"
+
+def test_update_keeps_live_counters():
+    keys = pool()
+    keys.acquire()
+    keys.update(ROWS + [{"api_key": "sk-three"}])
+    assert [key.requests for key in keys._keys] == [1, 0, 0]
+
+def test_retry_helpers():
+    assert is_retryable_status(None) and is_retryable_status(429) and is_retryable_status(503)
+    assert not is_retryable_status(400)
+    assert parse_retry_after("2.5") == 2.5 and parse_retry_after("soon") is None
@@ -0,0 +1,47 @@
+import asyncio
+import time
+import pytest
+import config
+from question_bank import QuestionBank, pool_of
+
+PARAMS = {"content_type": "topic", "question_type": "mcq", "level": "easy", "content": "Photosynthesis",
+          "num_of_question": 5}
+
+@pytest.fixture
+def bank(monkeypatch):
+    monkeypatch.setattr(config, "QUESTION_BANK_MIN_POOL_FACTOR", 2.0)
+    bank = QuestionBank()
+    key = pool_of(PARAMS)[0]
+    rows = [{"id": n, "question": {"stem": f"Question {n}"}, "model_name": "model-a"} for n in range(40)]
+    bank._sizes[key] = len(rows)
+    bank._pools.set(key, rows)
+    bank._headers[key] = {"title": "Photosynthesis",
+                          "context": "Here are 10 questions on the topic: Photosynthesis with easy difficulty."}
+    return bank
+
+def sample(bank, user="user-key", count=5):
+    return asyncio.run(bank.sample({**PARAMS, "num_of_question": count}, user))
+
+def test_sampled_header_states_the_sampled_count(bank):
+    quiz, model = sample(bank)
+    assert len(quiz["questions"]) == 5
+    assert quiz["context"] == "Here are 5 questions on the topic: Photosynthesis with easy difficulty."
+    assert quiz["title"] == "Photosynthesis" and model == "model-a"
+
+def test_a_user_is_not_served_the_same_question_twice(bank):
+    served = [q["stem"] for _ in range(3) for q in sample(bank)[0]["questions"]]
+    assert len(set(served)) == 15
+    # 25 unseen left, fewer than twice the 15 asked for: generated live instead
+    assert sample(bank, count=15) is None
+    assert sample(bank, user="other-key", count=15) is not None
+
+def test_repeat_window_runs_from_the_first_sample(bank, monkeypatch):
+    clock = [time.monotonic()]
+    monkeypatch.setattr("cache.time.monotonic", lambda: clock[0])
+    bank._served.ttl = 100.0
+    sample(bank)
+    clock[0] += 60
+    sample(bank)
+    clock[0] += 50
+    # Sampling again did not push the window forward
+    assert bank._served.peek(("user-key", pool_of(PARAMS)[0]), None) is None
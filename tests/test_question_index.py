@@ -0,0 +1,49 @@
+import asyncio
+import random
+import config
+from question_index import QuestionIndex, jaccard, quiz_questions
+from quiz_chunking import normalize_stem
+
+def random_stem(rng: random.Random, words: int = 10) -> str:
+    return " ".join(f"w{rng.randrange(100000)}" for _ in range(words))
+
+def near_duplicate(rng: random.Random, stem: str) -> str:
+    # One word of ten replaced: word Jaccard 9 / 11 = 0.82
+    words = stem.split()
+    words[rng.randrange(len(words))] = f"x{rng.randrange(100000)}"
+    return " ".join(words)
+
+def test_recall_at_the_configured_threshold():
+    rng = random.Random(7)
+    threshold = config.QUIZ_DEDUP_THRESHOLD
+    index = QuestionIndex(config.QUESTION_INDEX_PERMUTATIONS, config.QUESTION_INDEX_BANDS)
+    stems = [random_stem(rng) for _ in range(300)]
+    for number, stem in enumerate(stems):
+        index.add_quiz(str(number), [{"stem": stem}])
+    queries = [near_duplicate(rng, stem) for stem in stems]
+    assert all(jaccard(normalize_stem(query), normalize_stem(stem)) >= threshold for query, stem in zip(queries, stems))
+    found = sum(
+        any(match["quiz_id"] == str(number) for match in index.similar(query, threshold, 5))
+        for number, query in enumerate(queries)
+    )
+    # ~98% expected with 8 bands of 4 rows
+    assert found / len(queries) >= 0.93
+
+def test_unrelated_stems_are_not_matched():
+    rng = random.Random(11)
+    index = QuestionIndex(32, 8)
+    for number in range(200):
+        index.add_quiz(str(number), [{"stem": random_stem(rng)}])
+    assert all(not index.similar(random_stem(rng), 0.8, 5) for _ in range(50))
+
+def test_clusters_group_near_duplicates():
+    index = QuestionIndex(32, 8)
+    index.add_quiz("a", [{"stem": "What is the boiling point of water at sea level?"}])
+    index.add_quiz("b", [{"stem": "What is the boiling point of water at sea level"}, {"stem": "Who wrote Hamlet?"}])
+    index.add_quiz("a", [{"stem": "Ignored: quiz a is already indexed"}])
+    clusters = asyncio.run(index.clusters(0.8))
+    assert [sorted(index.entries[entry][0] for entry in cluster) for cluster in clusters] == [["a", "b"]]
+
+def test_quiz_questions_reads_raw_text_rows():
+    assert quiz_questions({"content": '```json\n{"questions": [{"stem": "Q?"}]}\n```'}) == [{"stem": "Q?"}]
+    assert quiz_questions({"questions": "not a list"}) == []
@@ -0,0 +1,55 @@
+import asyncio
+import time
+from quiz_cache import QuizResponseCache, quiz_cache_key
+
+class StubCache(QuizResponseCache):
+    """Persistent tier answered from a dict instead of generated_quizzes."""
+
+    def __init__(self, rows: dict, **kwargs):
+        super().__init__(maxsize=100, ttl=3600.0, **kwargs)
+        self.rows = rows
+        self.lookups = 0
+
+    async def _load_persistent(self, key):
+        self.lookups += 1
+        return list(self.rows.get(key, []))[:self.variants]
+
+def test_key_depends_on_model_and_prompt():
+    assert quiz_cache_key("a", "prompt") != quiz_cache_key("b", "prompt")
+    assert quiz_cache_key("a", "prompt") == quiz_cache_key("a", "prompt")
+
+def test_memory_tier_rotates_variants():
+    cache = QuizResponseCache(maxsize=10, ttl=60.0, variants=2, persistent=False)
+
+    async def scenario():
+        cache.add("k", "one")
+        assert await cache.get("k") is None
+        cache.add("k", "two")
+        return [await cache.get("k") for _ in range(4)]
+
+    assert asyncio.run(scenario()) == ["one", "two", "one", "two"]
+
+def test_persistent_miss_is_retried_after_the_negative_ttl():
+    rows = {}
+    cache = StubCache(rows, variants=1, persistent=True, negative_ttl=0.05)
+
+    async def scenario():
+        assert await cache.get("k") is None
+        # Remembered briefly...
+        assert await cache.get("k") is None
+        assert cache.lookups == 1
+        # ...until another worker's row shows up
+        rows["k"] = ["from another worker"]
+        await asyncio.sleep(0.06)
+        assert await cache.get("k") == "from another worker"
+        assert await cache.get("k") == "from another worker"
+        assert cache.lookups == 2
+
+    asyncio.run(scenario())
+
+def test_complete_entries_keep_the_full_ttl():
+    cache = StubCache({}, variants=1, persistent=True, negative_ttl=0.01)
+    cache.add("k", "local")
+    time.sleep(0.02)
+    assert asyncio.run(cache.get("k")) == "local"
+    assert cache.lookups == 0
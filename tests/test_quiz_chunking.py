@@ -0,0 +1,39 @@
+import pytest
+import config
+from prompt_selector import select_and_customize_prompt
+from quiz_chunking import chunk_params, dedupe_questions, split_question_counts
+from quiz_params import parse_quiz_params
+
+PARAMS = {"content_type": "topic", "question_type": "mcq", "level": "easy", "content": "Photosynthesis"}
+
+@pytest.mark.parametrize("total, size, expected", [
+    (1, 10, [1]),
+    (10, 10, [10]),
+    (21, 10, [7, 7, 7]),
+    (25, 10, [9, 8, 8]),
+    (100, 10, [10] * 10),
+])
+def test_split_question_counts(total, size, expected):
+    assert split_question_counts(total, size) == expected
+
+def test_chunks_differ_and_keep_the_custom_instruction():
+    params = {**PARAMS, "num_of_question": 30, "custom instruction": "Use SI units"}
+    first, second = chunk_params(params, 15, 1, 2), chunk_params(params, 15, 2, 2)
+    assert first["num_of_question"] == 15
+    assert first["custom instruction"].startswith("Use SI units. ")
+    assert select_and_customize_prompt(first) != select_and_customize_prompt(second)
+
+def test_question_count_is_bounded():
+    assert parse_quiz_params({**PARAMS, "num_of_question": config.MAX_QUESTIONS_PER_REQUEST}) is not None
+    assert parse_quiz_params({**PARAMS, "num_of_question": config.MAX_QUESTIONS_PER_REQUEST + 1}) is None
+    assert select_and_customize_prompt({**PARAMS, "num_of_question": 1_000_000_000}) == ""
+
+def test_dedupe_drops_near_duplicate_stems():
+    questions = [
+        {"stem": "What is the capital of France?"},
+        {"stem": "What is the capital of France"},
+        {"stem": "Which river flows through Paris?"},
+    ]
+    assert [q["stem"] for q in dedupe_questions(questions, 0.8)] == [
+        "What is the capital of France?", "Which river flows through Paris?"
+    ]
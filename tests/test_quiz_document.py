@@ -0,0 +1,98 @@
+import asyncio
+import itertools
+import json
+import pytest
+import config
+import quiz_service
+from quiz_document import allocate_questions, estimate_tokens, iter_sections, plan_sections
+from quiz_service import DocumentGeneration, QuizResult
+
+def make_document(chapters: int, paragraphs: int, sentences: int, headings: bool = True) -> str:
+    parts = []
+    for chapter in range(chapters):
+        if headings:
+            parts.append(f"## Chapter {chapter + 1}")
+        for paragraph in range(paragraphs):
+            parts.append(" ".join(
+                f"Fact {chapter}.{paragraph}.{sentence} is explained here with care." for sentence in range(sentences)
+            ))
+    return "\n\n".join(parts)
+
+def test_sections_cover_the_content_in_order():
+    content = make_document(5, 8, 10)
+    spans = list(iter_sections(content, 500))
+    assert len(spans) > 1
+    assert all(left[1] <= right[0] for left, right in zip(spans, spans[1:]))
+    # Only the whitespace between paragraphs is left out
+    assert "".join(content[start:end] for start, end in spans).replace("\n", "") == content.replace("\n", "")
+
+def test_headings_start_sections():
+    content = make_document(4, 8, 12)
+    spans = plan_sections(content, 20, 1500, 40)
+    assert len(spans) == 4
+    assert all(content[start:end].startswith("## Chapter") for start, end in spans)
+
+def test_paragraph_without_breaks_is_cut():
+    content = "word " * 20000
+    spans = list(iter_sections(content, 1000))
+    assert len(spans) == 25
+    assert all(end - start <= 4000 for start, end in spans)
+
+def test_few_questions_never_exceed_max_tokens():
+    content = make_document(10, 20, 12)
+    spans = plan_sections(content, 1, 1500, 40, max_tokens=3000)
+    assert max(estimate_tokens(content[start:end]) for start, end in spans) <= 3000
+
+@pytest.mark.parametrize("total", [1, 5, 12, 40])
+def test_allocation_is_proportional_and_complete(total):
+    spans = [(0, 4000), (4000, 6000), (6000, 7000)]
+    counts = allocate_questions(spans, total)
+    assert sum(counts) == total
+    assert counts == sorted(counts, reverse=True)
+
+_stems = itertools.count()
+
+def quiz_for(params: dict) -> str:
+    return json.dumps({"topic": "Derived from paragraph", "questions": [
+        # Distinct words in every stem, so merging keeps them all
+        {"stem": " ".join(f"w{next(_stems)}" for _ in range(6)), "options": ["A", "B", "C", "D"],
+         "correct_option": "A"}
+        for i in range(int(params["num_of_question"]))
+    ]})
+
+@pytest.fixture
+def stub_generation(monkeypatch):
+    calls = []
+
+    async def generate(final_prompt, models, openrouter_api_key, bypass_cache=False, params=None):
+        calls.append(params)
+        return QuizResult(quiz_for(params), models[0], "hash")
+
+    async def generate_chunked(params, final_prompt, models, openrouter_api_key, bypass_cache=False):
+        calls.append(params)
+        return QuizResult(quiz_for(params), models[0], "hash")
+
+    monkeypatch.setattr(quiz_service, "generate_quiz_content", generate)
+    monkeypatch.setattr(quiz_service, "generate_chunked_quiz", generate_chunked)
+    monkeypatch.setattr(config, "QUIZ_CACHE_ENABLED", False)
+    monkeypatch.setattr(config, "DOCUMENT_SPLIT_TOKENS", 3000)
+    return calls
+
+async def run_document(params: dict):
+    document = DocumentGeneration(params, ["model-a"], "key")
+    async for _ in document.questions():
+        pass
+    return document.result("hash")
+
+@pytest.mark.parametrize("num_of_question", [1, 5, 30])
+def test_long_document_with_few_questions_terminates(stub_generation, num_of_question):
+    # ~25k tokens without headings: sections are capped at DOCUMENT_SPLIT_TOKENS and never split again
+    content = make_document(20, 20, 6, headings=False)
+    assert estimate_tokens(content) > 20000
+    params = {"content_type": "paragraph", "question_type": "mcq", "level": "easy",
+              "content": content, "num_of_question": num_of_question}
+    outcome = asyncio.run(asyncio.wait_for(run_document(params), timeout=5))
+    assert outcome is not None
+    assert len(json.loads(outcome[0])["questions"]) == num_of_question
+    assert 1 <= len(stub_generation) <= num_of_question
+    assert all(estimate_tokens(call["content"]) <= 3000 for call in stub_generation)
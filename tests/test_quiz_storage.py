@@ -0,0 +1,113 @@
+import asyncio
+from contextlib import asynccontextmanager
+import httpx
+import config
+import write_behind
+from quiz_service import QuizResult
+from quiz_storage import BLOB_FIELD, QuizContentStore, decode_content, encode_content
+from write_behind import WriteBehindBuffer
+
+QUIZ = {"topic": "Tides", "questions": [{"stem": "What causes tides?", "options": ["Moon", "Wind"], "correct_option": "Moon"}]}
+
+def test_encoding_round_trips_and_hashes_the_content():
+    blob = encode_content(QUIZ)
+    assert decode_content(blob) == QUIZ
+    assert blob["content_hash"] == encode_content(dict(QUIZ))["content_hash"]
+    assert blob["content_hash"] != encode_content({**QUIZ, "topic": "Waves"})["content_hash"]
+
+class FakeQuery:
+    def __init__(self, db, table):
+        self.db = db
+        self.table = table
+        self.rows = []
+
+    def upsert(self, rows, **options):
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    insert = upsert
+
+    def execute(self):
+        if self.table in self.db.down:
+            raise httpx.ConnectError("connection refused")
+        self.db.log.append((self.table, self.rows))
+
+class FakeDb:
+    """Records (table, rows) per executed insert or upsert; tables in `down` fail like an outage."""
+
+    def __init__(self):
+        self.log = []
+        self.down = set()
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    @asynccontextmanager
+    async def connection(self):
+        yield self
+
+def test_rows_carry_their_content_until_it_is_stored():
+    store = QuizContentStore(100)
+    db = FakeDb()
+    rows = store.compact([{"id": 1, "quiz_content": QUIZ}, {"id": 2, "quiz_content": QUIZ}])
+    assert all("quiz_content" not in row and row[BLOB_FIELD]["content_hash"] == row["content_hash"] for row in rows)
+    clean = asyncio.run(store.write_blobs(db, rows))
+    assert [table for table, _ in db.log] == ["quiz_contents"] and len(db.log[0][1]) == 1
+    assert all(BLOB_FIELD not in row for row in clean)
+    # Stored by this worker: not carried again
+    assert BLOB_FIELD not in store.compact([{"id": 3, "quiz_content": QUIZ}])[0]
+
+def test_a_failed_content_write_is_not_remembered():
+    store = QuizContentStore(100)
+    db = FakeDb()
+    db.down.add("quiz_contents")
+    rows = store.compact([{"id": 1, "quiz_content": QUIZ}])
+    try:
+        asyncio.run(store.write_blobs(db, rows))
+    except httpx.ConnectError:
+        pass
+    assert BLOB_FIELD in store.compact([{"id": 2, "quiz_content": QUIZ}])[0]
+
+def test_contents_are_written_before_their_rows_in_the_same_flush(monkeypatch):
+    store = QuizContentStore(100)
+    db = FakeDb()
+    monkeypatch.setattr(write_behind, "get_supabase_pool", lambda: db)
+    buffer = WriteBehindBuffer("generated_quizzes", max_batch=10, flush_interval=60.0, max_queue=100,
+                               max_retries=1, prepare=store.write_blobs)
+    for row in store.compact([{"id": 1, "quiz_content": QUIZ}, {"id": 2, "quiz_content": {"topic": "Waves"}}]):
+        buffer.enqueue(row)
+    db.down.add("generated_quizzes")
+    assert asyncio.run(buffer.flush()) is False
+    db.down.clear()
+    assert asyncio.run(buffer.flush()) is True
+    tables = [table for table, _ in db.log]
+    assert tables == ["quiz_contents", "generated_quizzes"]
+    assert all(BLOB_FIELD not in row for row in db.log[1][1])
+
+def test_expand_restores_compact_rows_and_keeps_inline_ones(monkeypatch):
+    store = QuizContentStore(100)
+    blob = encode_content(QUIZ)
+
+    async def load(hashes):
+        return {content_hash: QUIZ for content_hash in hashes if content_hash == blob["content_hash"]}
+
+    monkeypatch.setattr(store, "load", load)
+    rows = [{"id": 1, "quiz_content": None, "content_hash": blob["content_hash"]},
+            {"id": 2, "quiz_content": {"inline": True}},
+            {"id": 3, "quiz_content": None, "content_hash": "missing"}]
+    asyncio.run(store.expand(rows))
+    assert [row["quiz_content"] for row in rows] == [QUIZ, {"inline": True}, None]
+    assert store.missing == 1
+
+def test_columns_add_the_hash_only_in_compact_mode(monkeypatch):
+    store = QuizContentStore(10)
+    monkeypatch.setattr(config, "QUIZ_STORAGE", "inline")
+    assert store.select("id, quiz_content") == "id, quiz_content"
+    monkeypatch.setattr(config, "QUIZ_STORAGE", "compact")
+    assert store.select("id, quiz_content") == "id, quiz_content, content_hash"
+    assert store.columns(["id"]) == ["id"]
+
+def test_quiz_result_parses_its_content_once():
+    result = QuizResult('{"questions": [{"stem": "Q?"}]}', "model-a", "hash")
+    assert result.quiz_json is result.quiz_json
+    assert result.questions == [{"stem": "Q?"}]
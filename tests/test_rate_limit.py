@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import pytest
+import rate_limit
+from api_config import ApiConfigSnapshot
+from rate_limit import MemoryCounterStore, RateLimiter, SqliteCounterStore
+
+class CountingStore(MemoryCounterStore):
+    def __init__(self):
+        super().__init__()
+        self.calls = 0
+
+    def reserve(self, windows, need, extra, worker=""):
+        self.calls += 1
+        return super().reserve(windows, need, extra, worker)
+
+@pytest.fixture
+def limits(monkeypatch):
+    tiers = {"free": {"max_daily_limit": 100, "max_monthly_limit": None}}
+
+    async def get_api_config():
+        return ApiConfigSnapshot("model-a", "key", usage_limits=tiers)
+
+    monkeypatch.setattr(rate_limit, "get_api_config", get_api_config)
+    return tiers
+
+def run_checks(limiter: RateLimiter, count: int, api_key: str = "key", cost: int = 1):
+    async def checks():
+        return [await limiter.check(api_key, "free", cost) for _ in range(count)]
+    return asyncio.run(checks())
+
+def test_leases_spare_the_shared_store(limits):
+    store = CountingStore()
+    results = run_checks(RateLimiter(store, lease_size=10), 50)
+    assert results == [None] * 50
+    assert store.calls < 10
+
+def test_quota_is_exact_across_workers(limits):
+    # Three workers sharing one store never admit more than the limit, and together use all of it
+    limits["free"]["max_daily_limit"] = 37
+    store = MemoryCounterStore()
+    workers = [RateLimiter(store, lease_size=10) for _ in range(3)]
+    admitted = 0
+    for _ in range(30):
+        for worker in workers:
+            admitted += run_checks(worker, 1)[0] is None
+    assert admitted <= 37
+    assert admitted >= 37 - 3
+
+@pytest.mark.parametrize("store_factory", [MemoryCounterStore, "sqlite"])
+def test_skewed_traffic_loses_at_most_one_lease(limits, tmp_path, store_factory):
+    # One request each to workers 0-2 (which then go quiet), the rest to worker 3: the units
+    # leased to the quiet workers are the only shortfall, and they stay within one lease
+    if store_factory == "sqlite":
+        store = SqliteCounterStore(str(tmp_path / "rate_limits.db"))
+    else:
+        store = store_factory()
+    workers = [RateLimiter(store, lease_size=10) for _ in range(4)]
+    admitted = sum(run_checks(worker, 1)[0] is None for worker in workers[:3])
+    admitted += sum(result is None for result in run_checks(workers[3], 150))
+    assert 100 - 9 <= admitted <= 100
+
+def test_lease_size_one_is_exact_under_skew(limits):
+    store = MemoryCounterStore()
+    workers = [RateLimiter(store, lease_size=1) for _ in range(4)]
+    admitted = sum(run_checks(worker, 1)[0] is None for worker in workers[:3])
+    admitted += sum(result is None for result in run_checks(workers[3], 150))
+    assert admitted == 100
+
+def test_over_quota_returns_retry_after(limits):
+    limits["free"]["max_daily_limit"] = 3
+    results = run_checks(RateLimiter(MemoryCounterStore(), lease_size=10), 5)
+    assert results[:3] == [None] * 3
+    assert all(isinstance(retry_after, int) and retry_after >= 1 for retry_after in results[3:])
+
+def test_batch_cost_larger_than_the_lease(limits):
+    limiter = RateLimiter(MemoryCounterStore(), lease_size=10)
+    assert run_checks(limiter, 1, cost=60) == [None]
+    assert run_checks(limiter, 1, cost=60)[0] is not None
+    assert run_checks(limiter, 1, cost=40) == [None]
+
+def test_sqlite_store_reuses_one_connection_across_threads(tmp_path):
+    store = SqliteCounterStore(str(tmp_path / "rate_limits.db"))
+    windows = [("key:d:2026-01-01", 1000, 4102444800.0)]
+    granted = []
+
+    def reserve():
+        for _ in range(20):
+            granted.append(store.reserve(windows, 1, 0)[0])
+
+    threads = [threading.Thread(target=reserve) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(granted) == 80
+    conn = store._conn
+    store.reserve(windows, 1, 0)
+    assert store._conn is conn
+    assert conn.execute("SELECT count FROM counters").fetchone()[0] == 81
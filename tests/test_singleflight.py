@@ -0,0 +1,60 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+def test_concurrent_callers_share_one_call():
+    async def scenario():
+        flights = SingleFlight()
+        calls = 0
+
+        async def work():
+            nonlocal calls
+            calls += 1
+            await asyncio.sleep(0.01)
+            return "result"
+
+        results = await asyncio.gather(*(flights.do("key", work) for _ in range(5)))
+        assert calls == 1
+        assert sorted(shared for _, shared in results) == [False, True, True, True, True]
+        assert {result for result, _ in results} == {"result"}
+        # Forgotten once done: the next call runs again
+        await flights.do("key", work)
+        assert calls == 2
+        assert flights.stats() == {"in_flight": 0, "leaders": 2, "followers": 4}
+
+    asyncio.run(scenario())
+
+def test_errors_reach_every_caller():
+    async def scenario():
+        flights = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0.01)
+            raise RuntimeError("upstream down")
+
+        results = await asyncio.gather(*(flights.do("key", fail) for _ in range(3)), return_exceptions=True)
+        assert all(isinstance(result, RuntimeError) for result in results)
+        assert flights.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    async def scenario():
+        flights = SingleFlight()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(0.05)
+            return "done"
+
+        leader = asyncio.ensure_future(flights.do("key", work))
+        await started.wait()
+        follower = asyncio.ensure_future(flights.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        assert await follower == ("done", True)
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(scenario())
@@ -0,0 +1,126 @@
+import asyncio
+import httpx
+import pytest
+from postgrest.exceptions import APIError
+from write_behind import WriteBehindBuffer, is_transient
+
+class StubBuffer(WriteBehindBuffer):
+    """Inserts into a list; rows with "bad" set fail, like rows violating a constraint."""
+
+    def __init__(self, **kwargs):
+        options = dict(max_batch=3, flush_interval=60.0, max_queue=100, max_retries=1)
+        options.update(kwargs)
+        super().__init__("table", **options)
+        self.batches = []
+
+    async def _insert(self, rows):
+        await asyncio.sleep(0)
+        if any(row.get("bad") for row in rows):
+            raise RuntimeError("constraint violated")
+        self.batches.append([row["n"] for row in rows])
+
+def test_full_batches_flush_without_waiting_for_the_interval():
+    async def scenario():
+        buffer = StubBuffer()
+        buffer.start()
+        for n in range(3):
+            buffer.enqueue({"n": n})
+        for _ in range(100):
+            if buffer.batches:
+                break
+            await asyncio.sleep(0.01)
+        assert buffer.batches == [[0, 1, 2]]
+        await buffer.stop(timeout=1.0)
+
+    asyncio.run(scenario())
+
+def test_stop_drains_everything_queued():
+    async def scenario():
+        buffer = StubBuffer(max_batch=1000)
+        buffer.start()
+        for n in range(7):
+            buffer.enqueue({"n": n})
+        await buffer.stop(timeout=1.0)
+        assert [n for batch in buffer.batches for n in batch] == list(range(7))
+        assert buffer.stats()["queued"] == 0
+        assert not buffer.running
+
+    asyncio.run(scenario())
+
+def test_a_bad_row_does_not_block_its_batch():
+    async def scenario():
+        buffer = StubBuffer()
+        for n in range(3):
+            buffer.enqueue({"n": n, "bad": n == 1})
+        await buffer.flush()
+        assert buffer.batches == [[0], [2]]
+        assert buffer.stats()["written"] == 2
+        assert buffer.stats()["dropped"] == 1
+
+    asyncio.run(scenario())
+
+def test_a_full_queue_drops_the_oldest_rows():
+    buffer = StubBuffer(max_batch=100, max_queue=2)
+    for n in range(3):
+        buffer.enqueue({"n": n})
+    asyncio.run(buffer.flush())
+    assert buffer.batches == [[1, 2]]
+    assert buffer.dropped == 1
+
+class OutageBuffer(StubBuffer):
+    """Fails every insert with `error` while `down` is set."""
+
+    def __init__(self, error: Exception, **kwargs):
+        super().__init__(**kwargs)
+        self.error = error
+        self.down = True
+
+    async def _insert(self, rows):
+        if self.down:
+            raise self.error
+        await super()._insert(rows)
+
+@pytest.mark.parametrize("error", [
+    httpx.ConnectError("connection refused"),
+    httpx.ReadTimeout("timed out"),
+    asyncio.TimeoutError(),
+    APIError({"message": "JSON could not be generated", "code": 502}),
+    APIError({"message": "Could not connect to the database", "code": "PGRST000"}),
+    APIError({"message": "canceling statement due to statement timeout", "code": "57014"}),
+])
+def test_rows_survive_an_outage_and_are_written_after_recovery(error):
+    async def scenario():
+        buffer = OutageBuffer(error)
+        for n in range(5):
+            buffer.enqueue({"n": n})
+        assert await buffer.flush() is False
+        assert await buffer.flush() is False
+        assert buffer.stats()["queued"] == 5
+        assert buffer.dropped == 0
+        buffer.enqueue({"n": 5})
+        buffer.down = False
+        assert await buffer.flush() is True
+        assert [n for batch in buffer.batches for n in batch] == list(range(6))
+        assert buffer.stats()["written"] == 6
+
+    asyncio.run(scenario())
+
+def test_the_background_loop_retries_until_the_database_is_back():
+    async def scenario():
+        buffer = OutageBuffer(httpx.ConnectError("connection refused"), flush_interval=0.01)
+        buffer.start()
+        for n in range(4):
+            buffer.enqueue({"n": n})
+        await asyncio.sleep(0.1)
+        assert buffer.batches == [] and buffer.failed_flushes >= 2
+        buffer.down = False
+        await buffer.stop(timeout=1.0)
+        assert [n for batch in buffer.batches for n in batch] == list(range(4))
+        assert buffer.dropped == 0
+
+    asyncio.run(scenario())
+
+def test_a_constraint_error_is_not_retried_as_an_outage():
+    error = APIError({"message": "duplicate key value violates unique constraint", "code": "23505"})
+    assert not is_transient(error)
+    assert not is_transient(APIError({"message": "JSON could not be generated", "code": 400}))
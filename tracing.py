@@ -0,0 +1,75 @@
+# Per-request trace IDs (propagated into log records) and HTTP request metrics
+import logging
+import time
+import uuid
+from contextvars import ContextVar
+import metrics
+
+TRACE_HEADER = "x-request-id"
+LOG_FORMAT = "%(levelname)s:%(name)s:[%(trace_id)s] %(message)s"
+
+# "-" outside of a request (startup, background tasks without their own ID)
+trace_id: ContextVar[str] = ContextVar("trace_id", default="-")
+
+_previous_factory = logging.getLogRecordFactory()
+
+def _record_factory(*args, **kwargs):
+    record = _previous_factory(*args, **kwargs)
+    record.trace_id = trace_id.get()
+    return record
+
+# Every log record carries %(trace_id)s, whichever logger or handler emits it
+logging.setLogRecordFactory(_record_factory)
+
+def _valid_trace_id(value: str) -> bool:
+    return 0 < len(value) <= 64 and value.replace("-", "").replace("_", "").isalnum()
+
+class RequestTracingMiddleware:
+    """Pure ASGI middleware: sets the trace ID for the request and records HTTP metrics.
+
+    The trace ID comes from the caller's X-Request-ID header when it looks
+    sane, otherwise a new one is generated; it is echoed in the response.
+    Routes are labelled by their path template so IDs in URLs do not
+    create new series.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._route_paths = None
+
+    def _route_label(self, scope) -> str:
+        if self._route_paths is None:
+            routes = getattr(scope.get("app"), "routes", None) or []
+            self._route_paths = {
+                # Mounts (static files) are matched by their app rather than an endpoint
+                getattr(route, "endpoint", None) or getattr(route, "app", None): route.path
+                for route in routes if hasattr(route, "path")
+            }
+        return self._route_paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        incoming = next((value.decode("latin-1") for name, value in scope["headers"] if name == b"x-request-id"), "")
+        request_trace_id = incoming if _valid_trace_id(incoming) else uuid.uuid4().hex
+        token = trace_id.set(request_trace_id)
+        status = 500
+
+        async def send_with_trace_id(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message["headers"] = [*message.get("headers", ()), (TRACE_HEADER.encode(), request_trace_id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        metrics.http_in_flight.inc()
+        try:
+            await self.app(scope, receive, send_with_trace_id)
+        finally:
+            metrics.http_in_flight.dec()
+            route = self._route_label(scope)
+            metrics.http_requests.inc(scope["method"], route, str(status))
+            metrics.http_request_duration.observe(scope["method"], route, value=time.perf_counter() - started)
+            trace_id.reset(token)
@@ -1,74 +1,301 @@
-from supabase import create_client, Client
-import os
+import asyncio
+import logging
+import json
+import time
+import httpx
+from openrouter_client import get_openrouter_client
+from openrouter_keys import OpenRouterKeyPool, openrouter_key_pool, is_retryable_status, parse_retry_after
+from supabase_pool import get_supabase_pool, execute
+from cache import TTLCache, MISSING
+import config
+import invalidation
+from api_config import get_api_config
+from write_behind import quiz_writer, usage_log_writer
+from quiz_storage import quiz_content_store, compact_enabled
+import metrics
 
-def get_supabase_client() -> Client:
-    url: str = os.environ.get("SUPABASE_URL")
-    key: str = os.environ.get("SUPABASE_KEY")
-    return create_client(url, key)
+logger = logging.getLogger(__name__)
+
+API_KEYS_CHANNEL = "api_keys"
+
+# user_api_key -> {'user_type', 'status'} row, or None for unknown keys
+api_key_cache = TTLCache(maxsize=config.API_KEY_CACHE_SIZE, ttl=config.API_KEY_CACHE_TTL)
+metrics.watch_cache("api_key", api_key_cache.stats)
+
+def _drop_cached_api_key(api_key):
+    if api_key is None:
+        api_key_cache.clear()
+    else:
+        api_key_cache.delete(api_key)
+
+invalidation.subscribe(API_KEYS_CHANNEL, _drop_cached_api_key)
+
+async def invalidate_api_key(api_key: str = None):
+    # Drop one key (or all keys when None) from the cache in every worker
+    await invalidation.publish(API_KEYS_CHANNEL, api_key)
 
 async def verify_api_key(api_key: str):
-    supabase: Client = get_supabase_client()
-    # Query the 'user_api_keys' table
-    response = supabase.table('user_api_keys').select('user_type, status').eq('user_api_key', api_key).execute()
+    user_data = api_key_cache.get(api_key)
+    if user_data is MISSING:
+        async with get_supabase_pool().connection() as supabase:
+            # Query the 'user_api_keys' table
+            response = await execute(supabase.table('user_api_keys').select('user_type, status').eq('user_api_key', api_key))
+        if response.data:
+            user_data = response.data[0]
+            api_key_cache.set(api_key, user_data)
+        else:
+            user_data = None
+            api_key_cache.set(api_key, None, ttl=config.API_KEY_CACHE_NEGATIVE_TTL)
 
-    if not response.data:
+    if user_data is None:
         return None # API key not found
 
-    user_data = response.data[0]
     if user_data['status'] == 'inactive':
         return 'inactive' # API key is inactive
 
     return user_data['user_type'] # Return user type (free, silver, gold)
 
 async def fetch_api_config():
-    supabase: Client = get_supabase_client()
-    # Query the 'models' table for the default model
-    model_response = supabase.table('models').select('model_name').eq('is_default', True).single().execute()
-    model = model_response.data['model_name'] if model_response.data else 'gpt-3.5-turbo' # Default model if none found
-
-    # Query the 'openrouter_api_keys' table for the default API key
-    api_key_response = supabase.table('openrouter_api_keys').select('api_key').eq('is_default', True).limit(1).execute()
-    openrouter_api_key = api_key_response.data[0]['api_key'] if api_key_response.data else None
-
-    if not openrouter_api_key:
-        print("No default OpenRouter API key found in database.")
-        # In a real application, you'd raise an error or handle this appropriately
-        # For now, returning None will cause the API call to fail gracefully
-        pass
-
-    return model, openrouter_api_key
-
-async def save_generated_quiz(user_api_key: str, quiz_content: dict):
-    supabase: Client = get_supabase_client()
-    # Insert the generated quiz into the 'generated_quizzes' table
-    data, count = supabase.table('generated_quizzes').insert({
+    # Read the in-memory snapshot kept fresh by api_config (no I/O per request)
+    snapshot = await get_api_config()
+    return snapshot.model, snapshot.openrouter_api_key
+
+def build_quiz_record(user_api_key: str, quiz_content: dict, prompt_hash: str = None, model: str = None) -> dict:
+    record = {
         'user_api_key': user_api_key,
         'quiz_content': quiz_content
-    }).execute()
+    }
+    if config.QUIZ_CACHE_PERSISTENT:
+        record['prompt_hash'] = prompt_hash
+        record['model_name'] = model
+    return record
+
+def _compact(records: list) -> list:
+    # Compact storage: rows keep the content's hash and carry the 'quiz_contents' row for it,
+    # which is written just before them, in the same flush (see QuizContentStore.write_blobs)
+    if not compact_enabled():
+        return records
+    return quiz_content_store.compact(records)
+
+async def _insert_quizzes(supabase, records: list):
+    records = await quiz_content_store.write_blobs(supabase, records)
+    return await execute(supabase.table('generated_quizzes').insert(records))
+
+async def save_generated_quiz(user_api_key: str, quiz_content: dict, prompt_hash: str = None, model: str = None):
+    record = _compact([build_quiz_record(user_api_key, quiz_content, prompt_hash, model)])[0]
+    # Queued for a background bulk insert when the write-behind buffer is running
+    if quiz_writer.running:
+        quiz_writer.enqueue(record)
+        return
+    async with get_supabase_pool().connection() as supabase:
+        # Insert the generated quiz into the 'generated_quizzes' table
+        data, count = await _insert_quizzes(supabase, [record])
     if count is None:
-        print(f"Error saving quiz for user {user_api_key}")
+        logger.error(f"Error saving quiz for user {user_api_key}")
 
-import requests
+async def save_generated_quizzes(records: list):
+    # Insert many 'generated_quizzes' rows (see build_quiz_record) in one request
+    if not records:
+        return
+    records = _compact(records)
+    if quiz_writer.running:
+        for record in records:
+            quiz_writer.enqueue(record)
+        return
+    async with get_supabase_pool().connection() as supabase:
+        await _insert_quizzes(supabase, records)
 
-async def call_openrouter_api(prompt: str, model: str, api_key: str):
-    if not api_key:
-        print("OpenRouter API key is missing.")
-        return None # Or raise an exception
+async def record_usage(user_api_key: str, user_type: str, endpoint: str, status: str, latency_ms: float,
+                       model: str = None, usage: dict = None, cached: bool = False):
+    # One 'usage_logs' row per quiz request; never fails the request itself
+    if not config.USAGE_LOGS_ENABLED:
+        return
+    usage = usage or {}
+    row = {
+        'user_api_key': user_api_key,
+        'user_type': user_type,
+        'endpoint': endpoint,
+        'status': status,
+        'model_name': model,
+        'cached': cached,
+        'prompt_tokens': usage.get('prompt_tokens', 0),
+        'completion_tokens': usage.get('completion_tokens', 0),
+        'total_tokens': usage.get('total_tokens', 0),
+        'latency_ms': round(latency_ms, 2)
+    }
+    if usage_log_writer.running:
+        usage_log_writer.enqueue(row)
+        return
+    try:
+        async with get_supabase_pool().connection() as supabase:
+            await execute(supabase.table('usage_logs').insert(row))
+    except Exception as e:
+        logger.error(f"Error writing usage log for user {user_api_key}: {e}")
+
+def _key_pool(api_key: str = None) -> OpenRouterKeyPool:
+    # The shared pool once the config snapshot is loaded; otherwise just the given key
+    if len(openrouter_key_pool):
+        return openrouter_key_pool
+    pool = OpenRouterKeyPool(config.OPENROUTER_KEY_STRATEGY)
+    if api_key:
+        pool.update([{'api_key': api_key, 'is_default': True}])
+    return pool
 
-    url = "https://openrouter.ai/api/v1/chat/completions"
-    headers = {
+def _openrouter_headers(api_key: str) -> dict:
+    return {
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     }
+
+async def call_openrouter_api(prompt: str, model: str, api_key: str = None, json_mode: bool = False):
+    """Post a chat completion and return the JSON response, or None on failure.
+
+    The key is picked from the OpenRouter key pool; when a key is rate
+    limited, rejected or the upstream fails, the call is retried on another
+    key (up to OPENROUTER_KEY_MAX_ATTEMPTS keys). `api_key` is only used when
+    the pool has no keys loaded. `json_mode` asks for a bare JSON object
+    (`response_format`); providers without it ignore the hint.
+    """
+    pool = _key_pool(api_key)
+    if not len(pool):
+        logger.error("OpenRouter API key is missing.")
+        return None # Or raise an exception
+
+    client = get_openrouter_client()
     data = {
         "model": model,
         "messages": [{"role": "user", "content": prompt}]
     }
+    if json_mode:
+        data["response_format"] = {"type": "json_object"}
 
-    try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        print(f"Error calling OpenRouter API: {e}")
-        return None # Or raise an exception
\ No newline at end of file
+    tried = set()
+    for _ in range(config.OPENROUTER_KEY_MAX_ATTEMPTS):
+        key = pool.acquire(exclude=tried)
+        if key is None:
+            break
+        tried.add(key.api_key)
+        started = time.perf_counter()
+        try:
+            response = await client.post("/chat/completions", headers=_openrouter_headers(key.api_key), json=data)
+            if response.status_code < 400:
+                result = response.json()
+                elapsed = time.perf_counter() - started
+                pool.release_success(key, elapsed * 1000)
+                metrics.stage_duration.observe("openrouter_call", value=elapsed)
+                metrics.record_openrouter_call(model, "success", result.get("usage"))
+                return result
+        except asyncio.CancelledError:
+            pool.release_neutral(key)
+            raise
+        except (httpx.HTTPError, ValueError) as e:
+            pool.release_failure(key, None, str(e))
+            metrics.record_openrouter_call(model, "network_error")
+            logger.warning(f"Error calling OpenRouter API: {e}")
+            continue
+
+        error = f"HTTP {response.status_code}"
+        metrics.record_openrouter_call(model, str(response.status_code))
+        logger.warning(f"Error calling OpenRouter API: {error} (key ...{key.api_key[-4:]})")
+        if not is_retryable_status(response.status_code):
+            # The request itself was rejected; another key would not help
+            pool.release_neutral(key)
+            return None
+        pool.release_failure(key, response.status_code, error, parse_retry_after(response.headers.get("retry-after")))
+
+    logger.error("OpenRouter API call failed on every available key.")
+    return None # Or raise an exception
+
+class OpenRouterStreamError(Exception):
+    pass
+
+async def stream_openrouter_api(prompt: str, model: str, api_key: str = None, json_mode: bool = False):
+    """Yield content deltas of a streamed chat completion.
+
+    Unlike call_openrouter_api, failures raise (httpx.HTTPError or
+    OpenRouterStreamError) so the caller can report them mid-stream. Keys
+    fail over as in call_openrouter_api, but only until the first delta has
+    been yielded.
+    """
+    pool = _key_pool(api_key)
+    if not len(pool):
+        raise OpenRouterStreamError("OpenRouter API key is missing.")
+
+    client = get_openrouter_client()
+    data = {
+        "model": model,
+        "messages": [{"role": "user", "content": prompt}],
+        "stream": True
+    }
+    if json_mode:
+        data["response_format"] = {"type": "json_object"}
+
+    tried = set()
+    last_error = None
+    for _ in range(config.OPENROUTER_KEY_MAX_ATTEMPTS):
+        key = pool.acquire(exclude=tried)
+        if key is None:
+            break
+        tried.add(key.api_key)
+        started = time.perf_counter()
+        try:
+            request = client.build_request("POST", "/chat/completions", headers=_openrouter_headers(key.api_key), json=data)
+            response = await client.send(request, stream=True)
+        except asyncio.CancelledError:
+            pool.release_neutral(key)
+            raise
+        except httpx.HTTPError as e:
+            pool.release_failure(key, None, str(e))
+            metrics.record_openrouter_call(model, "network_error")
+            last_error = e
+            continue
+
+        if response.status_code >= 400:
+            await response.aclose()
+            error = f"HTTP {response.status_code}"
+            metrics.record_openrouter_call(model, str(response.status_code))
+            if not is_retryable_status(response.status_code):
+                pool.release_neutral(key)
+                raise OpenRouterStreamError(f"OpenRouter rejected the request ({error})")
+            pool.release_failure(key, response.status_code, error, parse_retry_after(response.headers.get("retry-after")))
+            last_error = OpenRouterStreamError(f"OpenRouter request failed ({error})")
+            continue
+
+        released = False
+        usage = None
+        try:
+            async for line in response.aiter_lines():
+                # Server-sent events; lines starting with ':' are keep-alive comments
+                if not line.startswith("data:"):
+                    continue
+                payload = line[5:].strip()
+                if payload == "[DONE]":
+                    break
+                chunk = json.loads(payload)
+                if chunk.get("error"):
+                    raise OpenRouterStreamError(str(chunk["error"]))
+                # The final chunk carries the token counts
+                usage = chunk.get("usage") or usage
+                choices = chunk.get("choices") or []
+                if choices:
+                    delta = (choices[0].get("delta") or {}).get("content")
+                    if delta:
+                        yield delta
+            elapsed = time.perf_counter() - started
+            pool.release_success(key, elapsed * 1000)
+            metrics.stage_duration.observe("openrouter_stream", value=elapsed)
+            metrics.record_openrouter_call(model, "success", usage)
+            released = True
+        except (httpx.HTTPError, OpenRouterStreamError, ValueError) as e:
+            pool.release_failure(key, None, str(e))
+            metrics.record_openrouter_call(model, "stream_error")
+            released = True
+            raise
+        finally:
+            if not released:
+                # Cancelled or the consumer stopped iterating early
+                pool.release_neutral(key)
+            await response.aclose()
+        return
+
+    raise last_error or OpenRouterStreamError("No OpenRouter API key available.")
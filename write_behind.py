@@ -0,0 +1,208 @@
+# Write-behind buffers for Supabase inserts off the request path
+import asyncio
+import logging
+from collections import deque
+from typing import Awaitable, Callable, List, Optional
+import httpx
+from postgrest.exceptions import APIError
+from quiz_storage import quiz_content_store
+from supabase_pool import get_supabase_pool, execute
+import config
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# SQLSTATE classes of a database that is unavailable or overloaded rather than of a bad row:
+# connection exception, transaction rollback, insufficient resources, operator intervention
+_TRANSIENT_SQLSTATE_CLASSES = ("08", "40", "53", "57")
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed insert may succeed later unchanged (outage, timeout, 5xx)."""
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, APIError):
+        code = str(error.code or "")
+        if code.isdigit() and len(code) == 3:
+            # No PostgREST error body: the HTTP status of a proxy or gateway
+            return int(code) >= 500 or code == "429"
+        # PGRST000-PGRST003: PostgREST cannot reach or use the database
+        return code[:6] == "PGRST0" or code[:2] in _TRANSIENT_SQLSTATE_CLASSES
+    return False
+
+class WriteBehindBuffer:
+    """Queue rows for one table and insert them in bulk in the background.
+
+    A flush happens when `max_batch` rows are waiting or every
+    `flush_interval` seconds. A batch that fails because the database is
+    unreachable (see is_transient) is retried with backoff up to
+    `max_retries` times, then goes back to the front of the queue for the
+    next flush, so an outage delays rows instead of losing them. Any other
+    failure means a bad row: the batch is inserted one row at a time and
+    the rows that still fail are dropped (and logged). When the queue is
+    full the oldest rows are dropped (and logged). With `upsert_on`, rows that already exist (by that
+    conflict column) are skipped instead of failing the batch. `prepare(client, rows)` runs on the
+    insert's connection just before it and returns the rows to insert (e.g. after writing the rows
+    they reference).
+    """
+
+    def __init__(self, table: str, max_batch: int, flush_interval: float, max_queue: int, max_retries: int,
+                 upsert_on: Optional[str] = None,
+                 prepare: Optional[Callable[[object, List[dict]], Awaitable[List[dict]]]] = None):
+        self.table = table
+        self.upsert_on = upsert_on
+        self.prepare = prepare
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self._queue: deque = deque()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Metrics
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed_flushes = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def enqueue(self, record: dict):
+        if len(self._queue) >= self.max_queue:
+            self._queue.popleft()
+            self.dropped += 1
+            logger.error(f"Write-behind queue for {self.table} is full; dropped oldest row")
+        self._queue.append(record)
+        self.enqueued += 1
+        if len(self._queue) >= self.max_batch:
+            self._wakeup.set()
+
+    async def _insert(self, rows: List[dict]):
+        async with get_supabase_pool().connection() as supabase:
+            if self.prepare is not None:
+                rows = await self.prepare(supabase, rows)
+            if self.upsert_on:
+                await execute(supabase.table(self.table).upsert(rows, ignore_duplicates=True, on_conflict=self.upsert_on))
+            else:
+                await execute(supabase.table(self.table).insert(rows))
+
+    def _requeue(self, rows: List[dict]):
+        self._queue.extendleft(reversed(rows))
+        overflow = len(self._queue) - self.max_queue
+        if overflow > 0:
+            for _ in range(overflow):
+                self._queue.popleft()
+            self.dropped += overflow
+            logger.error(f"Write-behind queue for {self.table} is full; dropped {overflow} oldest rows")
+
+    async def _write(self, rows: List[dict]) -> bool:
+        """Insert `rows`; False if the database is unreachable and they went back on the queue."""
+        delay = 0.5
+        for attempt in range(1, self.max_retries + 1):
+            try:
+                await self._insert(rows)
+                self.written += len(rows)
+                return True
+            except Exception as e:
+                self.failed_flushes += 1
+                logger.error(f"Bulk insert of {len(rows)} rows into {self.table} failed (attempt {attempt}): {str(e)}")
+                if not is_transient(e):
+                    break
+                if attempt < self.max_retries:
+                    await asyncio.sleep(delay)
+                    delay = min(delay * 2, 30.0)
+        else:
+            self._requeue(rows)
+            return False
+        # Isolate bad rows so the good ones still land
+        for i, row in enumerate(rows):
+            try:
+                await self._insert([row])
+                self.written += 1
+            except Exception as e:
+                if is_transient(e):
+                    self._requeue(rows[i:])
+                    return False
+                self.dropped += 1
+                logger.error(f"Dropping row for {self.table}: {str(e)}")
+        return True
+
+    async def flush(self) -> bool:
+        """Write everything queued; False if the database is unreachable (the rest stays queued)."""
+        while self._queue:
+            rows = [self._queue.popleft() for _ in range(min(self.max_batch, len(self._queue)))]
+            if not await self._write(rows):
+                return False
+        return True
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not await self.flush() and not self._stopping:
+                # A full queue keeps the wakeup set; wait out the interval during an outage
+                await asyncio.sleep(self.flush_interval)
+        # Drain on stop, including a stop that comes before the first iteration
+        await self.flush()
+        if self._queue:
+            logger.error(f"Stopped with {len(self._queue)} rows for {self.table} not written")
+
+    def start(self):
+        if self._task is None:
+            self._stopping = False
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, timeout: float):
+        # Let the loop finish its current flush and drain whatever is still queued
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(f"Timed out draining {len(self._queue)} rows for {self.table}")
+            self._task.cancel()
+        self._task = None
+
+    def stats(self) -> dict:
+        return {
+            "queued": len(self._queue),
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed_flushes": self.failed_flushes,
+        }
+
+def _buffer(table: str, upsert_on: Optional[str] = None, prepare=None) -> WriteBehindBuffer:
+    return WriteBehindBuffer(
+        table,
+        max_batch=config.WRITE_BEHIND_BATCH_SIZE,
+        flush_interval=config.WRITE_BEHIND_FLUSH_INTERVAL,
+        max_queue=config.WRITE_BEHIND_MAX_QUEUE,
+        max_retries=config.WRITE_BEHIND_MAX_RETRIES,
+        upsert_on=upsert_on,
+        prepare=prepare,
+    )
+
+# With QUIZ_STORAGE=compact the rows carry their quiz_contents rows, written first in the same flush
+quiz_writer = _buffer('generated_quizzes', prepare=quiz_content_store.write_blobs)
+usage_log_writer = _buffer('usage_logs')
+for _writer in (quiz_writer, usage_log_writer):
+    metrics.watch_in_flight(f"write_behind_queued.{_writer.table}", lambda writer=_writer: len(writer._queue))
+
+def start_writers():
+    if config.WRITE_BEHIND_ENABLED:
+        quiz_writer.start()
+        usage_log_writer.start()
+
+async def stop_writers():
+    await asyncio.gather(
+        quiz_writer.stop(config.WRITE_BEHIND_DRAIN_TIMEOUT),
+        usage_log_writer.stop(config.WRITE_BEHIND_DRAIN_TIMEOUT),
+    )